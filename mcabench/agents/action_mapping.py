@@ -10,7 +10,9 @@ import numpy as np
 import copy
 import pickle
 import json
+import threading
 from collections import OrderedDict
+from functools import lru_cache
 from typing import Union, List, Dict
 import torch
 from tqdm import tqdm
@@ -23,6 +25,154 @@ from minestudio.utils.vpt_lib.action_mapping import CameraHierarchicalMapping
 from minestudio.simulator.entry import CameraConfig
 
 
+# Special tokens of every action group, indexed as [group][num] -> [token text, token id]
+QWEN2_VL_CONTROL_TOKENS = [
+    # Group 1: hotbar
+    [["<|reserved_special_token_180|>", 151837],
+     ["<|reserved_special_token_181|>", 151838],
+     ["<|reserved_special_token_182|>", 151839],
+     ["<|reserved_special_token_183|>", 151840],
+     ["<|reserved_special_token_184|>", 151841],
+     ["<|reserved_special_token_185|>", 151842],
+     ["<|reserved_special_token_186|>", 151843],
+     ["<|reserved_special_token_187|>", 151844],
+     ["<|reserved_special_token_188|>", 151845],
+     ["<|reserved_special_token_189|>", 151846]],
+    # Group 2: 3 tokens "forward", "back”
+    [["<|reserved_special_token_190|>", 151847],
+     ["<|reserved_special_token_191|>", 151848],
+     ["<|reserved_special_token_192|>", 151849]],
+    # Group 3: 3 tokens "left", "right"
+    [["<|reserved_special_token_193|>", 151850],
+     ["<|reserved_special_token_194|>", 151851],
+     ["<|reserved_special_token_195|>", 151852]],
+    # Group 4: 3 tokens, "sprint" "sneak"
+    [["<|reserved_special_token_196|>", 151853],
+     ["<|reserved_special_token_197|>", 151854],
+     ["<|reserved_special_token_198|>", 151855]],
+    # Group 5: 2 tokens, representing "use"
+    [["<|reserved_special_token_199|>", 151856],
+     ["<|reserved_special_token_200|>", 151857]],
+    # Group 6: 2 tokens, representing "drop"
+    [["<|reserved_special_token_201|>", 151858],
+     ["<|reserved_special_token_202|>", 151859]],
+    # Group 7: 2 tokens, representing "attack"
+    [["<|reserved_special_token_203|>", 151860],
+     ["<|reserved_special_token_204|>", 151861]],
+    # Group 8: 2 tokens, representing "jump"
+    [["<|reserved_special_token_205|>", 151862],
+     ["<|reserved_special_token_206|>", 151863]],
+    # Group 9: 2 tokens, representing "camera"
+    [["<|reserved_special_token_207|>", 151864],
+     ["<|reserved_special_token_208|>", 151865]],
+    # Group 10: 2 tokens, representing "inventory"
+    [["<|reserved_special_token_176|>", 151833],
+     ["<|reserved_special_token_177|>", 151834]],
+    # Group 11: camera
+    [["<|reserved_special_token_209|>", 151866],
+     ["<|reserved_special_token_210|>", 151867],
+     ["<|reserved_special_token_211|>", 151868],
+     ["<|reserved_special_token_212|>", 151869],
+     ["<|reserved_special_token_213|>", 151870],
+     ["<|reserved_special_token_214|>", 151871],
+     ["<|reserved_special_token_215|>", 151872],
+     ["<|reserved_special_token_216|>", 151873],
+     ["<|reserved_special_token_217|>", 151874],
+     ["<|reserved_special_token_218|>", 151875],
+     ["<|reserved_special_token_219|>", 151876],
+     ["<|reserved_special_token_220|>", 151877],
+     ["<|reserved_special_token_221|>", 151878],
+     ["<|reserved_special_token_222|>", 151879],
+     ["<|reserved_special_token_223|>", 151880],
+     ["<|reserved_special_token_224|>", 151881],
+     ["<|reserved_special_token_225|>", 151882],
+     ["<|reserved_special_token_226|>", 151883],
+     ["<|reserved_special_token_227|>", 151884],
+     ["<|reserved_special_token_228|>", 151885],
+     ["<|reserved_special_token_229|>", 151886]],
+    # Group 12: camera
+    [["<|reserved_special_token_230|>", 151887],
+     ["<|reserved_special_token_231|>", 151888],
+     ["<|reserved_special_token_232|>", 151889],
+     ["<|reserved_special_token_233|>", 151890],
+     ["<|reserved_special_token_234|>", 151891],
+     ["<|reserved_special_token_235|>", 151892],
+     ["<|reserved_special_token_236|>", 151893],
+     ["<|reserved_special_token_237|>", 151894],
+     ["<|reserved_special_token_238|>", 151895],
+     ["<|reserved_special_token_239|>", 151896],
+     ["<|reserved_special_token_240|>", 151897],
+     ["<|reserved_special_token_241|>", 151898],
+     ["<|reserved_special_token_242|>", 151899],
+     ["<|reserved_special_token_243|>", 151900],
+     ["<|reserved_special_token_244|>", 151901],
+     ["<|reserved_special_token_245|>", 151902],
+     ["<|reserved_special_token_246|>", 151903],
+     ["<|reserved_special_token_247|>", 151904],
+     ["<|reserved_special_token_248|>", 151905],
+     ["<|reserved_special_token_249|>", 151906],
+     ["<|reserved_special_token_250|>", 151907]],
+]
+
+CONTROL_TOKENS = {
+    "qwen2_vl": QWEN2_VL_CONTROL_TOKENS,
+}
+
+# token id -> (action group index, number)
+REMAP_CONTROL_TOKENS = {
+    "qwen2_vl": {
+        151837: [0, 0], 151838: [0, 1], 151839: [0, 2], 151840: [0, 3], 151841: [0, 4],
+        151842: [0, 5], 151843: [0, 6], 151844: [0, 7], 151845: [0, 8], 151846: [0, 9],
+        151847: [1, 0], 151848: [1, 1], 151849: [1, 2],
+        151850: [2, 0], 151851: [2, 1], 151852: [2, 2],
+        151853: [3, 0], 151854: [3, 1], 151855: [3, 2],
+        151856: [4, 0], 151857: [4, 1],
+        151858: [5, 0], 151859: [5, 1],
+        151860: [6, 0], 151861: [6, 1],
+        151862: [7, 0], 151863: [7, 1],
+        151864: [8, 0], 151865: [8, 1],
+        151833: (9, 0), 151834: (9, 1),
+        151866: [10, 0], 151867: [10, 1], 151868: [10, 2], 151869: [10, 3], 151870: [10, 4],
+        151871: [10, 5], 151872: [10, 6], 151873: [10, 7], 151874: [10, 8], 151875: [10, 9],
+        151876: [10, 10], 151877: [10, 11], 151878: [10, 12], 151879: [10, 13], 151880: [10, 14],
+        151881: [10, 15], 151882: [10, 16], 151883: [10, 17], 151884: [10, 18], 151885: [10, 19],
+        151886: [10, 20],
+        151887: [11, 0], 151888: [11, 1], 151889: [11, 2], 151890: [11, 3],
+        151891: [11, 4], 151892: [11, 5], 151893: [11, 6], 151894: [11, 7], 151895: [11, 8],
+        151896: [11, 9], 151897: [11, 10], 151898: [11, 11], 151899: [11, 12], 151900: [11, 13],
+        151901: [11, 14], 151902: [11, 15], 151903: [11, 16], 151904: [11, 17], 151905: [11, 18],
+        151906: [11, 19], 151907: [11, 20],
+    },
+    "llama_2": {
+        31536: (0, 0), 31537: (0, 1), 31563: (0, 2), 31571: (0, 3), 31578: (0, 4), 31582: (0, 5), 31585: (0, 6), 31598: (0, 7), 
+        31603: (0, 8), 31604: (0, 9), 31000: (0, 10), 31001: (0, 11), 31002: (0, 12), 31003: (0, 13), 31004: (0, 14), 31005: (0, 15), 
+        31006: (0, 16), 31007: (0, 17), 31008: (0, 18), 31009: (0, 19), 31010: (0, 20), 31011: (0, 21), 31012: (0, 22), 31013: (0, 23), 
+        31014: (0, 24), 31015: (0, 25), 31016: (0, 26), 31017: (0, 27), 31018: (0, 28), 31019: (0, 29), 31020: (0, 30), 31021: (0, 31), 31022: (0, 32), 31023: (0, 33), 31024: (0, 34), 31025: (0, 35), 31026: (0, 36), 31027: (0, 37), 
+        31028: (0, 38), 31029: (0, 39), 31030: (0, 40), 31031: (0, 41), 31032: (0, 42), 31033: (0, 43), 31034: (0, 44), 31035: (0, 45), 31036: (0, 46), 31037: (0, 47), 31038: (0, 48), 31039: (0, 49), 31040: (0, 50), 31041: (0, 51), 
+        31042: (0, 52), 31043: (0, 53), 31044: (0, 54), 31045: (0, 55), 31046: (0, 56), 31047: (0, 57), 31048: (0, 58), 31049: (0, 59), 31050: (0, 60), 31051: (0, 61), 31052: (0, 62), 31053: (0, 63), 31054: (0, 64), 31055: (0, 65), 
+        31056: (0, 66), 31057: (0, 67), 31058: (0, 68), 31059: (0, 69), 31060: (0, 70), 31061: (0, 71), 31062: (0, 72), 31063: (0, 73), 31064: (0, 74), 31065: (0, 75), 31066: (0, 76), 31067: (0, 77), 31068: (0, 78), 31069: (0, 79), 
+        31070: (0, 80), 31071: (0, 81), 31072: (0, 82), 31073: (0, 83), 31074: (0, 84), 31075: (0, 85), 31076: (0, 86), 31077: (0, 87), 31078: (0, 88), 31079: (0, 89), 31080: (0, 90), 31081: (0, 91), 31082: (0, 92), 31083: (0, 93), 
+        31084: (0, 94), 31085: (0, 95), 31086: (0, 96), 31087: (0, 97), 31088: (0, 98), 31089: (0, 99), 31090: (0, 100), 31091: (0, 101), 31092: (0, 102), 31093: (0, 103), 31094: (0, 104), 31095: (0, 105), 31096: (0, 106), 31097: (0, 107), 
+        31098: (0, 108), 31099: (0, 109), 31100: (0, 110), 31101: (0, 111), 31102: (0, 112), 31103: (0, 113), 31104: (0, 114), 31105: (0, 115), 31106: (0, 116), 31107: (0, 117), 31108: (0, 118), 31109: (0, 119), 31110: (0, 120), 31111: (0, 121), 
+        31112: (0, 122), 31113: (0, 123), 31114: (0, 124), 31115: (0, 125), 31116: (0, 126), 31117: (0, 127), 31118: (0, 128), 31119: (0, 129), 31120: (0, 130), 31121: (0, 131), 31122: (0, 132), 31123: (0, 133), 31124: (0, 134), 31125: (0, 135), 31126: (0, 136), 31127: (0, 137), 31128: (0, 138), 31129: (0, 139), 31130: (0, 140), 31131: (0, 141), 31132: (0, 142), 31133: (0, 143), 31134: (0, 144), 31135: (0, 145), 31136: (0, 146), 31137: (0, 147), 31138: (0, 148), 31139: (0, 149), 
+        31140: (0, 150), 31141: (0, 151), 31142: (0, 152), 31143: (0, 153), 31144: (0, 154), 31145: (0, 155), 31146: (0, 156), 31147: (0, 157), 31148: (0, 158), 31149: (0, 159), 31150: (0, 160), 31151: (0, 161), 31152: (0, 162), 31153: (0, 163), 31154: (0, 164), 31155: (0, 165), 31156: (0, 166), 31157: (0, 167), 31158: (0, 168), 31159: (0, 169), 31160: (0, 170), 31161: (0, 171), 31162: (0, 172), 31163: (0, 173), 31164: (0, 174), 31165: (0, 175), 31166: (0, 176), 31167: (0, 177), 31168: (0, 178), 
+        31169: (0, 179), 31170: (0, 180), 31171: (0, 181), 31172: (0, 182), 31173: (0, 183), 31174: (0, 184), 31175: (0, 185), 31176: (0, 186), 31177: (0, 187), 31178: (0, 188), 31179: (0, 189), 31180: (0, 190), 31181: (0, 191), 31182: (0, 192), 31183: (0, 193), 31184: (0, 194), 31185: (0, 195), 31186: (0, 196), 31187: (0, 197), 31188: (0, 198), 31189: (0, 199), 31190: (0, 200), 31191: (0, 201), 31192: (0, 202), 31193: (0, 203), 31195: (0, 204), 31196: (0, 205), 31197: (0, 206), 31198: (0, 207), 
+        31199: (0, 208), 31200: (0, 209), 31201: (0, 210), 31202: (0, 211), 31203: (0, 212), 31204: (0, 213), 31205: (0, 214), 31206: (0, 215), 31207: (0, 216), 31208: (0, 217), 31209: (0, 218), 31210: (0, 219), 31211: (0, 220), 31212: (0, 221), 31213: (0, 222), 31214: (0, 223), 31215: (0, 224), 31216: (0, 225), 31217: (0, 226), 31218: (0, 227), 31219: (0, 228), 31220: (0, 229), 31221: (0, 230), 31222: (0, 231), 31223: (0, 232), 31224: (0, 233), 31225: (0, 234), 31226: (0, 235), 31227: (0, 236), 
+        31228: (0, 237), 31229: (0, 238), 31230: (0, 239), 31231: (0, 240), 31232: (0, 241), 31233: (0, 242), 31234: (0, 243), 31235: (0, 244), 31236: (0, 245), 31237: (0, 246), 31238: (0, 247), 31239: (0, 248), 31240: (0, 249), 31241: (0, 250), 31243: (0, 251), 31244: (0, 252), 31245: (0, 253), 31246: (0, 254), 31247: (0, 255), 31248: (0, 256), 31249: (0, 257), 31250: (0, 258), 31251: (0, 259), 31252: (0, 260), 31253: (0, 261), 31254: (0, 262), 31255: (0, 263), 31256: (0, 264), 31257: (0, 265), 
+        31258: (0, 266), 31259: (0, 267), 31260: (0, 268), 31261: (0, 269), 31262: (0, 270), 31263: (0, 271), 31264: (0, 272), 31265: (0, 273), 31266: (0, 274), 31267: (0, 275), 31268: (0, 276), 31269: (0, 277), 31270: (0, 278), 31271: (0, 279), 31272: (0, 280), 31273: (0, 281), 31274: (0, 282), 31275: (0, 283), 31276: (0, 284), 31277: (0, 285), 31278: (0, 286), 31279: (0, 287), 31280: (0, 288), 31281: (0, 289), 31282: (0, 290), 31283: (0, 291), 31284: (0, 292), 31285: (0, 293), 31286: (0, 294), 
+        31287: (0, 295), 31288: (0, 296), 31289: (0, 297), 31290: (0, 298), 31291: (0, 299), 31292: (0, 300), 31293: (0, 301), 31294: (0, 302), 31295: (0, 303), 31296: (0, 304), 31297: (0, 305), 31298: (0, 306), 31299: (0, 307), 31300: (0, 308), 31301: (0, 309), 31302: (0, 310), 31303: (0, 311), 31304: (0, 312), 31305: (0, 313), 31306: (0, 314), 31307: (0, 315), 31308: (0, 316), 31309: (0, 317), 31310: (0, 318), 31311: (0, 319), 31312: (0, 320), 31313: (0, 321), 31314: (0, 322), 31315: (0, 323), 
+        31316: (0, 324), 31317: (0, 325), 31318: (0, 326), 31319: (0, 327), 31320: (0, 328), 31321: (0, 329), 31322: (0, 330), 31323: (0, 331), 31324: (0, 332), 31325: (0, 333), 31326: (0, 334), 31327: (0, 335), 31328: (0, 336), 31329: (0, 337), 31330: (0, 338), 31331: (0, 339), 31332: (0, 340), 
+        31333: (0, 341), 31334: (0, 342), 31335: (0, 343), 31336: (0, 344), 31337: (0, 345), 31338: (0, 346), 31339: (0, 347), 31340: (0, 348), 31341: (0, 349), 31342: (0, 350), 31343: (0, 351), 31344: (0, 352), 31345: (0, 353), 31346: (0, 354), 31347: (0, 355), 31348: (0, 356), 31349: (0, 357), 31350: (0, 358), 31351: (0, 359), 31352: (0, 360), 31353: (0, 361), 31354: (0, 362), 31355: (0, 363), 31356: (0, 364), 31357: (0, 365), 31358: (0, 366), 31359: (0, 367), 31360: (0, 368), 31361: (0, 369), 
+        31362: (0, 370), 31363: (0, 371), 31364: (0, 372), 31365: (0, 373), 31366: (0, 374), 31367: (0, 375), 31368: (0, 376), 31369: (0, 377), 31370: (0, 378), 31371: (0, 379), 31372: (0, 380), 31373: (0, 381), 31374: (0, 382), 31375: (0, 383), 31376: (0, 384), 31377: (0, 385), 31378: (0, 386), 
+        31380: (0, 387), 31381: (0, 388), 31382: (0, 389), 31383: (0, 390), 31384: (0, 391), 31385: (0, 392), 31386: (0, 393), 31387: (0, 394), 31388: (0, 395), 31389: (0, 396), 31390: (0, 397), 31391: (0, 398), 31392: (0, 399), 31393: (0, 400), 31394: (0, 401), 31395: (0, 402), 31396: (0, 403), 31397: (0, 404), 31398: (0, 405), 31399: (0, 406), 31400: (0, 407), 31401: (0, 408), 31402: (0, 409), 31403: (0, 410), 31404: (0, 411), 
+        31405: (0, 412), 31406: (0, 413), 31407: (0, 414), 31408: (0, 415), 31409: (0, 416), 31410: (0, 417), 31411: (0, 418), 31412: (0, 419), 31413: (0, 420), 31414: (0, 421), 31415: (0, 422), 31416: (0, 423), 31417: (0, 424), 31418: (0, 425), 31419: (0, 426), 31420: (0, 427), 31421: (0, 428), 31422: (0, 429), 31423: (0, 430), 31424: (0, 431), 31425: (0, 432), 31426: (0, 433), 31427: (0, 434), 31428: (0, 435), 31429: (0, 436), 31430: (0, 437), 31431: (0, 438), 31432: (0, 439), 31433: (0, 440), 
+        31434: (0, 441), 31435: (0, 442), 31436: (0, 443), 31437: (0, 444), 31438: (0, 445), 31439: (0, 446), 31440: (0, 447), 31441: (0, 448), 31442: (0, 449), 31443: (0, 450), 31444: (0, 451), 31445: (0, 452), 31446: (0, 453), 31447: (0, 454), 31448: (0, 455), 31449: (0, 456), 31450: (0, 457), 
+        31451: (0, 458), 31452: (0, 459), 31453: (0, 460), 31454: (0, 461), 31455: (0, 462), 31456: (0, 463), 31457: (0, 464), 31458: (0, 465), 31459: (0, 466), 31460: (0, 467), 31461: (0, 468), 31462: (0, 469), 31463: (0, 470), 31464: (0, 471), 31465: (0, 472), 31466: (0, 473), 31467: (0, 474), 31468: (0, 475), 31469: (0, 476), 31470: (0, 477), 31471: (0, 478), 31472: (0, 479), 31473: (0, 480), 31474: (0, 481), 31475: (0, 482), 31476: (0, 483), 31477: (0, 484), 31478: (0, 485), 31479: (0, 486), 
+        31480: (0, 487), 31481: (0, 488), 31482: (0, 489), 31483: (0, 490), 31484: (0, 491), 31485: (0, 492), 31486: (0, 493), 31487: (0, 494), 31488: (0, 495), 31489: (0, 496), 31490: (0, 497), 31491: (0, 498), 31492: (0, 499), 31493: (0, 500), 31494: (0, 501), 31495: (0, 502), 31496: (0, 503), 31497: (0, 504), 31498: (0, 505), 31499: (0, 506), 31500: (0, 507), 31501: (0, 508), 31502: (0, 509), 31503: (0, 510), 31504: (0, 511)
+    },
+}
+
+
 def get_special_token(model_id: str, bases: list = [10, 3, 3, 3, 2, 2, 2, 2, 2, 2, 11, 11]) -> list:
     """
     Generate a list of all unknown tokens to mark unknown tokens.
@@ -86,97 +236,9 @@ def map_control_token(num: int, place: int, tokenizer_type: str, not_text: bool
     Raises:
         ValueError: If the specified tokenizer type is not supported.
     """
-    if tokenizer_type == "qwen2_vl":
-        # Define the list of special tokens, organized by action groups and indices
-        special_tokens = [
-            # Group 1: hotbar
-            [["<|reserved_special_token_180|>", 151837],
-             ["<|reserved_special_token_181|>", 151838],
-             ["<|reserved_special_token_182|>", 151839],
-             ["<|reserved_special_token_183|>", 151840],
-             ["<|reserved_special_token_184|>", 151841],
-             ["<|reserved_special_token_185|>", 151842],
-             ["<|reserved_special_token_186|>", 151843],
-             ["<|reserved_special_token_187|>", 151844],
-             ["<|reserved_special_token_188|>", 151845],
-             ["<|reserved_special_token_189|>", 151846]],
-            # Group 2: 3 tokens "forward", "back”
-            [["<|reserved_special_token_190|>", 151847],
-             ["<|reserved_special_token_191|>", 151848],
-             ["<|reserved_special_token_192|>", 151849]],
-            # Group 3: 3 tokens "left", "right"
-            [["<|reserved_special_token_193|>", 151850],
-             ["<|reserved_special_token_194|>", 151851],
-             ["<|reserved_special_token_195|>", 151852]],
-            # Group 4: 3 tokens, "sprint" "sneak"
-            [["<|reserved_special_token_196|>", 151853],
-             ["<|reserved_special_token_197|>", 151854],
-             ["<|reserved_special_token_198|>", 151855]],
-            # Group 5: 2 tokens, representing "use"
-            [["<|reserved_special_token_199|>", 151856],
-             ["<|reserved_special_token_200|>", 151857]],
-            # Group 6: 2 tokens, representing "drop"
-            [["<|reserved_special_token_201|>", 151858],
-             ["<|reserved_special_token_202|>", 151859]],
-            # Group 7: 2 tokens, representing "attack"
-            [["<|reserved_special_token_203|>", 151860],
-             ["<|reserved_special_token_204|>", 151861]],
-            # Group 8: 2 tokens, representing "jump"
-            [["<|reserved_special_token_205|>", 151862],
-             ["<|reserved_special_token_206|>", 151863]],
-            # Group 9: 2 tokens, representing "camera"
-            [["<|reserved_special_token_207|>", 151864],
-             ["<|reserved_special_token_208|>", 151865]],
-            # Group 10: 2 tokens, representing "inventory"
-            [["<|reserved_special_token_176|>", 151833],
-             ["<|reserved_special_token_177|>", 151834]],
-            # Group 11: camera
-            [["<|reserved_special_token_209|>", 151866],
-             ["<|reserved_special_token_210|>", 151867],
-             ["<|reserved_special_token_211|>", 151868],
-             ["<|reserved_special_token_212|>", 151869],
-             ["<|reserved_special_token_213|>", 151870],
-             ["<|reserved_special_token_214|>", 151871],
-             ["<|reserved_special_token_215|>", 151872],
-             ["<|reserved_special_token_216|>", 151873],
-             ["<|reserved_special_token_217|>", 151874],
-             ["<|reserved_special_token_218|>", 151875],
-             ["<|reserved_special_token_219|>", 151876],
-             ["<|reserved_special_token_220|>", 151877],
-             ["<|reserved_special_token_221|>", 151878],
-             ["<|reserved_special_token_222|>", 151879],
-             ["<|reserved_special_token_223|>", 151880],
-             ["<|reserved_special_token_224|>", 151881],
-             ["<|reserved_special_token_225|>", 151882],
-             ["<|reserved_special_token_226|>", 151883],
-             ["<|reserved_special_token_227|>", 151884],
-             ["<|reserved_special_token_228|>", 151885],
-             ["<|reserved_special_token_229|>", 151886]],
-            # Group 12: camera
-            [["<|reserved_special_token_230|>", 151887],
-             ["<|reserved_special_token_231|>", 151888],
-             ["<|reserved_special_token_232|>", 151889],
-             ["<|reserved_special_token_233|>", 151890],
-             ["<|reserved_special_token_234|>", 151891],
-             ["<|reserved_special_token_235|>", 151892],
-             ["<|reserved_special_token_236|>", 151893],
-             ["<|reserved_special_token_237|>", 151894],
-             ["<|reserved_special_token_238|>", 151895],
-             ["<|reserved_special_token_239|>", 151896],
-             ["<|reserved_special_token_240|>", 151897],
-             ["<|reserved_special_token_241|>", 151898],
-             ["<|reserved_special_token_242|>", 151899],
-             ["<|reserved_special_token_243|>", 151900],
-             ["<|reserved_special_token_244|>", 151901],
-             ["<|reserved_special_token_245|>", 151902],
-             ["<|reserved_special_token_246|>", 151903],
-             ["<|reserved_special_token_247|>", 151904],
-             ["<|reserved_special_token_248|>", 151905],
-             ["<|reserved_special_token_249|>", 151906],
-             ["<|reserved_special_token_250|>", 151907]],
-        ]
-    else:
+    if tokenizer_type not in CONTROL_TOKENS:
         raise ValueError(f"The tokenizer type {tokenizer_type} is not supported in control tokens.")
+    special_tokens = CONTROL_TOKENS[tokenizer_type]
     
     try:
         # Return either the text token or numeric identifier based on not_text flag (index 0 or 1)
@@ -198,70 +260,55 @@ def remap_control_token(token: str, use_num: bool = True, tokenizer_type: str =
     Returns:
         tuple: (action group index, number) tuple. Returns (-1, -1) if token not found.
     """
-    re_tokens = {}
-    if tokenizer_type == "qwen2_vl":
-        # Define the mapping dictionary from token to action (when use_num is True)
-        if use_num:
-            re_tokens = {
-                151837: [0, 0], 151838: [0, 1], 151839: [0, 2], 151840: [0, 3], 151841: [0, 4],
-                151842: [0, 5], 151843: [0, 6], 151844: [0, 7], 151845: [0, 8], 151846: [0, 9],
-                151847: [1, 0], 151848: [1, 1], 151849: [1, 2],
-                151850: [2, 0], 151851: [2, 1], 151852: [2, 2],
-                151853: [3, 0], 151854: [3, 1], 151855: [3, 2],
-                151856: [4, 0], 151857: [4, 1],
-                151858: [5, 0], 151859: [5, 1],
-                151860: [6, 0], 151861: [6, 1],
-                151862: [7, 0], 151863: [7, 1],
-                151864: [8, 0], 151865: [8, 1],
-                151833: (9, 0), 151834: (9, 1),
-                151866: [10, 0], 151867: [10, 1], 151868: [10, 2], 151869: [10, 3], 151870: [10, 4],
-                151871: [10, 5], 151872: [10, 6], 151873: [10, 7], 151874: [10, 8], 151875: [10, 9],
-                151876: [10, 10], 151877: [10, 11], 151878: [10, 12], 151879: [10, 13], 151880: [10, 14],
-                151881: [10, 15], 151882: [10, 16], 151883: [10, 17], 151884: [10, 18], 151885: [10, 19],
-                151886: [10, 20],
-                151887: [11, 0], 151888: [11, 1], 151889: [11, 2], 151890: [11, 3],
-                151891: [11, 4], 151892: [11, 5], 151893: [11, 6], 151894: [11, 7], 151895: [11, 8],
-                151896: [11, 9], 151897: [11, 10], 151898: [11, 11], 151899: [11, 12], 151900: [11, 13],
-                151901: [11, 14], 151902: [11, 15], 151903: [11, 16], 151904: [11, 17], 151905: [11, 18],
-                151906: [11, 19], 151907: [11, 20],
-            }
-        else:
-            raise ValueError(f"{tokenizer_type} can't use text as tokens")
-    elif tokenizer_type == "llama_2":
-        if use_num:
-            re_tokens = {
-                31536: (0, 0), 31537: (0, 1), 31563: (0, 2), 31571: (0, 3), 31578: (0, 4), 31582: (0, 5), 31585: (0, 6), 31598: (0, 7), 
-                31603: (0, 8), 31604: (0, 9), 31000: (0, 10), 31001: (0, 11), 31002: (0, 12), 31003: (0, 13), 31004: (0, 14), 31005: (0, 15), 
-                31006: (0, 16), 31007: (0, 17), 31008: (0, 18), 31009: (0, 19), 31010: (0, 20), 31011: (0, 21), 31012: (0, 22), 31013: (0, 23), 
-                31014: (0, 24), 31015: (0, 25), 31016: (0, 26), 31017: (0, 27), 31018: (0, 28), 31019: (0, 29), 31020: (0, 30), 31021: (0, 31), 31022: (0, 32), 31023: (0, 33), 31024: (0, 34), 31025: (0, 35), 31026: (0, 36), 31027: (0, 37), 
-                31028: (0, 38), 31029: (0, 39), 31030: (0, 40), 31031: (0, 41), 31032: (0, 42), 31033: (0, 43), 31034: (0, 44), 31035: (0, 45), 31036: (0, 46), 31037: (0, 47), 31038: (0, 48), 31039: (0, 49), 31040: (0, 50), 31041: (0, 51), 
-                31042: (0, 52), 31043: (0, 53), 31044: (0, 54), 31045: (0, 55), 31046: (0, 56), 31047: (0, 57), 31048: (0, 58), 31049: (0, 59), 31050: (0, 60), 31051: (0, 61), 31052: (0, 62), 31053: (0, 63), 31054: (0, 64), 31055: (0, 65), 
-                31056: (0, 66), 31057: (0, 67), 31058: (0, 68), 31059: (0, 69), 31060: (0, 70), 31061: (0, 71), 31062: (0, 72), 31063: (0, 73), 31064: (0, 74), 31065: (0, 75), 31066: (0, 76), 31067: (0, 77), 31068: (0, 78), 31069: (0, 79), 
-                31070: (0, 80), 31071: (0, 81), 31072: (0, 82), 31073: (0, 83), 31074: (0, 84), 31075: (0, 85), 31076: (0, 86), 31077: (0, 87), 31078: (0, 88), 31079: (0, 89), 31080: (0, 90), 31081: (0, 91), 31082: (0, 92), 31083: (0, 93), 
-                31084: (0, 94), 31085: (0, 95), 31086: (0, 96), 31087: (0, 97), 31088: (0, 98), 31089: (0, 99), 31090: (0, 100), 31091: (0, 101), 31092: (0, 102), 31093: (0, 103), 31094: (0, 104), 31095: (0, 105), 31096: (0, 106), 31097: (0, 107), 
-                31098: (0, 108), 31099: (0, 109), 31100: (0, 110), 31101: (0, 111), 31102: (0, 112), 31103: (0, 113), 31104: (0, 114), 31105: (0, 115), 31106: (0, 116), 31107: (0, 117), 31108: (0, 118), 31109: (0, 119), 31110: (0, 120), 31111: (0, 121), 
-                31112: (0, 122), 31113: (0, 123), 31114: (0, 124), 31115: (0, 125), 31116: (0, 126), 31117: (0, 127), 31118: (0, 128), 31119: (0, 129), 31120: (0, 130), 31121: (0, 131), 31122: (0, 132), 31123: (0, 133), 31124: (0, 134), 31125: (0, 135), 31126: (0, 136), 31127: (0, 137), 31128: (0, 138), 31129: (0, 139), 31130: (0, 140), 31131: (0, 141), 31132: (0, 142), 31133: (0, 143), 31134: (0, 144), 31135: (0, 145), 31136: (0, 146), 31137: (0, 147), 31138: (0, 148), 31139: (0, 149), 
-                31140: (0, 150), 31141: (0, 151), 31142: (0, 152), 31143: (0, 153), 31144: (0, 154), 31145: (0, 155), 31146: (0, 156), 31147: (0, 157), 31148: (0, 158), 31149: (0, 159), 31150: (0, 160), 31151: (0, 161), 31152: (0, 162), 31153: (0, 163), 31154: (0, 164), 31155: (0, 165), 31156: (0, 166), 31157: (0, 167), 31158: (0, 168), 31159: (0, 169), 31160: (0, 170), 31161: (0, 171), 31162: (0, 172), 31163: (0, 173), 31164: (0, 174), 31165: (0, 175), 31166: (0, 176), 31167: (0, 177), 31168: (0, 178), 
-                31169: (0, 179), 31170: (0, 180), 31171: (0, 181), 31172: (0, 182), 31173: (0, 183), 31174: (0, 184), 31175: (0, 185), 31176: (0, 186), 31177: (0, 187), 31178: (0, 188), 31179: (0, 189), 31180: (0, 190), 31181: (0, 191), 31182: (0, 192), 31183: (0, 193), 31184: (0, 194), 31185: (0, 195), 31186: (0, 196), 31187: (0, 197), 31188: (0, 198), 31189: (0, 199), 31190: (0, 200), 31191: (0, 201), 31192: (0, 202), 31193: (0, 203), 31195: (0, 204), 31196: (0, 205), 31197: (0, 206), 31198: (0, 207), 
-                31199: (0, 208), 31200: (0, 209), 31201: (0, 210), 31202: (0, 211), 31203: (0, 212), 31204: (0, 213), 31205: (0, 214), 31206: (0, 215), 31207: (0, 216), 31208: (0, 217), 31209: (0, 218), 31210: (0, 219), 31211: (0, 220), 31212: (0, 221), 31213: (0, 222), 31214: (0, 223), 31215: (0, 224), 31216: (0, 225), 31217: (0, 226), 31218: (0, 227), 31219: (0, 228), 31220: (0, 229), 31221: (0, 230), 31222: (0, 231), 31223: (0, 232), 31224: (0, 233), 31225: (0, 234), 31226: (0, 235), 31227: (0, 236), 
-                31228: (0, 237), 31229: (0, 238), 31230: (0, 239), 31231: (0, 240), 31232: (0, 241), 31233: (0, 242), 31234: (0, 243), 31235: (0, 244), 31236: (0, 245), 31237: (0, 246), 31238: (0, 247), 31239: (0, 248), 31240: (0, 249), 31241: (0, 250), 31243: (0, 251), 31244: (0, 252), 31245: (0, 253), 31246: (0, 254), 31247: (0, 255), 31248: (0, 256), 31249: (0, 257), 31250: (0, 258), 31251: (0, 259), 31252: (0, 260), 31253: (0, 261), 31254: (0, 262), 31255: (0, 263), 31256: (0, 264), 31257: (0, 265), 
-                31258: (0, 266), 31259: (0, 267), 31260: (0, 268), 31261: (0, 269), 31262: (0, 270), 31263: (0, 271), 31264: (0, 272), 31265: (0, 273), 31266: (0, 274), 31267: (0, 275), 31268: (0, 276), 31269: (0, 277), 31270: (0, 278), 31271: (0, 279), 31272: (0, 280), 31273: (0, 281), 31274: (0, 282), 31275: (0, 283), 31276: (0, 284), 31277: (0, 285), 31278: (0, 286), 31279: (0, 287), 31280: (0, 288), 31281: (0, 289), 31282: (0, 290), 31283: (0, 291), 31284: (0, 292), 31285: (0, 293), 31286: (0, 294), 
-                31287: (0, 295), 31288: (0, 296), 31289: (0, 297), 31290: (0, 298), 31291: (0, 299), 31292: (0, 300), 31293: (0, 301), 31294: (0, 302), 31295: (0, 303), 31296: (0, 304), 31297: (0, 305), 31298: (0, 306), 31299: (0, 307), 31300: (0, 308), 31301: (0, 309), 31302: (0, 310), 31303: (0, 311), 31304: (0, 312), 31305: (0, 313), 31306: (0, 314), 31307: (0, 315), 31308: (0, 316), 31309: (0, 317), 31310: (0, 318), 31311: (0, 319), 31312: (0, 320), 31313: (0, 321), 31314: (0, 322), 31315: (0, 323), 
-                31316: (0, 324), 31317: (0, 325), 31318: (0, 326), 31319: (0, 327), 31320: (0, 328), 31321: (0, 329), 31322: (0, 330), 31323: (0, 331), 31324: (0, 332), 31325: (0, 333), 31326: (0, 334), 31327: (0, 335), 31328: (0, 336), 31329: (0, 337), 31330: (0, 338), 31331: (0, 339), 31332: (0, 340), 
-                31333: (0, 341), 31334: (0, 342), 31335: (0, 343), 31336: (0, 344), 31337: (0, 345), 31338: (0, 346), 31339: (0, 347), 31340: (0, 348), 31341: (0, 349), 31342: (0, 350), 31343: (0, 351), 31344: (0, 352), 31345: (0, 353), 31346: (0, 354), 31347: (0, 355), 31348: (0, 356), 31349: (0, 357), 31350: (0, 358), 31351: (0, 359), 31352: (0, 360), 31353: (0, 361), 31354: (0, 362), 31355: (0, 363), 31356: (0, 364), 31357: (0, 365), 31358: (0, 366), 31359: (0, 367), 31360: (0, 368), 31361: (0, 369), 
-                31362: (0, 370), 31363: (0, 371), 31364: (0, 372), 31365: (0, 373), 31366: (0, 374), 31367: (0, 375), 31368: (0, 376), 31369: (0, 377), 31370: (0, 378), 31371: (0, 379), 31372: (0, 380), 31373: (0, 381), 31374: (0, 382), 31375: (0, 383), 31376: (0, 384), 31377: (0, 385), 31378: (0, 386), 
-                31380: (0, 387), 31381: (0, 388), 31382: (0, 389), 31383: (0, 390), 31384: (0, 391), 31385: (0, 392), 31386: (0, 393), 31387: (0, 394), 31388: (0, 395), 31389: (0, 396), 31390: (0, 397), 31391: (0, 398), 31392: (0, 399), 31393: (0, 400), 31394: (0, 401), 31395: (0, 402), 31396: (0, 403), 31397: (0, 404), 31398: (0, 405), 31399: (0, 406), 31400: (0, 407), 31401: (0, 408), 31402: (0, 409), 31403: (0, 410), 31404: (0, 411), 
-                31405: (0, 412), 31406: (0, 413), 31407: (0, 414), 31408: (0, 415), 31409: (0, 416), 31410: (0, 417), 31411: (0, 418), 31412: (0, 419), 31413: (0, 420), 31414: (0, 421), 31415: (0, 422), 31416: (0, 423), 31417: (0, 424), 31418: (0, 425), 31419: (0, 426), 31420: (0, 427), 31421: (0, 428), 31422: (0, 429), 31423: (0, 430), 31424: (0, 431), 31425: (0, 432), 31426: (0, 433), 31427: (0, 434), 31428: (0, 435), 31429: (0, 436), 31430: (0, 437), 31431: (0, 438), 31432: (0, 439), 31433: (0, 440), 
-                31434: (0, 441), 31435: (0, 442), 31436: (0, 443), 31437: (0, 444), 31438: (0, 445), 31439: (0, 446), 31440: (0, 447), 31441: (0, 448), 31442: (0, 449), 31443: (0, 450), 31444: (0, 451), 31445: (0, 452), 31446: (0, 453), 31447: (0, 454), 31448: (0, 455), 31449: (0, 456), 31450: (0, 457), 
-                31451: (0, 458), 31452: (0, 459), 31453: (0, 460), 31454: (0, 461), 31455: (0, 462), 31456: (0, 463), 31457: (0, 464), 31458: (0, 465), 31459: (0, 466), 31460: (0, 467), 31461: (0, 468), 31462: (0, 469), 31463: (0, 470), 31464: (0, 471), 31465: (0, 472), 31466: (0, 473), 31467: (0, 474), 31468: (0, 475), 31469: (0, 476), 31470: (0, 477), 31471: (0, 478), 31472: (0, 479), 31473: (0, 480), 31474: (0, 481), 31475: (0, 482), 31476: (0, 483), 31477: (0, 484), 31478: (0, 485), 31479: (0, 486), 
-                31480: (0, 487), 31481: (0, 488), 31482: (0, 489), 31483: (0, 490), 31484: (0, 491), 31485: (0, 492), 31486: (0, 493), 31487: (0, 494), 31488: (0, 495), 31489: (0, 496), 31490: (0, 497), 31491: (0, 498), 31492: (0, 499), 31493: (0, 500), 31494: (0, 501), 31495: (0, 502), 31496: (0, 503), 31497: (0, 504), 31498: (0, 505), 31499: (0, 506), 31500: (0, 507), 31501: (0, 508), 31502: (0, 509), 31503: (0, 510), 31504: (0, 511)
-            }
-        else:
-            raise ValueError(f"{tokenizer_type} can't use text as tokens")
-    else:
+    if tokenizer_type not in REMAP_CONTROL_TOKENS:
         raise ValueError(f"The tokenizer type {tokenizer_type} is not supported in control tokens.")
+    if not use_num:
+        raise ValueError(f"{tokenizer_type} can't use text as tokens")
     # Return (-1, -1) if token is not found
-    return re_tokens.get(token, (-1, -1))
+    return REMAP_CONTROL_TOKENS[tokenizer_type].get(token, (-1, -1))
+
+
+@lru_cache(maxsize=None)
+def control_token_table(tokenizer_type: str) -> tuple:
+    """
+    Build a dense lookup table from token id to (action group index, number), once per tokenizer type.
+
+    Args:
+        tokenizer_type (str): Tokenizer type.
+
+    Returns:
+        tuple: (offset, table) where table[token - offset] is the (group, number) pair of a control token
+            and (-1, -1) for any other token inside the table range. The table is read-only.
+    """
+    if tokenizer_type not in REMAP_CONTROL_TOKENS:
+        raise ValueError(f"The tokenizer type {tokenizer_type} is not supported in control tokens.")
+    re_tokens = REMAP_CONTROL_TOKENS[tokenizer_type]
+    token_ids = np.fromiter(re_tokens.keys(), dtype=np.int64)
+    offset = int(token_ids.min())
+    table = np.full((int(token_ids.max()) - offset + 1, 2), -1, dtype=np.int64)
+    table[token_ids - offset] = np.array(list(re_tokens.values()), dtype=np.int64)
+    table.setflags(write=False)
+    return offset, table
+
+
+@lru_cache(maxsize=None)
+def control_token_ids(tokenizer_type: str, bases: tuple) -> np.ndarray:
+    """
+    Build the (group, number) -> token id table used by the batched encoder, once per tokenizer type.
+
+    Args:
+        tokenizer_type (str): Tokenizer type.
+        bases (tuple): Bases of each action group.
+
+    Returns:
+        np.ndarray: A read-only (len(bases), max(bases)) int64 array; unused cells are -1.
+    """
+    table = np.full((len(bases), max(bases)), -1, dtype=np.int64)
+    for i, base in enumerate(bases):
+        for j in range(base):
+            table[i, j] = map_control_token(j, i, tokenizer_type, not_text=True)
+    table.setflags(write=False)
+    return table
 
 
 def tag_token(place: int, tokenizer_type: str, return_type: int = 0):
@@ -291,6 +338,25 @@ def tag_token(place: int, tokenizer_type: str, return_type: int = 0):
     return special_tokens[place][return_type]
 
 
+@lru_cache(maxsize=None)
+def camera_action_mapping(camera_maxval: int, camera_binsize: int, camera_quantization_scheme: str, camera_mu: float) -> tuple:
+    """
+    Build the action transformer and the camera hierarchical mapping once per camera configuration.
+
+    Returns:
+        tuple: (ActionTransformer, CameraHierarchicalMapping); both are only read after construction.
+    """
+    camera_config = CameraConfig(
+        camera_maxval=camera_maxval,
+        camera_binsize=camera_binsize,
+        camera_quantization_scheme=camera_quantization_scheme,
+        camera_mu=camera_mu,
+    )
+    action_transformer = ActionTransformer(**camera_config.action_transformer_kwargs)
+    action_mapper = CameraHierarchicalMapping(n_camera_bins=camera_config.n_camera_bins)
+    return action_transformer, action_mapper
+
+
 class ActionTokenizer(ABC):
     """
     Base class for action tokenizers, used to encode and decode actions to and from tokens.
@@ -333,9 +399,9 @@ class ActionTokenizer(ABC):
             'camera': (0.0, 0.0)
         }
 
-        # Initialize action transformer and action mapper
-        self.action_transformer = ActionTransformer(**camera_config.action_transformer_kwargs)
-        self.action_mapper = CameraHierarchicalMapping(n_camera_bins=camera_config.n_camera_bins)
+        # Initialize action transformer and action mapper (shared by all tokenizers with the same camera config)
+        self.action_transformer, self.action_mapper = camera_action_mapping(
+            camera_maxval, camera_binsize, camera_quantization_scheme, camera_mu)
 
     @abstractmethod
     def encode(self, actions: Dict) -> Union[torch.Tensor, list, str]:
@@ -399,7 +465,7 @@ class OneActionTokenizer(ActionTokenizer):
         """
         group_actions = self.token_2_group_action(tokens,)
         
-        actions = [self.group_action_2_decimal_action(group_action) for group_action in group_actions ]
+        actions = self.group_action_2_decimal_action(np.asarray(group_actions))
         action_dicts = []
         for action in  actions:
             action_dict = {
@@ -427,24 +493,13 @@ class OneActionTokenizer(ActionTokenizer):
         frame_ids = trajectory.get('frame_ids', range(0, traj_len))
         uuids = trajectory.get('uuids', [""] * traj_len)
 
-        # Convert action values for buttons and camera into numpy arrays
-        minerl_action_transformed = {key: np.array(val)
-                                     for key, val in minerl_actions.items()
-                                     if key in Buttons.ALL or key == "camera"}
-        # Convert environment actions to policy-friendly action format
-        minerl_action = self.action_transformer.env2policy(minerl_action_transformed)
-        # Convert to factorized action representation using the mapper
-        actions = self.action_mapper.from_factored(minerl_action)
-
-        action_list = []
-        # Store each frame's action as a tuple (buttons, camera)
-        for idx in range(traj_len):
-            action_list.append((actions["buttons"][idx][0], actions["camera"][idx][0]))
+        # Convert the whole trajectory to decimal actions, then to group actions at once
+        group_actions = self.decimal_action_2_group_action(self.env_action_2_decimal_action(minerl_actions))
 
         encoded_trajectory = []
         # Generate control tokens for each action and combine with additional information into a dictionary
-        for idx, action in enumerate(action_list):
-            control_token = self.encode_action(action)
+        for idx, group_action in enumerate(group_actions.tolist()):
+            control_token = self.group_action_2_token(group_action)
             encoded_trajectory.append({
                 "action_token": control_token,
                 "observations": [observations[idx]],
@@ -453,6 +508,83 @@ class OneActionTokenizer(ActionTokenizer):
             })
         return encoded_trajectory
 
+    def env_action_2_decimal_action(self, minerl_actions: dict) -> np.ndarray:
+        """
+        Convert env actions of a whole trajectory into decimal actions.
+
+        Args:
+            minerl_actions (dict): Env actions, (T,) arrays for buttons and a (T, 2) array for camera.
+
+        Returns:
+            np.ndarray: A (T, 2) array of (buttons, camera) decimal actions.
+        """
+        # Convert action values for buttons and camera into numpy arrays
+        minerl_action_transformed = {key: np.array(val)
+                                     for key, val in minerl_actions.items()
+                                     if key in Buttons.ALL or key == "camera"}
+        # Convert environment actions to policy-friendly action format
+        minerl_action = self.action_transformer.env2policy(minerl_action_transformed)
+        # Convert to factorized action representation using the mapper
+        actions = self.action_mapper.from_factored(minerl_action)
+        return np.stack([actions["buttons"][:, 0], actions["camera"][:, 0]], axis=1)
+
+    def encode_batch(self, minerl_actions: dict, pad_id: int = -1) -> tuple:
+        """
+        Encode the actions of a whole trajectory into control token ids at once.
+
+        Args:
+            minerl_actions (dict): Env actions, (T,) arrays for buttons and a (T, 2) array for camera.
+            pad_id (int): Token id used to pad rows shorter than the longest action.
+
+        Returns:
+            tuple: (token_ids, lengths), a (T, L) int64 array with start and end tags included, and the (T,) valid lengths.
+        """
+        group_actions = self.decimal_action_2_group_action(self.env_action_2_decimal_action(minerl_actions))
+        return self.group_action_2_token_ids(group_actions, pad_id=pad_id)
+
+    def group_action_2_token_ids(self, group_actions: np.ndarray, pad_id: int = -1) -> tuple:
+        """
+        Vectorized version of group_action_2_token that returns token ids.
+
+        Args:
+            group_actions (np.ndarray): A (T, len(bases)) array of group actions.
+            pad_id (int): Token id used to pad rows shorter than the longest action.
+
+        Returns:
+            tuple: (token_ids, lengths), a (T, L) int64 array and the (T,) valid lengths.
+        """
+        group_actions = np.asarray(group_actions, dtype=np.int64).reshape(-1, len(self.bases))
+        token_table = control_token_ids(self.tokenizer_type, tuple(self.bases))
+        groups = np.arange(len(self.bases))
+        # Same layout as group_action_2_token: non-zero groups except the last 4, then both camera groups
+        columns = np.concatenate((groups[:-4], groups[-2:]))
+        token_ids = token_table[columns, group_actions[:, columns]]
+        keep = np.ones(token_ids.shape, dtype=bool)
+        keep[:, :-2] = group_actions[:, columns[:-2]] != 0
+
+        num = len(group_actions)
+        token_ids = np.concatenate((np.full((num, 1), self.act_beg_id), token_ids, np.full((num, 1), self.act_end_id)), axis=1)
+        keep = np.concatenate((np.ones((num, 1), dtype=bool), keep, np.ones((num, 1), dtype=bool)), axis=1)
+        # Move kept tokens to the front of each row while preserving their order, then pad the rest
+        order = np.argsort(~keep, axis=1, kind="stable")
+        token_ids = np.take_along_axis(token_ids, order, axis=1)
+        lengths = keep.sum(axis=1)
+        token_ids[np.arange(token_ids.shape[1]) >= lengths[:, None]] = pad_id
+        return token_ids[:, :lengths.max(initial=0)], lengths
+
+    def stack_env_actions(self, steps: list) -> dict:
+        """
+        Stack per-step env action dicts (e.g. episode_*_action.json) into trajectory arrays.
+
+        Args:
+            steps (list): A list of env action dicts; missing keys (such as the empty first step) take null action values.
+
+        Returns:
+            dict: (T,) arrays for buttons and a (T, 2) array for camera.
+        """
+        return {key: np.array([step.get(key, null_value) for step in steps])
+                for key, null_value in self.null_action.items()}
+
     def encode_action(self, action: tuple) -> str:
         """
         Encode a single action into a control token string.
@@ -492,133 +624,147 @@ class OneActionTokenizer(ActionTokenizer):
         tag_control_token = self.act_beg_token + control_token + self.act_end_token
         return tag_control_token
 
-    def token_2_group_action(self, tokens: Union[torch.Tensor, list]):
+    def token_2_group_action(self, tokens: Union[torch.Tensor, list, np.ndarray]):
         """
         Convert a token sequence into a group action representation.
 
         Args:
-            tokens (Union[torch.Tensor, list]): Sequence of tokens representing actions.
+            tokens (Union[torch.Tensor, list, np.ndarray]): Sequence of tokens representing actions.
 
         Returns:
             list: A list of group action representations (each as a list of numbers).
         """
-        actions = []
         # Initialize a default group action with zeros; for camera parts, use the midpoint values
         action_base = [0] * len(self.bases)
         camera_null = [self.bases[-1] // 2, self.bases[-2] // 2]
         action_base[-2:] = camera_null
 
-        # Convert torch.Tensor tokens to list if necessary
+        # Convert tokens to a flat int64 array
         if isinstance(tokens, torch.Tensor):
             if tokens.ndim == 2:
                 tokens = tokens.squeeze()
             tokens = tokens.tolist()
-        elif not isinstance(tokens, list):
+        elif not isinstance(tokens, (list, np.ndarray)):
             raise ValueError("wrong type!")
-
-        start_idx = 0
-        # Split the token sequence based on start and end tag tokens; each segment represents one action
-        while start_idx < len(tokens):
-            try:
-                first_index_n1 = tokens.index(self.act_beg_id, start_idx)
-                first_index_n2 = tokens.index(self.act_end_id, first_index_n1 + 1)
-            except ValueError:
-                break
-
-            # Extract control tokens between the start and end tags
-            control_tokens = tokens[first_index_n1 + 1:first_index_n2]
-            action = copy.copy(action_base)
-            # Map each control token back to its corresponding group number and update the action
-            for token in control_tokens:
-                place, num = remap_control_token(token, use_num=True, tokenizer_type=self.tokenizer_type)
-                if place != -1:
-                    action[place] = num
-
-            # If camera part is not equal to the default, set the inventory flag (set the fourth-last element to 1)
-            if action[-2:] != camera_null:
-                action[-4] = 1
-
-            actions.append(copy.copy(action))
-            start_idx = first_index_n2 + 1
+        tokens = np.atleast_1d(np.asarray(tokens, dtype=np.int64))
+
+        # Split the token sequence based on start and end tag tokens; each segment represents one action.
+        # An end tag closes a segment iff a start tag occurs after the previous end tag,
+        # and the segment begins at the first start tag after that previous end tag.
+        beg_pos = np.flatnonzero(tokens == self.act_beg_id)
+        end_pos = np.flatnonzero(tokens == self.act_end_id)
+        begs_before = np.searchsorted(beg_pos, end_pos)
+        closing = np.diff(begs_before, prepend=0) > 0
+        prev_end = np.concatenate(([-1], end_pos[:-1]))[closing]
+        seg_end = end_pos[closing]
+        seg_beg = beg_pos[np.searchsorted(beg_pos, prev_end, side="right")]
 
         # If no actions are parsed, return the default null action
-        if len(actions) == 0:
-            actions.append(action_base)
-
-        return actions
-
-    def decimal_action_2_group_action(self, inputs: tuple):
+        if len(seg_end) == 0:
+            return [action_base]
+
+        actions = np.tile(np.asarray(action_base, dtype=np.int64), (len(seg_end), 1))
+
+        # Map every token inside a segment back to its corresponding group number
+        positions = np.arange(len(tokens))
+        seg_idx = np.searchsorted(seg_beg, positions, side="right") - 1
+        inside = (seg_idx >= 0) & (positions < seg_end[np.maximum(seg_idx, 0)]) & (positions > seg_beg[np.maximum(seg_idx, 0)])
+        if inside.any():
+            offset, table = control_token_table(self.tokenizer_type)
+            local = tokens[inside] - offset
+            known = (local >= 0) & (local < len(table))
+            place_num = np.full((len(local), 2), -1, dtype=np.int64)
+            place_num[known] = table[local[known]]
+            valid = place_num[:, 0] != -1
+            seg_idx = seg_idx[inside][valid]
+            place, num = place_num[valid, 0], place_num[valid, 1]
+            # Later tokens of the same group overwrite earlier ones, so keep the last occurrence
+            flat = (seg_idx * len(self.bases) + place)[::-1]
+            _, last = np.unique(flat, return_index=True)
+            actions[seg_idx[::-1][last], place[::-1][last]] = num[::-1][last]
+
+        # If camera part is not equal to the default, set the camera flag (set the fourth-last element to 1)
+        actions[(actions[:, -2:] != camera_null).any(axis=1), -4] = 1
+        return actions.tolist()
+
+    def decimal_action_2_group_action(self, inputs: Union[tuple, np.ndarray]):
         """
         Convert a decimal action representation into a group action representation with varying bases.
 
         Args:
-            inputs (tuple): A tuple of two decimal integers representing button and camera actions.
+            inputs (Union[tuple, np.ndarray]): A tuple of two decimal integers representing button and camera actions,
+                or a (T, 2) array of them.
 
         Returns:
-            tuple: Each element represents the value for one action group.
+            Union[tuple, np.ndarray]: Each element represents the value for one action group; a (T, len(bases)) array for batched inputs.
 
         Description:
             - For button actions, perform successive modulo and integer division operations according to the bases.
             - If the button part equals 8640, mark it as inventory mode and set it to 0.
             - For camera actions, process the last two parts separately.
         """
-        decimals = list(inputs)
-        result = [0] * len(self.bases)
-        inventory_flag = False
+        decimals = np.asarray(inputs, dtype=np.int64)
+        batched = decimals.ndim == 2
+        decimals = decimals.reshape(-1, 2)
+        buttons, camera = decimals[:, 0].copy(), decimals[:, 1].copy()
+        result = np.zeros((len(decimals), len(self.bases)), dtype=np.int64)
 
         # Check if the button part is 8640; if so, enable the inventory flag and set it to 0
-        if decimals[0] == 8640:
-            inventory_flag = True
-            decimals[0] = 0
-        else:
-            # Convert the button part from lower to higher digits
-            for i in range(len(self.bases) - 4, -1, -1):
-                result[i] = decimals[0] % self.bases[i]
-                decimals[0] //= self.bases[i]
+        inventory_flag = buttons == 8640
+        buttons[inventory_flag] = 0
+        # Convert the button part from lower to higher digits
+        for i in range(len(self.bases) - 4, -1, -1):
+            result[:, i] = buttons % self.bases[i]
+            buttons //= self.bases[i]
 
         # Process the camera part: first the last digit, then the second last
-        result[-1] = decimals[1] % self.bases[-1]
-        decimals[1] //= self.bases[-1]
-        result[-2] = decimals[1] % self.bases[-2]
-        decimals[1] //= self.bases[-2]
+        result[:, -1] = camera % self.bases[-1]
+        camera //= self.bases[-1]
+        result[:, -2] = camera % self.bases[-2]
+        camera //= self.bases[-2]
 
         # If inventory flag is True, set the third-last element to 1
-        if inventory_flag:
-            result[-3] = 1
-        if decimals != [0, 0]:
-            print(decimals)
+        result[inventory_flag, -3] = 1
+        overflow = (buttons != 0) | (camera != 0)
+        if overflow.any():
+            print(np.stack([buttons, camera], axis=1)[overflow])
             raise ValueError("The decimal number is too large for the custom base system.")
-        return tuple(result)
+        return result if batched else tuple(result[0].tolist())
 
-    def group_action_2_decimal_action(self, inputs):
+    def group_action_2_decimal_action(self, inputs: Union[list, np.ndarray]):
         """
         Convert a group action representation with varying bases into a decimal action representation.
 
         Args:
-            inputs: A list of numbers, with the length matching the bases.
+            inputs (Union[list, np.ndarray]): A list of numbers with the length matching the bases, or a (T, len(bases)) array of them.
 
         Returns:
-            tuple: The converted decimal action representation, including button and camera parts.
+            Union[tuple, np.ndarray]: The converted decimal action representation, including button and camera parts;
+                a (T, 2) array for batched inputs.
 
         Raises:
             ValueError: If the input length does not match the expected number of digits or exceeds base limits.
         """
-        if len(inputs) != len(self.bases):
+        digits = np.asarray(inputs, dtype=np.int64)
+        batched = digits.ndim == 2
+        if digits.shape[-1] != len(self.bases):
             raise ValueError("The input number does not match the expected number of digits.")
-        decimal_results = [0, 0]
-        mid = len(inputs) - 3  # Boundary between button and camera parts
+        digits = digits.reshape(-1, len(self.bases))
+        exceeded = (digits >= np.asarray(self.bases)).any(axis=0)
+        if exceeded.any():
+            i = int(np.flatnonzero(exceeded)[0])
+            raise ValueError(f"Digit at position {i} exceeds the base limit of {self.bases[i]-1}.")
+        decimal_results = np.zeros((len(digits), 2), dtype=np.int64)
+        mid = len(self.bases) - 3  # Boundary between button and camera parts
 
         # Calculate the decimal value for the button part
-        for i, digit in enumerate(inputs):
-            if digit >= self.bases[i]:
-                raise ValueError(f"Digit at position {i} exceeds the base limit of {self.bases[i]-1}.")
-            if i < mid:
-                decimal_results[0] = decimal_results[0] * self.bases[i] + digit
-            elif i == mid and digit:
-                decimal_results[0] = 8640  # Special inventory flag
-            else:
-                decimal_results[1] = decimal_results[1] * self.bases[i] + digit
-        return tuple(decimal_results)
+        for i in range(mid):
+            decimal_results[:, 0] = decimal_results[:, 0] * self.bases[i] + digits[:, i]
+        decimal_results[digits[:, mid] != 0, 0] = 8640  # Special inventory flag
+        # Calculate the decimal value for the camera part
+        for i in range(mid + 1, len(self.bases)):
+            decimal_results[:, 1] = decimal_results[:, 1] * self.bases[i] + digits[:, i]
+        return decimal_results if batched else tuple(decimal_results[0].tolist())
 
     def null_token(self) -> str:
         """
@@ -628,4 +774,118 @@ class OneActionTokenizer(ActionTokenizer):
             str: The control token string for the null action.
         """
         return self.encode_action(self.NULL_ACTION)
-    
\ No newline at end of file
+    
+
+_tokenizer_registry = {}
+_tokenizer_registry_lock = threading.Lock()
+
+
+def get_action_tokenizer(tokenizer_type: str = "qwen2_vl",
+                         bases: list = [10, 3, 3, 3, 2, 2, 2, 2, 2, 2, 21, 21],
+                         camera_quantization_scheme="mu_law",
+                         camera_mu=20,
+                         camera_binsize=1) -> OneActionTokenizer:
+    """
+    Process-wide registry of action tokenizers. The tokenizer and its mapping tables are built on the first
+    request of a configuration and shared by every agent in the process (including later episodes of a Ray worker).
+
+    Args:
+        tokenizer_type (str): Tokenizer type.
+        bases (list): List of bases for each action group.
+        camera_quantization_scheme, camera_mu, camera_binsize: Camera quantization settings.
+
+    Returns:
+        OneActionTokenizer: The shared tokenizer; it must be treated as read-only.
+    """
+    key = (tokenizer_type, tuple(bases), camera_quantization_scheme, camera_mu, camera_binsize)
+    with _tokenizer_registry_lock:
+        if key not in _tokenizer_registry:
+            _tokenizer_registry[key] = OneActionTokenizer(tokenizer_type=tokenizer_type,
+                                                          bases=list(bases),
+                                                          camera_quantization_scheme=camera_quantization_scheme,
+                                                          camera_mu=camera_mu,
+                                                          camera_binsize=camera_binsize)
+        return _tokenizer_registry[key]
+
+
+_worker_tokenizer = None
+
+
+def _init_encode_worker(tokenizer_kwargs: dict):
+    global _worker_tokenizer
+    _worker_tokenizer = get_action_tokenizer(**tokenizer_kwargs)
+
+
+def _encode_episode(episode: Union[str, Path, list], pad_id: int) -> tuple:
+    if isinstance(episode, (str, Path)):
+        with open(episode) as f:
+            episode = json.load(f)
+    return _worker_tokenizer.encode_batch(_worker_tokenizer.stack_env_actions(episode), pad_id=pad_id)
+
+
+def encode_episodes(episodes: list, num_workers: int = 4, pad_id: int = -1, **tokenizer_kwargs) -> list:
+    """
+    Encode many episodes into control token ids with a process pool; each worker builds its tokenizer once.
+
+    Args:
+        episodes (list): Paths of episode action files (like episode_1_action.json) or lists of per-step env action dicts.
+        num_workers (int): Number of worker processes; 0 encodes in the current process.
+        pad_id (int): Token id used to pad rows shorter than the longest action.
+        **tokenizer_kwargs: Arguments of OneActionTokenizer.
+
+    Returns:
+        list: (token_ids, lengths) for every episode, in input order.
+    """
+    if num_workers <= 0:
+        _init_encode_worker(tokenizer_kwargs)
+        return [_encode_episode(episode, pad_id) for episode in tqdm(episodes)]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_encode_worker, initargs=(tokenizer_kwargs,)) as executor:
+        return list(tqdm(executor.map(_encode_episode, episodes, [pad_id] * len(episodes), chunksize=8), total=len(episodes)))
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: decode throughput of long action chunks
+    import argparse
+    import timeit
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokenizer-type", type=str, default="qwen2_vl")
+    parser.add_argument("--chunk-len", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    tokenizer = OneActionTokenizer(tokenizer_type=args.tokenizer_type)
+    rng = np.random.default_rng(0)
+    tokens = []
+    for _ in range(args.chunk_len):
+        group_action = [int(rng.integers(base)) for base in tokenizer.bases]
+        tokens.append(tokenizer.act_beg_id)
+        tokens.extend(map_control_token(num, i, args.tokenizer_type, not_text=True)
+                      for i, num in enumerate(group_action) if num or i >= len(group_action) - 2)
+        tokens.append(tokenizer.act_end_id)
+
+    def per_token_decode(tokens):
+        # reference: the per-token loop with one dict lookup per control token
+        actions, start_idx = [], 0
+        camera_null = [tokenizer.bases[-1] // 2, tokenizer.bases[-2] // 2]
+        while True:
+            try:
+                beg = tokens.index(tokenizer.act_beg_id, start_idx)
+                end = tokens.index(tokenizer.act_end_id, beg + 1)
+            except ValueError:
+                break
+            action = [0] * (len(tokenizer.bases) - 2) + camera_null
+            for token in tokens[beg + 1:end]:
+                place, num = remap_control_token(token, use_num=True, tokenizer_type=args.tokenizer_type)
+                if place != -1:
+                    action[place] = num
+            if action[-2:] != camera_null:
+                action[-4] = 1
+            actions.append(action)
+            start_idx = end + 1
+        return actions
+
+    assert per_token_decode(tokens) == tokenizer.token_2_group_action(tokens)
+    for name, fn in [("per-token loop", per_token_decode), ("lookup table", tokenizer.token_2_group_action)]:
+        cost = min(timeit.repeat(lambda: fn(tokens), number=1, repeat=args.repeat))
+        print(f"{name:>14}: {cost * 1000:.2f} ms / {args.chunk_len} actions, {args.chunk_len / cost:,.0f} actions/s")
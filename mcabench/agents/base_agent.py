@@ -17,6 +17,14 @@ class Agent(abc.ABC):
     def show(self,record_callback:MinecraftCallback,):
         pass
     
+    def inference_overlap(self)->float:
+        """fraction of the model latency hidden behind env stepping since the last reset"""
+        return 0.0
+    
+    def prompt_prefix_stats(self)->dict:
+        """prompt prefix shared across the requests of this episode, empty if not tracked"""
+        return {}
+    
     @abc.abstractmethod
     def forward(self,observations:list,instructions:list,verbos=False):
         pass
@@ -25,6 +33,10 @@ class Agent(abc.ABC):
     def reset(self,env:MinecraftSim):
         pass
     
+    def close(self):
+        """release per-agent resources such as temporary files; the agent stays usable"""
+        pass
+    
     @property
     def action_type(self):
         return self._action_type
\ No newline at end of file
@@ -17,6 +17,8 @@ from minestudio.simulator.entry import MinecraftSim
 from minestudio.simulator.callbacks.callback import MinecraftCallback
 
 MC_RESOLUTION = (640,360)
+RAW_ACTION_KEYS = ('attack','forward','back','left','right','jump','inventory','use','sprint','sneak', 'hotbar.1', 'hotbar.2', 'hotbar.3', 'hotbar.4', 'hotbar.5', 'hotbar.6', 'hotbar.7', 'hotbar.8', 'hotbar.9')
+CAMERA_PATTERN = re.compile(r"\(([-+]?\d*\.?\d+),([-+]?\d*\.?\d+)\)")
 
 
 class CoaAgent(vlm_client.VlMClient,base_agent.Agent):
@@ -44,6 +46,8 @@ class CoaAgent(vlm_client.VlMClient,base_agent.Agent):
         
     def reset(self,env:MinecraftSim):
         self.history = []
+        self.reset_prompt_stats()
+        self.processor_wrapper.release_files()
         
     def get_instructions(self,env,env_cfg):
         return [item["text"] for item in env_cfg.task_conf]
@@ -93,12 +97,26 @@ class CoaAgent(vlm_client.VlMClient,base_agent.Agent):
         return frame
 
     def show(self, record_callback:MinecraftCallback):
-        frames = record_callback.frames
-        
-        thought = self.history[-1]["thought"]
-        hierarchical_action = extract.extract_hierarchical_action(thought)
-        recent_frame = frames[-1]
-        recent_frame = self.to_bgr_uint8(recent_frame)
+        # 只记录这一帧的thought，画图推迟到demo视频编码时(render_overlay)
+        if not self.history or not getattr(record_callback, "show_annotations", False):
+            return
+        annotation = {"thought": self.history[-1]["thought"],
+                      "hierarchical_action": self.history[-1].get("hierarchical_action")}
+        record_callback.annotate(annotation, renderer=self.render_overlay)
+
+    def render_overlay(self, frame, annotation:dict=None):
+        """the frame with grounding/point markers and the thought in a text block below it;
+        frames without annotation get an empty block so that all frames have the same size"""
+        thought, hierarchical_action = "", None
+        if annotation is not None:
+            thought = annotation["thought"]
+            hierarchical_action = annotation.get("hierarchical_action")
+        if hierarchical_action is None:
+            hierarchical_action = extract.extract_hierarchical_action(thought)
+        # 原始帧还要写入其他视频，不能原地画
+        recent_frame = self.to_bgr_uint8(frame)
+        if recent_frame is frame:
+            recent_frame = recent_frame.copy()
         
         font = cv2.FONT_HERSHEY_SIMPLEX # cv2.FONT_HERSHEY_PLAIN # cv2.FONT_HERSHEY_SIMPLEX
         font_scale = 0.5
@@ -152,7 +170,7 @@ class CoaAgent(vlm_client.VlMClient,base_agent.Agent):
                             font, font_scale, circle_color, thickness)
         
         # show thought
-        wrapped_text = textwrap.wrap(repr(thought), width=70)
+        wrapped_text = textwrap.wrap(repr(thought), width=70) if annotation is not None else []
         
         #  创建一个白底文本区域图像
         max_length = 12
@@ -164,8 +182,7 @@ class CoaAgent(vlm_client.VlMClient,base_agent.Agent):
             y = (i + 1) * line_height - line_spacing
             cv2.putText(text_block, line, (10, y), font, font_scale, font_color, thickness, cv2.LINE_AA)
         
-        frames[-1] = np.vstack((recent_frame, text_block))
-        record_callback.frames = frames
+        return np.vstack((recent_frame, text_block))
         
     def forward(self, observations, instructions, verbos=False):
         return super().forward(observations, instructions, verbos)
@@ -204,18 +221,18 @@ class LatentCoaAgent(CoaAgent):
                 trust_remote_code=True,
             )
                 
-        self.action_tokenizer = action_mapping.OneActionTokenizer(tokenizer_type=self.LLM_backbone)
+        self.action_tokenizer = action_mapping.get_action_tokenizer(tokenizer_type=self.LLM_backbone)
     
     def forward(self,observations:list,instructions:list,verbos=False):
         messages = []
         image = self.processor_wrapper.create_image_input(observations[0]) 
-        instruction = self.create_restruct_instruction(instructions[0])
+        instruction = self.episode_prompt(instructions[0],lambda:self.create_restruct_instruction(instructions[0]))
         
         if self.system_prompt:
             messages.append(self.processor_wrapper.create_system_prompt(system_prompt=self.system_prompt))
         messages.append(self.processor_wrapper.create_message_vllm(role="user",input_type="image",prompt=[instruction],image=[image]))
         
-        if_token_ids = True if self.use_vllm and self.LLM_backbone in {"qwen2_vl","llama-2","llama-3"} else False
+        if_token_ids = True if self.LLM_backbone in {"qwen2_vl","llama-2","llama-3"} else False
         outputs,content = self.generate(messages=messages,verbos=verbos,if_token_ids=if_token_ids)
 
         if verbos:
@@ -248,20 +265,23 @@ class RawActionCoaAgent(CoaAgent):
     def reset(self,env:MinecraftSim):
         self.no_op = env.noop_action()
         self.history = []
+        self.reset_prompt_stats()
+        self.processor_wrapper.release_files()
         
-    def action_parse(self,raw_input:str)->List:
-        matches = re.findall(r"<raw>(.*?)</raw>", raw_input)
+    def action_parse(self,raw_input:str,hierarchical_action:dict=None)->List:
+        if hierarchical_action is None:
+            hierarchical_action = extract.extract_hierarchical_action(raw_input)
+        matches = [content["action"] for content in hierarchical_action["action"]]
         actions = []
         if not matches:
             return [self.no_op.copy()]
         for match in matches:
             action = deepcopy(self.no_op)
-            camera_matches = re.findall(r"\(([-+]?\d*\.?\d+),([-+]?\d*\.?\d+)\)", match)
-            if camera_matches:
-                action["camera"] = np.array([float(camera_matches[0][0]), float(camera_matches[0][1])])
+            camera_match = CAMERA_PATTERN.search(match)
+            if camera_match:
+                action["camera"] = np.array([float(camera_match.group(1)), float(camera_match.group(2))])
             
-            action_keys = ['attack','forward','back','left','right','jump','inventory','use','sprint','sneak', 'hotbar.1', 'hotbar.2', 'hotbar.3', 'hotbar.4', 'hotbar.5', 'hotbar.6', 'hotbar.7', 'hotbar.8', 'hotbar.9']
-            for action_key in action_keys:
+            for action_key in RAW_ACTION_KEYS:
                 if action_key in match:
                     action[action_key] = 1
             actions.append(action)
@@ -270,18 +290,19 @@ class RawActionCoaAgent(CoaAgent):
     def forward(self,observations:list,instructions:list,verbos=False):
         messages = []
         image = self.processor_wrapper.create_image_input(observations[0]) 
-        instruction = self.create_restruct_instruction(instructions[0])
+        instruction = self.episode_prompt(instructions[0],lambda:self.create_restruct_instruction(instructions[0]))
         
         messages.append(self.processor_wrapper.create_message_vllm(role="user",input_type="image",prompt=[instruction],image=[image]))
         outputs,content = self.generate(messages=messages,verbos=verbos)
         if verbos:
             print(content)
             
-        actions = self.action_parse(outputs)
+        hierarchical_action = extract.extract_hierarchical_action(outputs)
+        actions = self.action_parse(outputs,hierarchical_action)
         if verbos:
             print(actions)
             
-        self.history = [{"action":actions[0],"thought":outputs}]
+        self.history = [{"action":actions[0],"thought":outputs,"hierarchical_action":hierarchical_action}]
         return actions[0]
         
 
@@ -1,8 +1,11 @@
 import re
+import time
+import json
+import argparse
 
 GUI_COORDINATE = (640,360)
 
-""" 
+SAMPLE_OUTPUT = """ 
 Now I should move the cursor to the empty slot. The cursor is located at
 <|object_ref_start|>cursor<|object_ref_end|><|point_start|>(287,567)<|point_end|>
 . An empty slot is located at (452, 207). The cursor is on the empty slot. The Skill ACTION is 
@@ -84,4 +87,36 @@ def extract_hierarchical_action(text):
     hierarchical_action["grounding"] = extract_grounding(text)
     hierarchical_action["motion"] = extract_motion(text)
     hierarchical_action["action"] = extract_action(text)
-    return hierarchical_action
\ No newline at end of file
+    return hierarchical_action
+
+
+if __name__ == "__main__":
+    # 每个控制步的解析开销: python -m mcabench.agents.coa.extract --outputs outputs.json
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--outputs", type=str, default="", help="json list of recorded model outputs (str or {'thought': str})")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    if args.outputs:
+        with open(args.outputs, encoding="utf-8") as file:
+            recorded = [output["thought"] if isinstance(output, dict) else output for output in json.load(file)]
+        outputs = {"recorded": recorded}
+    else:
+        short = [SAMPLE_OUTPUT,
+                 "The Skill ACTION is <skill>Mine the oak log</skill>. The Grounding Action is <grounding> Mine <|object_ref_start|>oak log<|object_ref_end|><|point_start|>(512,430)<|point_end|> </grounding>. The Raw ACTION is <raw>attack camera (0.5,-1.2)</raw>.",
+                 "<raw>forwardjump</raw><raw>hotbar.2 use</raw>",
+                 "no action in this output"]
+        outputs = {"short": short, "multi-KB": [output * 16 for output in short]}
+    # 旧路径每步解析两次(show里extract_hierarchical_action + action_parse里的findall)，现在forward解析一次并共享
+    benchmarks = (
+        ("show + action_parse", lambda output: (extract_hierarchical_action(output), re.findall(r"<raw>(.*?)</raw>", output))),
+        ("shared parse", extract_hierarchical_action),
+    )
+    for group, texts in outputs.items():
+        size = sum(len(text) for text in texts) / len(texts)
+        for name, fn in benchmarks:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for text in texts:
+                    fn(text)
+            cost = (time.perf_counter() - start) / (args.repeat * len(texts)) * 1e6
+            print(f"{group} ({size:.0f} chars): {name}: {cost:.1f} us/step")
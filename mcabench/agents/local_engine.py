@@ -0,0 +1,301 @@
+'''
+In-process HF inference for VlMClient without a vLLM server.
+
+``LocalInferenceEngine`` takes the same chat requests as ``InferenceBroker`` (``submit(request)`` returns a
+future of the content, or of [(content, logprob)] when the request sets ``n``), so VlMClient uses it the
+same way. Requests submitted from several threads (episodes) within ``batch_window`` are run as one batch:
+
+- processed image tensors are cached per image object, so history frames are only processed once;
+- the text prefix in front of the first image (system prompt, instruction) is prefilled once and its
+  past_key_values are reused by every later request that starts with the same tokens;
+- the ``n`` samples of a request share one prefill.
+
+Decoding is a plain sampling loop over the model forward, so it runs on CPU as well as on CUDA;
+flash attention is only requested when CUDA is available.
+'''
+import copy
+import queue
+import threading
+import importlib.util
+from concurrent import futures
+from collections import OrderedDict
+from typing import List
+import numpy as np
+import torch
+from PIL import Image
+from transformers import AutoProcessor,AutoModelForImageTextToText,DynamicCache
+
+QWEN_IMAGE_TOKEN = "<|image_pad|>"
+
+
+def _to_pil(image):
+    if isinstance(image, Image.Image):
+        return image if image.mode == "RGB" else image.convert("RGB")
+    return Image.fromarray(np.asarray(image, dtype=np.uint8)).convert("RGB")
+
+
+def _common_prefix(sequences:List[list]) -> list:
+    prefix = sequences[0]
+    for sequence in sequences[1:]:
+        length = 0
+        for token, other in zip(prefix, sequence):
+            if token != other:
+                break
+            length += 1
+        prefix = prefix[:length]
+    return prefix
+
+
+class LocalInferenceEngine:
+    def __init__(self, model_path:str, model=None, processor=None, processor_kwargs:dict=None,
+                 device:str=None, max_batch_size:int=8, batch_window:float=0.005,
+                 image_cache_size:int=64, prefix_cache_size:int=8, min_prefix_len:int=16):
+        self.model_path = model_path
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        if processor is None:
+            processor = AutoProcessor.from_pretrained(model_path, trust_remote_code=True, **(processor_kwargs or {}))
+        if model is None:
+            model_kwargs = dict(torch_dtype=torch.bfloat16 if device.startswith("cuda") else torch.float32)
+            # flash attention只在CUDA上可用
+            if device.startswith("cuda") and importlib.util.find_spec("flash_attn") is not None:
+                model_kwargs["attn_implementation"] = "flash_attention_2"
+            model = AutoModelForImageTextToText.from_pretrained(model_path, trust_remote_code=True, **model_kwargs).to(device)
+        self.processor = processor
+        self.tokenizer = getattr(processor, "tokenizer", processor)
+        self.model = model.eval()
+        config = self.model.config
+        self.image_token_id = getattr(config, "image_token_id", None) or getattr(config, "image_token_index", None)
+        # Qwen2-VL的mrope位置由get_rope_index计算，其余模型按attention_mask累加
+        self.use_rope_index = hasattr(self.model, "get_rope_index")
+        eos_token_id = self.model.generation_config.eos_token_id
+        if eos_token_id is None:
+            eos_token_id = self.tokenizer.eos_token_id
+        self.eos_token_ids = set(eos_token_id if isinstance(eos_token_id, (list, tuple)) else [eos_token_id])
+        self.pad_token_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else min(self.eos_token_ids)
+
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.min_prefix_len = min_prefix_len
+        # 处理好的图片张量，key为图片对象id；同时持有图片对象，保证id不会被复用
+        self.image_cache_size = image_cache_size
+        self.image_cache = OrderedDict()
+        # 文本前缀(token元组) -> batch为1的past_key_values
+        self.prefix_cache_size = prefix_cache_size
+        self.prefix_cache = OrderedDict()
+        # prompt_tokens - prefill_tokens 即复用past_key_values省下的prefill
+        self.stats = dict(requests=0, batches=0, prompt_tokens=0, prefill_tokens=0, images=0, image_cache_hits=0)
+
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def submit(self, request:dict) -> futures.Future:
+        future = futures.Future()
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        self.queue.put((request, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            try:
+                # 在batch_window内到达的请求一起推理
+                while len(batch) < self.max_batch_size:
+                    batch.append(self.queue.get(timeout=self.batch_window))
+            except queue.Empty:
+                pass
+            batch = [(request, future) for request, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.generate_batch([request for request, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _process_image(self, image) -> dict:
+        self.stats["images"] += 1
+        key = id(image)
+        if key in self.image_cache:
+            self.stats["image_cache_hits"] += 1
+            self.image_cache.move_to_end(key)
+            return self.image_cache[key][1]
+        image_inputs = dict(self.processor.image_processor(images=[_to_pil(image)], return_tensors="pt"))
+        self.image_cache[key] = (image, image_inputs)
+        while len(self.image_cache) > self.image_cache_size:
+            self.image_cache.popitem(last=False)
+        return image_inputs
+
+    def _prepare(self, request:dict):
+        """token ids and image tensors of one chat request"""
+        messages = request["messages"]
+        images = [part["image"] for message in messages if isinstance(message["content"], list)
+                  for part in message["content"] if part["type"] == "image"]
+        text = self.processor.apply_chat_template(messages, add_generation_prompt=True)
+        image_inputs = [self._process_image(image) for image in images]
+        if image_inputs and "image_grid_thw" not in image_inputs[0]:
+            # 不是Qwen2-VL式的图片token，交给processor整体处理，不走图片缓存
+            inputs = dict(self.processor(text=[text], images=[_to_pil(image) for image in images], return_tensors="pt"))
+            ids = inputs.pop("input_ids")[0].tolist()
+            inputs.pop("attention_mask", None)
+            return ids, inputs
+        # 按grid大小展开每张图的占位token，与Qwen2VLProcessor一致
+        image_token = getattr(self.processor, "image_token", QWEN_IMAGE_TOKEN)
+        parts = text.split(image_token)
+        if len(parts) != len(image_inputs) + 1:
+            raise ValueError(f"{len(parts) - 1} image tokens in the prompt but {len(image_inputs)} images")
+        merge_length = self.processor.image_processor.merge_size ** 2
+        text = parts[0] + "".join(image_token * int(inputs["image_grid_thw"].prod() // merge_length) + part
+                                  for inputs, part in zip(image_inputs, parts[1:]))
+        ids = self.tokenizer(text)["input_ids"]
+        if not image_inputs:
+            return ids, {}
+        return ids, {key: torch.cat([inputs[key] for inputs in image_inputs]) for key in image_inputs[0]}
+
+    def _positions(self, input_ids:torch.Tensor, attention_mask:torch.Tensor, image_inputs:dict):
+        if self.use_rope_index:
+            position_ids, _ = self.model.get_rope_index(input_ids, image_inputs.get("image_grid_thw"), None, attention_mask)
+            return position_ids
+        position_ids = attention_mask.long().cumsum(-1) - 1
+        return position_ids.masked_fill(attention_mask == 0, 1)
+
+    def _prefix_kv(self, prefix:list):
+        """past_key_values (batch 1) of ``prefix``, built from the longest cached prefix of it"""
+        key = tuple(prefix)
+        if key in self.prefix_cache:
+            self.prefix_cache.move_to_end(key)
+            return self.prefix_cache[key]
+        start, cache = 0, DynamicCache()
+        for cached_key in self.prefix_cache:
+            if len(cached_key) > start and key[:len(cached_key)] == cached_key:
+                start, cache = len(cached_key), copy.deepcopy(self.prefix_cache[cached_key])
+        self.stats["prefill_tokens"] += len(prefix) - start
+        input_ids = torch.tensor([prefix], device=self.device)
+        attention_mask = torch.ones_like(input_ids)
+        # 图片之前的纯文本，mrope的三个分量都是顺序位置
+        position_ids = self._positions(input_ids, attention_mask, {})[..., start:]
+        self.model(input_ids=input_ids[:, start:], attention_mask=attention_mask, position_ids=position_ids,
+                   past_key_values=cache, use_cache=True)
+        self.prefix_cache[key] = cache
+        while len(self.prefix_cache) > self.prefix_cache_size:
+            self.prefix_cache.popitem(last=False)
+        return cache
+
+    @torch.inference_mode()
+    def generate_batch(self, requests:List[dict]) -> list:
+        """run chat requests as one batch; results in the format of ``submit``"""
+        prepared = [self._prepare(request) for request in requests]
+        prompts = [ids for ids, _ in prepared]
+        self.stats["requests"] += len(requests)
+        self.stats["batches"] += 1
+        self.stats["prompt_tokens"] += sum(len(ids) for ids in prompts)
+
+        # 所有请求共享的、第一张图之前的文本前缀复用缓存的past_key_values
+        text_prefixes = []
+        for ids in prompts:
+            end = ids.index(self.image_token_id) if self.image_token_id in ids else len(ids)
+            text_prefixes.append(ids[:min(end, len(ids) - 1)])
+        prefix = _common_prefix(text_prefixes)
+        if len(prefix) >= self.min_prefix_len:
+            cache = copy.deepcopy(self._prefix_kv(prefix))
+            if len(prompts) > 1:
+                cache.batch_repeat_interleave(len(prompts))
+        else:
+            prefix, cache = [], DynamicCache()
+
+        # 后缀左侧padding: [prefix][pad][suffix]
+        suffixes = [ids[len(prefix):] for ids in prompts]
+        suffix_len = max(len(suffix) for suffix in suffixes)
+        self.stats["prefill_tokens"] += sum(len(suffix) for suffix in suffixes)
+        input_ids = torch.full((len(prompts), len(prefix) + suffix_len), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros_like(input_ids)
+        input_ids[:, :len(prefix)] = torch.tensor(prefix, dtype=torch.long)
+        attention_mask[:, :len(prefix)] = 1
+        for row, suffix in enumerate(suffixes):
+            input_ids[row, input_ids.shape[1] - len(suffix):] = torch.tensor(suffix, dtype=torch.long)
+            attention_mask[row, input_ids.shape[1] - len(suffix):] = 1
+        input_ids, attention_mask = input_ids.to(self.device), attention_mask.to(self.device)
+        image_inputs = {}
+        for _, inputs in prepared:
+            for key, value in inputs.items():
+                image_inputs.setdefault(key, []).append(value)
+        image_inputs = {key: torch.cat(values).to(self.device) for key, values in image_inputs.items()}
+        if "pixel_values" in image_inputs:
+            image_inputs["pixel_values"] = image_inputs["pixel_values"].to(self.model.dtype)
+        position_ids = self._positions(input_ids, attention_mask, image_inputs)[..., len(prefix):]
+        outputs = self.model(input_ids=input_ids[:, len(prefix):], attention_mask=attention_mask, position_ids=position_ids,
+                             past_key_values=cache, use_cache=True, **image_inputs)
+
+        # n个样本从同一次prefill展开
+        num_samples = [request.get("n", 1) for request in requests]
+        rows = torch.repeat_interleave(torch.arange(len(requests)), torch.tensor(num_samples)).to(self.device)
+        cache = outputs.past_key_values
+        if len(rows) != len(requests):
+            cache.reorder_cache(rows)
+        logits = outputs.logits[:, -1].float()[rows]
+        attention_mask = attention_mask[rows]
+        position_ids = position_ids[..., -1:][..., rows, :] if self.use_rope_index else position_ids[rows, -1:]
+        temperature = torch.tensor([float(request.get("temperature", 1.0)) for request in requests], device=self.device)[rows]
+        max_tokens = [int(request.get("max_tokens", 1024)) for request in requests for _ in range(request.get("n", 1))]
+
+        tokens = [[] for _ in rows]
+        logprobs = torch.zeros(len(rows), dtype=torch.float64, device=self.device)
+        finished = torch.zeros(len(rows), dtype=torch.bool, device=self.device)
+        for step in range(max(max_tokens)):
+            greedy = temperature <= 0
+            scores = torch.log_softmax(logits / torch.where(greedy, 1.0, temperature)[:, None], dim=-1)
+            sampled = torch.multinomial(scores.exp(), 1)[:, 0]
+            next_tokens = torch.where(greedy, scores.argmax(-1), sampled)
+            # 结束样本的EOS token也计入logprob，与vLLM的cumulative_logprob一致
+            logprobs += torch.where(finished, 0.0, scores.gather(-1, next_tokens[:, None])[:, 0].double())
+            for row, token in enumerate(next_tokens.tolist()):
+                if finished[row]:
+                    continue
+                if token in self.eos_token_ids:
+                    finished[row] = True
+                    continue
+                tokens[row].append(token)
+                if len(tokens[row]) >= max_tokens[row]:
+                    finished[row] = True
+            if finished.all():
+                break
+            next_tokens = next_tokens.masked_fill(finished, self.pad_token_id)
+            attention_mask = torch.cat([attention_mask, torch.ones_like(attention_mask[:, :1])], dim=-1)
+            position_ids = position_ids + 1
+            outputs = self.model(input_ids=next_tokens[:, None], attention_mask=attention_mask, position_ids=position_ids,
+                                 past_key_values=cache, use_cache=True)
+            cache = outputs.past_key_values
+            logits = outputs.logits[:, -1].float()
+
+        contents = self.tokenizer.batch_decode(tokens, skip_special_tokens=False)
+        results, row = [], 0
+        for request, n in zip(requests, num_samples):
+            if "n" in request:
+                results.append([(contents[row + k], float(logprobs[row + k])) for k in range(n)])
+            else:
+                results.append(contents[row])
+            row += n
+        return results
+
+
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def get_local_engine(model_path:str, **kwargs) -> LocalInferenceEngine:
+    """the process-wide engine of ``model_path``, so that agents running in threads batch together"""
+    with _ENGINES_LOCK:
+        if model_path not in _ENGINES:
+            _ENGINES[model_path] = LocalInferenceEngine(model_path, **kwargs)
+        return _ENGINES[model_path]
@@ -0,0 +1,111 @@
+'''
+Recipe prompts for RT2AGENT(instruction_type='recipe').
+
+The prompts only depend on data/assets/recipes and instructions.json, so they are generated offline
+into data/assets/recipe_prompts.json:
+
+    python -m mcabench.agents.vla.recipe_prompt
+
+``load_prompt_table()`` reads it once per process; if the file is missing the table is built in memory.
+'''
+import json
+import argparse
+from pathlib import Path
+from functools import lru_cache
+from collections import Counter
+
+from mcabench.utils.file_utils import load_json_file
+from mcabench.utils.recipe_index import get_recipe_index
+
+ASSETS_DIR = Path(__file__).parents[3]/"data"/"assets"
+INSTRUCTIONS_PATH = ASSETS_DIR/"instructions.json"
+PROMPT_TABLE_PATH = ASSETS_DIR/"recipe_prompts.json"
+PATTERN_HEAD = "\nArrange the materials in the crafting grid according to the following pattern: \n"
+
+
+def get_recipe_item_name(ingredient:dict):
+    item_name = ingredient.get("item")
+    if not item_name:
+        item_name = ingredient.get("tag")
+    return item_name
+
+
+def build_recipe_prompt(item_name:str, recipe_file:dict) -> str:
+    """the recipe part of the instruction for ``item_name``, "" for recipes that are not crafting"""
+    recipe_type = recipe_file.get("type",None)
+
+    prompt = ""
+    if not recipe_type:
+        return ""
+    elif recipe_type=="minecraft:crafting_shapeless":
+        prompt+=f"\nYou will need the following ingredients: \n"
+        ingredients = recipe_file.get("ingredients",None)
+        ingredients_list = []
+        for ingredient in ingredients:
+            ingredient_name = get_recipe_item_name(ingredient)
+            if not ingredient_name:
+                break
+            ingredients_list.append(ingredient_name[10:].replace("_"," "))
+        ingredients_dict = Counter(ingredients_list)
+        prompt += "".join(f"{number} {item}, " for item,number in ingredients_dict.items())
+        prompt += "\n"
+    elif recipe_type == "minecraft:crafting_shaped":
+        prompt+=PATTERN_HEAD
+        patterns = recipe_file.get("pattern",None)
+        if not patterns:
+            return ""
+        ingredients_dict = {ingredient_mark:get_recipe_item_name(value)[10:] for ingredient_mark,value in recipe_file.get("key",{}).items()}
+        prompt+="\n"
+        for pattern_line in patterns:
+            line = "".join(f" {'air' if pattern_mark==' ' else ingredients_dict.get(pattern_mark,'air')} |" for pattern_mark in pattern_line)
+            if line:
+                line = line[:-1] + "\n"
+            prompt += line
+        prompt +="\n"
+    else:
+        return ""
+    result_num = recipe_file.get("result",{}).get("count",1)
+    prompt += f"and get {result_num} {item_name.replace('_',' ')}. \n"
+    return prompt
+
+
+def build_prompt_table(recipe_index=None, prompt_library:dict=None) -> dict:
+    """{instruction_type: {key: prompt}}; "recipe" is keyed by env prompt for the hand-written recipes in
+    instructions.json and by item (recipe) name for every recipe file."""
+    recipe_index = recipe_index if recipe_index is not None else get_recipe_index()
+    prompt_library = prompt_library if prompt_library is not None else load_json_file(INSTRUCTIONS_PATH)
+    recipe_prompts = {}
+    for item_name in sorted(recipe_index.recipes):
+        recipe_prompts[item_name] = build_recipe_prompt(item_name, recipe_index.recipe(item_name))
+    for env_prompt, entry in prompt_library.items():
+        recipe = entry.get("recipe")
+        if recipe:
+            recipe_prompts[env_prompt] = PATTERN_HEAD + recipe[0]
+    return {"recipe": recipe_prompts}
+
+
+@lru_cache(maxsize=None)
+def load_prompt_table(table_path:Path=PROMPT_TABLE_PATH) -> dict:
+    if Path(table_path).exists():
+        return load_json_file(table_path)
+    return build_prompt_table()
+
+
+def lookup_recipe_prompt(env_prompt:str, table:dict=None) -> str:
+    """recipe prompt of a task text like "craft_item:oak_planks" """
+    recipe_prompts = (table if table is not None else load_prompt_table())["recipe"]
+    prompt = recipe_prompts.get(env_prompt)
+    if prompt is None:
+        item_name = env_prompt.replace(" ","_").split(":")[-1]
+        prompt = recipe_prompts.get(item_name,"")
+    return prompt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=str, default=str(PROMPT_TABLE_PATH))
+    args = parser.parse_args()
+    table = build_prompt_table()
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(table, file, ensure_ascii=False, indent=1, sort_keys=True)
+    print(f"{args.output}: {sum(len(prompts) for prompts in table.values())} prompts")
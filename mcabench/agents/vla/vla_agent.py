@@ -6,7 +6,9 @@ import random
 from typing import Literal
 import copy
 from pathlib import Path
-from collections import Counter
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter,deque
 import numpy as np
 from transformers import AutoTokenizer
 from minestudio.simulator.entry import MinecraftSim
@@ -14,6 +16,7 @@ from minestudio.simulator.entry import MinecraftSim
 from mcabench.agents.vla import load_model
 from mcabench.agents import action_mapping, base_agent,vlm_client
 from mcabench.utils.file_utils import load_json_file
+from mcabench.agents.vla import recipe_prompt
 
 #################
 # prompt
@@ -33,12 +36,30 @@ BASE_INSTRUCTION_TEMPLATE = [
     "I need you to craft {} right now.",
 ]
 
+def select_sample(chunks:list,logprobs:list=None,selection:Literal['vote','logprob']='vote',chunk_len:int=1)->int:
+    """index of the action chunk to execute among sampled candidates.
+    vote: the most frequent chunk (first ``chunk_len`` actions), ties broken by logprob, then by order;
+    logprob: the candidate with the highest summed logprob, falls back to vote without logprobs"""
+    has_logprobs = bool(logprobs) and all(logprob is not None for logprob in logprobs)
+    if selection == 'logprob' and has_logprobs:
+        return int(np.argmax(logprobs))
+    keys = [tuple((int(action["buttons"]),int(action["camera"])) for action in chunk[:chunk_len]) for chunk in chunks]
+    counts = Counter(keys)
+    best = max(counts.values())
+    candidates = [idx for idx,key in enumerate(keys) if counts[key]==best]
+    if has_logprobs:
+        return max(candidates,key=lambda idx:logprobs[idx])
+    return candidates[0]
+
+
 class RT2AGENT(vlm_client.VlMClient,base_agent.Agent):
     def __init__(self, model_path, base_url, system_prompt_mode, api_key="EMPTY",
                  LLM_backbone = "", VLM_backbone="",tokenizer_path="",
                  history_num=0,action_chunk_len=1, bpe=0,
                  instruction_type:Literal['simple','recipe','normal'] = 'normal',
                  temperature=0.5,max_tokens=1024,
+                 pipeline=False,pipeline_lead=1,
+                 num_samples=1,sample_selection:Literal['vote','logprob']='vote',
                  **kwargs):
         
         base_agent.Agent.__init__(self, agent_mode="rt2",**kwargs)
@@ -70,11 +91,10 @@ class RT2AGENT(vlm_client.VlMClient,base_agent.Agent):
                 trust_remote_code=True,
             )
             
-        self.action_tokenizer = action_mapping.OneActionTokenizer(tokenizer_type=self.LLM_backbone)
+        self.action_tokenizer = action_mapping.get_action_tokenizer(tokenizer_type=self.LLM_backbone)
         
         self.prompt_library = load_json_file(Path(__file__).parents[3]/"data"/"assets"/"instructions.json") #存储我写好的instructions
-        self.recipe_fold=Path(__file__).parents[3]/"data"/"assets"/"recipes" # 存储所有recipes的文件夹
-        self.recipes = dict()  #制作方案集合        
+        self.recipe_prompts = recipe_prompt.load_prompt_table() # 离线生成的recipe prompt表，进程内只加载一次
        
         self.actions = []
         self.action_chunk_len=action_chunk_len  # 一次返回一个action chunk
@@ -83,11 +103,42 @@ class RT2AGENT(vlm_client.VlMClient,base_agent.Agent):
         self.history = []
         
         self.instruction_type = instruction_type
+        
+        # 流水线：动作块快执行完时，用当前观测在后台线程请求下一个动作块
+        # 下一个动作块基于pipeline_lead步之前的观测，只有动作块比lead长时，这部分延迟才落在本来就开环执行的块内
+        if pipeline and action_chunk_len <= pipeline_lead:
+            raise ValueError(f"pipeline needs action_chunk_len > pipeline_lead, got {action_chunk_len} <= {pipeline_lead}")
+        self.pipeline = pipeline
+        self.pipeline_lead = pipeline_lead
+        self.executor = ThreadPoolExecutor(max_workers=1) if pipeline else None
+        self.pending = None
+        self.inference_time = 0.0
+        self.wait_time = 0.0
+        
+        # best-of-N：一次请求采样num_samples个动作块，按sample_selection选一个执行
+        if sample_selection not in {'vote','logprob'}:
+            raise ValueError(f"unknown sample selection {sample_selection}")
+        self.num_samples = num_samples
+        self.sample_selection = sample_selection
             
         self.set_processor_wrapper(model_name=self.VLM_backbone)
 
     def reset(self,env:MinecraftSim):
+        if self.pending is not None:
+            self.pending.cancel()
+            futures.wait([self.pending])
+            self.pending = None
         self.history = []
+        self.actions = []
+        self.inference_time = 0.0
+        self.wait_time = 0.0
+        self.reset_prompt_stats()
+        self.processor_wrapper.release_files()
+        
+    def inference_overlap(self)->float:
+        if not self.inference_time:
+            return 0.0
+        return max(0.0,1-self.wait_time/self.inference_time)
           
     def rule_based_instruction(self,env_prompt:str):
         item_name = env_prompt[11:].replace("_"," ")
@@ -107,83 +158,9 @@ class RT2AGENT(vlm_client.VlMClient,base_agent.Agent):
         instruction += "\n"
         return instruction
         
-    def get_recipe_item_name(self,ingredient:dict):
-        item_name = ingredient.get("item") 
-        if not item_name:
-            item_name = ingredient.get("tag") 
-        return item_name
-        
-    def create_recipe_prompt_from_library(self,item_name:str):
-        if item_name in self.recipes:
-            return self.recipes[item_name]
-        recipe_path = self.recipe_fold/f"{item_name}.json"
-        print(recipe_path)
-        if not recipe_path.exists():
-            self.recipes[item_name]= ""
-            return ""
-        recipe_file = load_json_file(recipe_path)
-        recipe_type = recipe_file.get("type",None)
-        
-        prompt = ""
-        if not recipe_type:
-            self.recipes[item_name]= ""
-            return ""
-        elif recipe_type=="minecraft:crafting_shapeless":
-            prompt+=f"\nYou will need the following ingredients: \n"
-            ingredients = recipe_file.get("ingredients",None)
-            ingredients_list = []
-            for ingredient in ingredients:
-                ingredient_name = self.get_recipe_item_name(ingredient)
-                if not ingredient_name:
-                    break
-                ingredients_list.append(ingredient_name[10:].replace("_"," "))
-            ingredients_dict = Counter(ingredients_list)
-            for item,number in ingredients_dict.items():
-                prompt += f"{number} {item}, "
-            prompt += "\n"
-        elif recipe_type == "minecraft:crafting_shaped":
-            prompt+="\nArrange the materials in the crafting grid according to the following pattern: \n"
-            patterns = recipe_file.get("pattern",None)
-            if not patterns:
-                return ""
-            ingredients = recipe_file.get("key",{})
-            ingredients_dict = {}
-            for ingredient_mark,value in ingredients.items():
-                ingredient_name = self.get_recipe_item_name(value)
-                ingredients_dict[ingredient_mark] = ingredient_name[10:]
-            prompt+="\n"
-            for pattern_line in patterns:
-                for pattern_mark in pattern_line:
-                    ingredients_name = ""
-                    if pattern_mark==" ":
-                        ingredients_name = "air"
-                    else:
-                        ingredients_name = ingredients_dict.get(pattern_mark,"air")
-                    prompt += f" {ingredients_name} |"
-                if prompt[-1]=='|':
-                    prompt = prompt[:-1] 
-                    prompt += "\n"
-            prompt +="\n"
-        else:
-            self.recipes[item_name]= ""
-            return ""
-        result_num = recipe_file.get("result",{}).get("count",1)
-        prompt += f"and get {result_num} {item_name.replace('_',' ')}. \n"
-        self.recipes[item_name]= prompt
-        return prompt
-        
     def create_recipe_prompt(self,env_prompt:str):
         """从原始的一句话转换成prompt """
-        prompt = ""
-        # else
-        recipe = self.prompt_library.get(env_prompt,{}).get("recipe")
-        if recipe:
-            prompt += "\nArrange the materials in the crafting grid according to the following pattern: \n"
-            prompt += recipe[0]
-        else:
-            item_name = env_prompt.replace(" ","_").split(":")[-1]
-            prompt += self.create_recipe_prompt_from_library(item_name,)
-        return prompt
+        return recipe_prompt.lookup_recipe_prompt(env_prompt,self.recipe_prompts)
         
     def create_detailed_instruction(self,env_prompt):
         prompt =None
@@ -212,30 +189,46 @@ class RT2AGENT(vlm_client.VlMClient,base_agent.Agent):
         return [item["text"] for item in env_cfg.task_conf]
         
     def forward(self,observations:list,instructions:list,verbos=False):
-        if self.actions:
-            if verbos:
-                print(self.actions)
-            if len(self.actions)>1:
-                return self.actions.pop(0)
+        if not self.actions:
+            wait_start = time.time()
+            if self.pending is not None:
+                actions = self.pending.result()
+                self.pending = None
             else:
-                action = self.actions[0]
-                self.actions = []
-                return action
+                actions = self._timed_infer(observations,instructions,verbos)
+            self.wait_time += time.time()-wait_start
+            len_action = min(self.action_chunk_len,len(actions))
+            self.actions = actions[:len_action]
+        elif verbos:
+            print(self.actions)
+        action = self.actions.pop(0)
+        if self.pipeline and len(self.actions) < self.pipeline_lead and self.pending is None:
+            # 下一个动作块基于当前观测，与env.step并行
+            self.pending = self.executor.submit(self._timed_infer,observations,instructions,verbos)
+        return action
+    
+    def _timed_infer(self,observations:list,instructions:list,verbos=False):
+        start = time.time()
+        actions = self.infer_chunk(observations,instructions,verbos)
+        self.inference_time += time.time()-start
+        return actions
+        
+    def infer_chunk(self,observations:list,instructions:list,verbos=False):
         messages = []
         if self.system_prompt:
             messages.append(self.processor_wrapper.create_system_prompt(system_prompt=self.system_prompt))
    
         image = self.processor_wrapper.create_image_input(observations[0]) 
+        # 每一帧只编码一次，历史中保存编码好的消息
+        image_message = self.processor_wrapper.encode_image_message(image)
 
-        detailed_instruction = self.create_detailed_instruction(instructions[0])
+        detailed_instruction = self.episode_prompt(instructions[0],lambda:self.create_detailed_instruction(instructions[0]))
         thought= self.create_thought(instructions[0]) if self.instruction_type =="recipe" else ""
 
         if self.history_num:
             if not self.history: #如果历史为空
-                self.history = [(image,self.action_tokenizer.null_token(),copy.copy(thought),0)]*self.history_num
-            new_history = [None]*self.history_num
-            new_history[:-1] = self.history[1:]
-            for hdx,(im, ac, past_thought,_) in enumerate(self.history):
+                self.history = deque([(image_message,self.action_tokenizer.null_token(),copy.copy(thought),0)]*self.history_num,maxlen=self.history_num)
+            for hdx,(im_message, ac, past_thought,_) in enumerate(self.history):
                 prompt_input = ""
                 if self.instruction_type == 'recipe':
                     prompt_input = "\nthought: " + past_thought + "\nobservation: "  #往上一个prompt上加上这一步的thought
@@ -244,7 +237,7 @@ class RT2AGENT(vlm_client.VlMClient,base_agent.Agent):
                 if not hdx: #hdx==0
                     prompt_input = detailed_instruction + prompt_input
                 #print(ac,prompt_input,)
-                messages.append(self.processor_wrapper.create_message_vllm(role="user",input_type="image",prompt=[prompt_input],image=[im]))
+                messages.append(self.processor_wrapper.create_message_vllm(role="user",input_type="image",prompt=[prompt_input],image=[im_message]))
                 messages.append(self.processor_wrapper.create_message_vllm(role="assistant",input_type="text",prompt=[ac],))
             
         prompt_input = ""
@@ -255,25 +248,31 @@ class RT2AGENT(vlm_client.VlMClient,base_agent.Agent):
         if not self.history_num:
             prompt_input = detailed_instruction + prompt_input
 
-        messages.append(self.processor_wrapper.create_message_vllm(role="user",input_type="image",prompt=[prompt_input],image=[image]))
+        messages.append(self.processor_wrapper.create_message_vllm(role="user",input_type="image",prompt=[prompt_input],image=[image_message]))
 
-        if_token_ids = True if self.use_vllm and self.LLM_backbone in {"qwen2_vl","llama-2","llama-3"} else False
+        if_token_ids = True if self.LLM_backbone in {"qwen2_vl","llama-2","llama-3"} else False
 
-        outputs,content = self.generate(messages=messages,verbos=verbos,if_token_ids=if_token_ids)
+        if self.num_samples > 1:
+            samples,contents,logprobs = self.generate(messages=messages,verbos=verbos,if_token_ids=if_token_ids,n=self.num_samples)
+            chunks = [self.action_tokenizer.decode(outputs) for outputs in samples]
+            idx = select_sample(chunks,logprobs,self.sample_selection,self.action_chunk_len)
+            content,actions = contents[idx],chunks[idx]
+            if verbos:
+                print(f"sample {idx}/{len(chunks)}, logprobs: {logprobs}")
+        else:
+            outputs,content = self.generate(messages=messages,verbos=verbos,if_token_ids=if_token_ids)
+            actions = None
         
         if verbos:
             print(content)
         
         if self.history_num:
-            new_history[-1] = (image,content,thought,self.history[-1][-1]+1)
-            self.history = new_history
+            self.history.append((image_message,content,thought,self.history[-1][-1]+1))
     
-        actions =  self.action_tokenizer.decode(outputs)
-
-        len_action = min(self.action_chunk_len,len(actions))
-        self.actions = actions[:len_action]
+        if actions is None:
+            actions =  self.action_tokenizer.decode(outputs)
         
         if verbos:
             print(actions)
         
-        return self.actions.pop(0)
+        return actions
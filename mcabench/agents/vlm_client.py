@@ -1,5 +1,8 @@
-from openai import OpenAI
+from openai import OpenAI,AsyncOpenAI
 from pathlib import Path
+import asyncio
+import threading
+from concurrent import futures
 import pathlib
 from typing import Union,Literal
 import base64
@@ -10,16 +13,118 @@ import cv2
 import requests
 import io
 import math
-import torch
-from transformers import AutoProcessor,AutoTokenizer,AutoModelForCausalLM,AutoModelForImageTextToText
+import uuid
+import os
+import shutil
+import weakref
+from collections import OrderedDict,deque
+from transformers import AutoTokenizer
 from mcabench.utils import file_utils
+from mcabench.agents import local_engine
 
 SYSTEM_PROMPTS = file_utils.load_json_file("mcabench/agents/system_prompt.json")
 
+
+def completion_result(chat_completion,request:dict):
+    """content of a chat completion; a list of (content, logprob) per choice when the request sets ``n``.
+    logprob is the summed token logprob, None if the server did not return logprobs."""
+    if "n" not in request:
+        return chat_completion.choices[0].message.content
+    results = []
+    for choice in chat_completion.choices:
+        logprob = None
+        if choice.logprobs is not None and choice.logprobs.content:
+            logprob = float(sum(token.logprob for token in choice.logprobs.content))
+        results.append((choice.message.content,logprob))
+    return results
+
+
+def prompt_segments(messages:list)->list:
+    """flatten chat messages into (kind, value) segments in the order the server tokenizes them"""
+    segments = []
+    for message in messages:
+        segments.append(("role",message["role"]))
+        content = message["content"]
+        if isinstance(content,str):
+            segments.append(("text",content))
+            continue
+        for part in content:
+            if part["type"]=="text":
+                segments.append(("text",part["text"]))
+            elif part["type"]=="image_url":
+                segments.append(("image",part["image_url"]["url"]))
+            else:
+                segments.append(("image",id(part["image"])))
+    return segments
+
+
+def shared_prefix(segments:list,last_segments:list)->tuple:
+    """(text chars, images) of the common prefix of two segment lists"""
+    chars,images = 0,0
+    for segment,last_segment in zip(segments,last_segments):
+        if segment == last_segment:
+            if segment[0]=="image":
+                images += 1
+            elif segment[0]=="text":
+                chars += len(segment[1])
+            continue
+        if segment[0]==last_segment[0]=="text":
+            chars += len(os.path.commonprefix([segment[1],last_segment[1]]))
+        break
+    return chars,images
+
+
+def chain_future(future:futures.Future,fn)->futures.Future:
+    """Return a future resolving to fn(future.result()), without blocking a thread on it."""
+    chained = futures.Future()
+    def _callback(done:futures.Future):
+        try:
+            chained.set_result(fn(done.result()))
+        except Exception as e:
+            chained.set_exception(e)
+    future.add_done_callback(_callback)
+    return chained
+
+
+class InferenceBroker:
+    """An AsyncOpenAI pool shared by many concurrent episodes.
+    
+    Each request is sent as soon as it arrives, over one connection pool; the vLLM server batches whatever is in
+    flight in the same scheduling step, so there is no client-side window. At most `max_inflight` requests are
+    open at once. Every caller awaits its own response, so outputs keep per-request order.
+    
+    It can be hosted in-process (`submit`, which runs an event loop in a daemon thread) or as a Ray async actor
+    (`generate`), in which case all Ray workers share it.
+    """
+    def __init__(self,api_key,base_url,max_inflight:int=64):
+        self.client = AsyncOpenAI(api_key=api_key,base_url=base_url,)
+        self.max_inflight = max_inflight
+        self._semaphore = None
+        self._loop = None
+        self._thread = None
+        
+    async def generate(self,request:dict)->str:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_inflight)
+        async with self._semaphore:
+            chat_completion = await self.client.chat.completions.create(**request)
+        return completion_result(chat_completion,request)
+    
+    def submit(self,request:dict)->futures.Future:
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever,daemon=True)
+            self._thread.start()
+        return asyncio.run_coroutine_threadsafe(self.generate(request),self._loop)
+
+
 class VlMClient:
     def __init__(self, api_key,base_url,temperature,max_tokens,
                  model_path,tokenizer_path="",
                  system_prompt_mode="",
+                 async_inference=False,inference_broker=None,
+                 image_transport="base64",
+                 prompt_layout:Literal["default","prefix_cache"]="default",
                  **kwargs):
         
         self.max_tokens = max_tokens
@@ -30,6 +135,16 @@ class VlMClient:
         self.tokenizer = None
         self.model = None
         self.use_vllm = True
+        # 异步推理：Ray actor句柄或进程内的InferenceBroker
+        self.inference_broker = inference_broker
+        self.image_transport = image_transport
+        # prefix_cache: 每个episode固定指令，稳定的部分在前，便于vLLM的prefix cache命中
+        if prompt_layout not in {"default","prefix_cache"}:
+            raise ValueError(f"unknown prompt layout {prompt_layout}")
+        self.prompt_layout = prompt_layout
+        self.episode_prompts = {}
+        self.last_segments = None
+        self.prefix_history = []
         
         self.system_prompt_mode = system_prompt_mode
         self.system_prompt = ""
@@ -51,74 +166,123 @@ class VlMClient:
             )
             models = self.client.models.list()
             self.model_name = models.data[0].id
+            if async_inference and self.inference_broker is None:
+                self.inference_broker = InferenceBroker(api_key=api_key,base_url=base_url)
         else:
+            # 进程内推理：同一进程的agent共享一个LocalInferenceEngine，请求像broker一样提交并合批
             self.use_vllm = False
-            model_path = model_path.lower().replace('-','_')
+            self.model_name = model_path.lower().replace('-','_')
             processor_config = dict(
                 do_rescale=False,
                 patch_size=14,
                 vision_feature_select_strategy="default"
             )
-            model_kwargs = dict(
-                torch_dtype="auto"
-            )
-            if 'qwen2_vl' in model_path:
-                model_kwargs["attn_implementation"] = "flash_attention_2"
-                model_kwargs["torch_dtype"] = torch.bfloat16
-            self.processor = AutoProcessor.from_pretrained(self.model_path, trust_remote_code=True, **processor_config)
-            self.model = AutoModelForImageTextToText.from_pretrained(self.model_path, trust_remote_code=True,
-                                                                     device_map="auto", **model_kwargs) 
+            engine = local_engine.get_local_engine(self.model_path, processor_kwargs=processor_config)
+            self.processor = engine.processor
+            self.model = engine.model
+            self.inference_broker = engine
             
         self.processor_wrapper = None
         
     def set_processor_wrapper(self,model_name:str=None):
         if not model_name:
             model_name = self.model_name
-        self.processor_wrapper = ProcessorWrapper(model_name=model_name, use_vllm=self.use_vllm)
+        self.processor_wrapper = ProcessorWrapper(model_name=model_name, use_vllm=self.use_vllm, image_transport=self.image_transport,
+                                                  history_num=getattr(self,"history_num",0))
+    
+    def close(self):
+        if self.processor_wrapper is not None:
+            self.processor_wrapper.close()
         
-    def generate(self,messages:list,verbos:bool=False,if_token_ids=False):
+    def episode_prompt(self,key,build):
+        """``build()``; with the prefix_cache layout it is built once per episode and reused"""
+        if self.prompt_layout != "prefix_cache":
+            return build()
+        if key not in self.episode_prompts:
+            self.episode_prompts[key] = build()
+        return self.episode_prompts[key]
+    
+    def reset_prompt_stats(self):
+        self.episode_prompts = {}
+        self.last_segments = None
+        self.prefix_history = []
+    
+    def prompt_prefix_stats(self)->dict:
+        """prefix shared by consecutive requests of this episode; the minimum is the prefix stable over the episode"""
+        if not self.prefix_history:
+            return {}
+        chars = [chars for chars,_ in self.prefix_history]
+        images = [images for _,images in self.prefix_history]
+        return dict(requests=len(self.prefix_history)+1,
+                    stable_prefix_chars=min(chars),mean_prefix_chars=sum(chars)/len(chars),
+                    stable_prefix_images=min(images))
+    
+    def _track_prefix(self,messages:list):
+        segments = prompt_segments(messages)
+        if self.last_segments is not None:
+            self.prefix_history.append(shared_prefix(segments,self.last_segments))
+        self.last_segments = segments
         
-        open_logprobs = False
-        if verbos:
-            open_logprobs = True
-        content = ""
-        if self.use_vllm:
-            #print(messages)
-            chat_completion = self.client.chat.completions.create(
-                messages=messages,
-                model=self.model_name,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-                logprobs = open_logprobs,
-                extra_body = {"skip_special_tokens":False}
-            )
-            #print(chat_completion)
-            content = chat_completion.choices[0].message.content
-            if if_token_ids:
-                outputs = self.tokenizer(content)["input_ids"]
-            else:
-                outputs = content
+    def _chat_request(self,messages:list,verbos:bool=False,n:int=None)->dict:
+        request = dict(
+            messages=messages,
+            model=self.model_name,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            logprobs = verbos,
+            extra_body = {"skip_special_tokens":False}
+        )
+        if n is not None:
+            # n个样本共享一次prefill；logprobs用于按似然挑选样本
+            request["n"] = n
+            request["logprobs"] = True
+        return request
+        
+    def _postprocess(self,content:str,if_token_ids=False):
+        if if_token_ids:
+            outputs = self.tokenizer(content)["input_ids"]
         else:
-            images = []
-            for message in messages:
-                for content in message["content"]:
-                    if content["type"]=="image":
-                        image = encode_image_to_pil(content["image"])
-                        images.append(image)
-                        
-            text_prompt = self.processor.apply_chat_template(messages, add_generation_prompt=True)
-            inputs = self.processor(
-                text=[text_prompt], images=images, padding=True, return_tensors="pt"
-            )
-            inputs = inputs.to("cuda")
-            output_ids = self.model.generate(**inputs, max_new_tokens=self.max_tokens-inputs.input_ids.shape[-1],temperature=self.temperature)
-            if if_token_ids:
-                outputs = [
-                    output_ids[len(input_ids) :].tolist()
-                    for input_ids, output_ids in zip(inputs.input_ids, output_ids)
-                ][0]
-            else:
-                raise AssertionError("DO NOT FINISH")
+            outputs = content
+        return outputs,content
+    
+    def _postprocess_samples(self,samples:list,if_token_ids=False):
+        outputs,contents,logprobs = [],[],[]
+        for content,logprob in samples:
+            output,content = self._postprocess(content,if_token_ids=if_token_ids)
+            outputs.append(output)
+            contents.append(content)
+            logprobs.append(logprob)
+        return outputs,contents,logprobs
+    
+    def generate_async(self,messages:list,verbos:bool=False,if_token_ids=False,n:int=None)->futures.Future:
+        """send the request through the inference broker, the returned future resolves to (outputs, content),
+        or to (outputs, contents, logprobs) lists when ``n`` is given"""
+        if self.inference_broker is None:
+            raise AssertionError("generate_async needs async_inference or an inference_broker")
+        self._track_prefix(messages)
+        request = self._chat_request(messages=messages,verbos=verbos,n=n)
+        if isinstance(self.inference_broker,(InferenceBroker,local_engine.LocalInferenceEngine)):
+            future = self.inference_broker.submit(request)
+        else:
+            future = self.inference_broker.generate.remote(request).future()
+        if n is not None:
+            return chain_future(future,lambda samples:self._postprocess_samples(samples,if_token_ids=if_token_ids))
+        return chain_future(future,lambda content:self._postprocess(content,if_token_ids=if_token_ids))
+        
+    def generate(self,messages:list,verbos:bool=False,if_token_ids=False,n:int=None):
+        """(outputs, content) of one completion; with ``n``, (outputs, contents, logprobs) lists of n completions
+        sampled from one request"""
+        if self.inference_broker is not None:
+            return self.generate_async(messages=messages,verbos=verbos,if_token_ids=if_token_ids,n=n).result()
+        self._track_prefix(messages)
+        #print(messages)
+        request = self._chat_request(messages=messages,verbos=verbos,n=n)
+        chat_completion = self.client.chat.completions.create(**request)
+        #print(chat_completion)
+        if n is not None:
+            return self._postprocess_samples(completion_result(chat_completion,request),if_token_ids=if_token_ids)
+        content = chat_completion.choices[0].message.content
+        outputs,content = self._postprocess(content,if_token_ids=if_token_ids)
         return outputs,content
 
 
@@ -283,27 +447,96 @@ def translate_cv2(image: Union[str, pathlib.PosixPath, np.ndarray, Image.Image])
 
     
 
+def save_image_to_ppm(image:Union[np.ndarray,Image.Image],file_path:Union[str,pathlib.Path]):
+    """write the raw RGB pixels behind a binary PPM header, no compression on the hot path"""
+    if isinstance(image, Image.Image):
+        image = np.asarray(image.convert("RGB") if image.mode != "RGB" else image)
+    height, width = image.shape[:2]
+    with open(file_path, "wb") as file:
+        file.write(f"P6 {width} {height} 255\n".encode("ascii"))
+        file.write(np.ascontiguousarray(image, dtype=np.uint8).tobytes())
+
+
 class ProcessorWrapper:
-    def __init__(self, model_name= "qwen2_vl",use_vllm=True):
+    def __init__(self, model_name= "qwen2_vl",use_vllm=True,
+                 image_transport:Literal["base64","file"]="base64",transport_dir:str="/dev/shm/mcabench",
+                 cache_size:int=16,transport_keep:int=None,history_num:int=0,max_inflight:int=2):
         self.use_vllm = use_vllm
         self.model_name = model_name.replace("-","_")
         self.image_factor = 28
         self.min_pixels = 4 * 28 * 28
         self.max_pixels = 1024 * 28 * 28  #16384 * 28 * 28
         self.max_ratio = 200
-
-    def get_image_message(self,source_data):
-        if self.use_vllm:
-            image_suffix = get_suffix(source_data)
-            image_message = {
-                    "type": "image_url",
-                    "image_url": { "url": f"data:image/{image_suffix};base64,{encode_image_to_base64(source_data)}"},
-                }
-        else:
-            image_message = {
+        # base64: jpeg+base64 data url; file: 原始像素写入本地(共享内存)文件，vLLM需要 --allowed-local-media-path
+        self.image_transport = image_transport
+        if self.image_transport not in {"base64","file"}:
+            raise ValueError(f"unknown image transport {image_transport}")
+        # 每个wrapper一个子目录，close/回收/进程退出时整个删除
+        self.transport_dir = Path(transport_dir) / f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.transport_cleanup = None
+        # 一个请求引用当前帧和history_num张历史帧，在途的每个请求多一张新帧，这些文件都不能删
+        min_keep = history_num + max_inflight
+        if transport_keep is None:
+            transport_keep = min_keep
+        elif transport_keep < min_keep:
+            raise ValueError(f"transport_keep {transport_keep} < history_num + max_inflight = {min_keep}, prompts would point to deleted files")
+        self.transport_keep = transport_keep
+        self.transport_files = deque()
+        # 已编码的图片消息，key为图片对象id；同时持有图片对象，保证id不会被复用
+        self.cache_size = cache_size
+        self.encoded_cache = OrderedDict()
+        
+    def encode_image_message(self,source_data):
+        """encode an image into a ready-to-send content block"""
+        if not self.use_vllm:
+            return {
                 "type": "image",
                 "image": source_data,
             }
+        if self.image_transport == "file" and isinstance(source_data, (np.ndarray, Image.Image)):
+            if self.transport_cleanup is None or not self.transport_cleanup.alive:
+                self.transport_dir.mkdir(parents=True, exist_ok=True)
+                self.transport_cleanup = weakref.finalize(self, shutil.rmtree, str(self.transport_dir), True)
+            file_path = self.transport_dir / f"{uuid.uuid4().hex}.ppm"
+            save_image_to_ppm(source_data, file_path)
+            self.transport_files.append(file_path)
+            while len(self.transport_files) > self.transport_keep:
+                self.transport_files.popleft().unlink(missing_ok=True)
+            return {
+                "type": "image_url",
+                "image_url": {"url": f"file://{file_path}"},
+            }
+        image_suffix = get_suffix(source_data)
+        return {
+                "type": "image_url",
+                "image_url": { "url": f"data:image/{image_suffix};base64,{encode_image_to_base64(source_data)}"},
+            }
+
+    def release_files(self):
+        """delete the transport files of this wrapper, e.g. on episode reset; cached messages pointing to them are dropped"""
+        if self.transport_files:
+            self.encoded_cache.clear()
+        while self.transport_files:
+            self.transport_files.popleft().unlink(missing_ok=True)
+    
+    def close(self):
+        """remove the transport directory; the wrapper can still be used and creates it again"""
+        self.release_files()
+        if self.transport_cleanup is not None:
+            self.transport_cleanup()
+
+    def get_image_message(self,source_data):
+        if isinstance(source_data, dict):
+            # 已经编码好的消息
+            return source_data
+        key = id(source_data)
+        if key in self.encoded_cache:
+            self.encoded_cache.move_to_end(key)
+            return self.encoded_cache[key][1]
+        image_message = self.encode_image_message(source_data)
+        self.encoded_cache[key] = (source_data, image_message)
+        while len(self.encoded_cache) > self.cache_size:
+            self.encoded_cache.popitem(last=False)
         return image_message
 
     def create_system_prompt(self,system_prompt:str=""):
@@ -360,3 +593,26 @@ class ProcessorWrapper:
         if "qwen2_vl" in self.model_name:
             image = fetch_image(image,factor=self.image_factor,min_pixels=self.min_pixels,max_pixels=self.max_pixels,max_ratio=self.max_ratio,)
         return image
+
+
+if __name__ == "__main__":
+    # 每一步图片编码的CPU开销：当前帧 + history_num 张历史帧
+    import time
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--history-num', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--transport-dir', type=str, default="/dev/shm/mcabench")
+    args = parser.parse_args()
+    
+    frames = [Image.fromarray(np.random.randint(0, 256, (360, 640, 3), dtype=np.uint8)) for _ in range(args.steps)]
+    for name, transport, cached in [("base64 (before)", "base64", False), ("base64 + cache", "base64", True), ("file + cache", "file", True)]:
+        wrapper = ProcessorWrapper(image_transport=transport, transport_dir=args.transport_dir)
+        encode = wrapper.get_image_message if cached else wrapper.encode_image_message
+        start = time.perf_counter()
+        for step in range(args.steps):
+            for image in frames[max(0, step - args.history_num):step + 1]:
+                encode(image)
+        cost = (time.perf_counter() - start) / args.steps * 1000
+        print(f"{name}: {cost:.2f} ms/step")
+        wrapper.close()
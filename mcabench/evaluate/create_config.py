@@ -11,7 +11,9 @@ import yaml
 from tqdm import tqdm
 import random
 import math
+from functools import lru_cache
 from mcabench.utils import file_utils
+from mcabench.utils.recipe_index import get_recipe_index
 from mcabench.minestudio_plus.models import CraftWorker
 
 
@@ -25,18 +27,29 @@ SOURCE_LIBRARY_DIR = Path(__file__).parents[2]/"data"/"source"
 
 def sample_recipe(test_type:str=Literal["craft","smelt"],recipes_path:Path=RECIPE_PATH,num:int=1000):
     recipes_files = []
-    recipe_index_path = recipes_path/"_type_index.json"
-    recipes_index = file_utils.load_json_file(recipe_index_path)
+    recipes_index = get_recipe_index(recipes_path,TAG_LIBRARY_PATH).by_type
     if test_type == "craft":
-        recipes_files.extend(recipes_index["minecraft:crafting_shaped"])
-        recipes_files.extend(recipes_index["minecraft:crafting_shapeless"])
+        recipes_files.extend(recipes_index.get("minecraft:crafting_shaped",[]))
+        recipes_files.extend(recipes_index.get("minecraft:crafting_shapeless",[]))
     elif test_type == "smelt":
-        recipes_files.extend(recipes_index["minecraft:smelting"])
+        recipes_files.extend(recipes_index.get("minecraft:smelting",[]))
     sample_num = min(num,len(recipes_files))
     recipe_names = random.choices(recipes_files,k=sample_num)
-    recipe_paths= [recipes_path / recipe_name for recipe_name in recipe_names]
+    recipe_paths= [recipes_path / f"{recipe_name}.json" for recipe_name in recipe_names]
     return recipe_paths
 
+@lru_cache(maxsize=None)
+def load_items_library(items_library_path:Path=ITEMS_LIBRARY_PATH)->dict:
+    items_library_dict = file_utils.load_json_file(items_library_path)["items"]
+    return {item["type"]:item for item in items_library_dict}
+
+def load_recipe(recipe_path:Path)->dict:
+    # 默认recipe目录下的从索引中取，其他路径仍直接读文件
+    recipe_path = Path(recipe_path)
+    if recipe_path.parent == RECIPE_PATH:
+        return get_recipe_index().recipe(recipe_path.stem)
+    return file_utils.load_json_file(recipe_path)
+
 def create_inventory(materials:dict,items_library:dict,result_num:int=1):  
     init_inventory = [] 
     for item,quantity in materials.items():
@@ -67,11 +80,10 @@ def create_craft_content(recipe_path, dis=False,
                          items_library_path:Path = ITEMS_LIBRARY_PATH,tag_library_path:Path=TAG_LIBRARY_PATH,
                          ):
     type_name = "craft"
-    recipe = file_utils.load_json_file(recipe_path)
+    recipe = load_recipe(recipe_path)
     
-    items_library_dict = file_utils.load_json_file(items_library_path)["items"]
-    items_library = {item["type"]:item for item in items_library_dict}
-    tag_library = file_utils.load_json_file(tag_library_path)
+    items_library = load_items_library(items_library_path)
+    recipe_index = get_recipe_index(RECIPE_PATH,tag_library_path)
     
     result_item = recipe["result"]["item"][len("minecraft:"):]
     result_num = 1
@@ -84,8 +96,8 @@ def create_craft_content(recipe_path, dis=False,
             item = item_info.get('item')[10:]
         else:
             tag_item = item_info.get('tag')
-            item_list = tag_library[tag_item]
-            item = random.choice(item_list)[10:]
+            item_list = recipe_index.tag_items(tag_item)
+            item = random.choice(item_list)
         if not item:
             raise AssertionError(item_info,item_list,item)
         return item
@@ -149,11 +161,10 @@ def create_smelt_content(recipe_path,dis=False,
                          tag_library_path:Path=TAG_LIBRARY_PATH,items_library_path = ITEMS_LIBRARY_PATH):
     
     type_name = "smelt"
-    recipe = file_utils.load_json_file(recipe_path)
+    recipe = load_recipe(recipe_path)
     
-    items_library_dict = file_utils.load_json_file(items_library_path)["items"]
-    items_library = {item["type"]:item for item in items_library_dict}
-    tag_library = file_utils.load_json_file(tag_library_path)
+    items_library = load_items_library(items_library_path)
+    recipe_index = get_recipe_index(RECIPE_PATH,tag_library_path)
     
     result_item = recipe["result"][10:]
     # 确定制造数量
@@ -166,8 +177,8 @@ def create_smelt_content(recipe_path,dis=False,
             item = item_info.get('item')[10:]
         else:
             tag_item = item_info.get('tag')
-            item_list = tag_library[tag_item]
-            item = random.choice(item_list)[10:]
+            item_list = recipe_index.tag_items(tag_item)
+            item = random.choice(item_list)
         return item
     
     materials[get_item_quantity(recipe.get('ingredient'))] = result_num
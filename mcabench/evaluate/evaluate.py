@@ -12,12 +12,14 @@ LastEditTime: 2025-04-03 20:16:48
 
 import argparse
 from rich import print,console
+from rich.table import Table
 from pathlib import Path
 import os
 import hydra
 from omegaconf import OmegaConf
 import ray
 import time
+from collections import deque
 
 from minestudio.simulator import MinecraftSim
 from minestudio.simulator.entry import CameraConfig
@@ -37,26 +39,20 @@ from minestudio.simulator.callbacks import (
 )
 from mcabench.minestudio_plus.models import CraftWorker,SmeltWorker
 from mcabench.evaluate import draw_utils
+from mcabench.evaluate.task_bundle import CFG_DIR,load_env_cfg,load_task_bundle
 from mcabench.utils import file_utils
-from mcabench.agents import agent_wrapper
+from mcabench.agents import agent_wrapper,vlm_client
 
-CFG_DIR = Path(__file__).parents[2]/"data"/"task_config"
-        
-
-def evaluate(video_path,evaluate_config:dict, agent_config:dict):
 
-    # 打开yaml config
-    env_cfg_path = CFG_DIR /  f"{evaluate_config['env_config']}.yaml"
-    base_cfg_path = env_cfg_path.parent / "base.yaml"
-    base_cfg = OmegaConf.load( base_cfg_path )
-    env_cfg = OmegaConf.load( env_cfg_path)
-    env_cfg = OmegaConf.merge(base_cfg, env_cfg)
-    
+def make_callbacks(video_path,evaluate_config:dict,env_cfg,task_bundle=None):
     # 写入callback
-    camera_cfg = CameraConfig(**env_cfg.camera_config)
     record_callback = RecordCallback(record_path=Path(video_path).parent, fps=evaluate_config["fps"], 
                                       show_actions= "action" in evaluate_config["demo"],show_instruction="instruction" in evaluate_config["demo"],
-                                      record_actions=evaluate_config["record"],record_infos=evaluate_config["record"],record_raw_observation=(not evaluate_config["demo"] or evaluate_config["record"]))  
+                                      show_annotations=bool(evaluate_config["demo"]),
+                                      record_actions=evaluate_config["record"],record_infos=evaluate_config["record"],record_raw_observation=(not evaluate_config["demo"] or evaluate_config["record"]),
+                                      stream_encode=evaluate_config["stream_record"],log_format=evaluate_config["record_format"],
+                                      info_keys=evaluate_config["record_info_keys"],measure_info_bytes=evaluate_config["verbos"],
+                                      max_frames=evaluate_config["max_frames"]+32)  
     callbacks = [
         FastResetCallback2(
             biomes=env_cfg.candidate_preferred_spawn_biome,
@@ -68,7 +64,10 @@ def evaluate(video_path,evaluate_config:dict, agent_config:dict):
         RewardsCallback(getattr(env_cfg,"reward_conf",None)),
         InitInventoryCallback(env_cfg.init_inventory,
                                 inventory_distraction_level=env_cfg.inventory_distraction_level,
-                                equip_distraction_level=getattr(env_cfg,"equip_distraction_level","normal")
+                                equip_distraction_level=getattr(env_cfg,"equip_distraction_level","normal"),
+                                max_wait_steps=evaluate_config["inventory_wait_steps"],max_wait_seconds=evaluate_config["inventory_wait_seconds"],
+                                readiness_log=evaluate_config["inventory_readiness_log"] or None,verbose=evaluate_config["verbos"],
+                                **(task_bundle.inventory_kwargs() if task_bundle is not None else {}),
                                 ),
         CommandsCallback(getattr(env_cfg,"command",[]),),
         record_callback,
@@ -77,8 +76,10 @@ def evaluate(video_path,evaluate_config:dict, agent_config:dict):
         callbacks.append(TeleportCallback(x=env_cfg.teleport.x, y=env_cfg.teleport.y, z=env_cfg.teleport.z,))
     if env_cfg.mobs:
         callbacks.append(SummonMobsCallback(env_cfg.mobs))
-    
-    # init env
+    return callbacks,record_callback
+
+def make_env(env_cfg,callbacks:list):
+    camera_cfg = CameraConfig(**env_cfg.camera_config)
     env =  MinecraftSim(
         action_type="env",
         seed=env_cfg.seed,
@@ -88,6 +89,21 @@ def evaluate(video_path,evaluate_config:dict, agent_config:dict):
         preferred_spawn_biome=getattr(env_cfg,"preferred_spawn_biome",None),
         callbacks = callbacks
     )
+    return env
+
+def sim_signature(env_cfg)->tuple:
+    """the world-level settings a MinecraftSim is booted with; episodes sharing it can reuse the same sim """
+    return (
+        env_cfg.seed,
+        tuple(env_cfg.origin_resolution),
+        tuple(env_cfg.resize_resolution),
+        tuple(sorted(OmegaConf.to_container(env_cfg.camera_config).items())),
+        getattr(env_cfg,"preferred_spawn_biome",None),
+    )
+
+def run_episode(env,env_cfg,record_callback,evaluate_config:dict,agent):
+    """reset the env with its current callbacks and roll out one episode, the env is not closed """
+    env.action_type = "env"  # pre_agent 使用env action
     obs, info = env.reset()
 
     # 把环境准备好
@@ -106,14 +122,12 @@ def evaluate(video_path,evaluate_config:dict, agent_config:dict):
             try:
                 frames,_,_ = pre_agent.open_crating_table_wo_recipe()
             except AssertionError as e:
-                env.close()
                 console.Console().log(f"error: {e}")
                 return False,-1
         elif need_furnace:
             try:
                 frames,_,_ = pre_agent.open_furnace_wo_recipe()
             except AssertionError as e:
-                env.close()
                 console.Console().log(f"error: {e}")
                 return False,-1
         else:
@@ -123,7 +137,6 @@ def evaluate(video_path,evaluate_config:dict, agent_config:dict):
                 
     record_callback.forget()
 
-    agent = agent_wrapper.make_agent(**agent_config)
     env.action_type = agent.action_type
     agent.reset(env=env)
 
@@ -142,7 +155,11 @@ def evaluate(video_path,evaluate_config:dict, agent_config:dict):
             success = (True,i)
             break   
         
-    print(f"FPS: {success[1]/(time.time()-start_time)}")
+    print(f"FPS: {success[1]/(time.time()-start_time)}, inference overlap: {agent.inference_overlap():.1%}")
+    prefix_stats = agent.prompt_prefix_stats()
+    if prefix_stats:
+        print(f"prompt prefix ({agent.prompt_layout}): stable {prefix_stats['stable_prefix_chars']} chars + {prefix_stats['stable_prefix_images']} images, "
+              f"mean shared {prefix_stats['mean_prefix_chars']:.0f} chars over {prefix_stats['requests']} requests")
     # sample another 30 steps if success
     if success[0]:
         for i in range(20):
@@ -151,70 +168,244 @@ def evaluate(video_path,evaluate_config:dict, agent_config:dict):
             obs, reward, terminated, truncated, info = env.step(action)
     # 最后一帧
     agent.show(record_callback)
-    env.close()
+    return success
+
+def evaluate(video_path,evaluate_config:dict, agent_config:dict, task_bundle=None):
+
+    env_cfg = task_bundle.env_cfg(evaluate_config['env_config']) if task_bundle is not None else load_env_cfg(evaluate_config['env_config'])
+    callbacks,record_callback = make_callbacks(video_path,evaluate_config,env_cfg,task_bundle)
+    
+    # init env
+    env = make_env(env_cfg,callbacks)
+    agent = agent_wrapper.make_agent(**agent_config)
+    try:
+        success = run_episode(env,env_cfg,record_callback,evaluate_config,agent)
+    finally:
+        env.close()
+        agent.close()
     return success
 
 @ray.remote
-def evaluate_wrapper(video_path,evaluate_config,agent_config):
-    success = evaluate(video_path=video_path,evaluate_config=evaluate_config,agent_config=agent_config)
+class SimulatorActor:
+    """A long-lived worker holding one MinecraftSim and one agent.
+    
+    Episodes are rolled out one after another on the same sim: the callback list is swapped for every task and
+    FastResetCallback2 turns the reset into a few commands, so the JVM/world is only booted again when the world
+    settings (seed, resolution, camera, biome) change.
+    """
+    def __init__(self,agent_config:dict,task_bundle=None):
+        self.agent_config = agent_config
+        self.task_bundle = task_bundle
+        self.agent = None
+        self.env = None
+        self.signature = None
+        self.boot_num = 0
+        
+    def _prepare_env(self,env_cfg,callbacks:list):
+        signature = sim_signature(env_cfg)
+        if self.env is not None and signature == self.signature:
+            self.env.callbacks = callbacks
+            return self.env
+        self.close()
+        self.env = make_env(env_cfg,callbacks)
+        self.signature = signature
+        self.boot_num += 1
+        return self.env
+    
+    def _finish_episode(self):
+        # 代替env.close()，让record等callback保存本轮结果
+        for callback in self.env.callbacks:
+            callback.before_close(self.env)
+        self.env.callbacks = []
+    
+    def evaluate(self,video_path,evaluate_config:dict):
+        env_cfg = self.task_bundle.env_cfg(evaluate_config['env_config']) if self.task_bundle is not None else load_env_cfg(evaluate_config['env_config'])
+        callbacks,record_callback = make_callbacks(video_path,evaluate_config,env_cfg,self.task_bundle)
+        env = self._prepare_env(env_cfg,callbacks)
+        if self.agent is None:
+            self.agent = agent_wrapper.make_agent(**self.agent_config)
+        try:
+            success = run_episode(env,env_cfg,record_callback,evaluate_config,self.agent)
+            self._finish_episode()
+        except Exception:
+            # 模拟器状态未知，下一个episode重新启动
+            self.close()
+            raise
+        member_id = video_path.split("/")[-1].split(".")[0]
+        return success[0],success[1],member_id
+    
+    def close(self):
+        if self.agent is not None:
+            self.agent.close()
+        if self.env is not None:
+            self.env.close()
+        self.env = None
+        self.signature = None
+
+@ray.remote
+def evaluate_wrapper(video_path,evaluate_config,agent_config,task_bundle=None):
+    success = evaluate(video_path=video_path,evaluate_config=evaluate_config,agent_config=agent_config,task_bundle=task_bundle)
     member_id = video_path.split("/")[-1].split(".")[0]
     return success[0],success[1],member_id
 
-def multi_evaluate(args,agent_config,evaluate_config):
-    
-    model_ref_name = args.model_path.split('/')[-1]
+def resolve_tasks(env_configs:list=None,task_globs:list=None,task_list:str="")->list:
+    """collect env_config names (e.g. craft/oak_planks) from explicit names, globs under CFG_DIR and a list file """
+    tasks = list(env_configs or [])
+    for task_glob in task_globs or []:
+        cfg_paths = sorted(CFG_DIR.glob(f"{task_glob}.yaml"))
+        tasks.extend(cfg_path.relative_to(CFG_DIR).with_suffix("").as_posix() for cfg_path in cfg_paths if cfg_path.stem != "base")
+    if task_list:
+        with open(task_list, "r", encoding="utf-8") as txt_file:
+            for line in txt_file:
+                # list.txt 中含有分隔行，只保留存在的yaml
+                line = line.strip()
+                if line and (CFG_DIR / f"{line}.yaml").exists() and Path(line).name != "base":
+                    tasks.append(line)
+    return list(dict.fromkeys(tasks))
+
+def get_model_ref_name(model_path:str):
+    model_ref_name = model_path.split('/')[-1]
     if "checkpoint" in model_ref_name:
         checkpoint_num = model_ref_name.split("-")[-1]
-        model_base_name = args.model_path.split('/')[-2]
+        model_base_name = model_path.split('/')[-2]
         model_ref_name = f"{model_base_name}-{checkpoint_num}"
-    
-    video_fold  = os.path.join(args.video_main_fold, f"{model_ref_name}-{args.env_config.split('/')[-1]}") 
-    if not os.path.exists(video_fold):
-        Path(video_fold).mkdir(parents=True,exist_ok=True)
-    
-    video_log_path = os.path.join(video_fold,"end.json") 
-    resultss = file_utils.load_json_file(video_log_path,data_type="list")
-
-    total_ids = [i for i in range(args.workers)]
-    done_ids = [results[2] for results in resultss]
-    undone_ids = [id for id in total_ids if str(id) not in done_ids]
+    return model_ref_name
 
-    if not undone_ids:
-        return
+class EpisodeScheduler:
+    """Keep `slot_num` episodes in flight over the whole sweep and refill a slot as soon as one finishes.
     
-    ray.init()
-    roll = len(undone_ids) // args.split_number + (1 if len(undone_ids) % args.split_number != 0 else 0)
-    for i in range(roll):
-        part_undone_ids = undone_ids[i*args.split_number:min((i+1)*args.split_number, len(undone_ids))]
-        result_ids = [evaluate_wrapper.remote(video_path=os.path.join(video_fold,str(i),f"{i}.mp4"),evaluate_config=evaluate_config,agent_config=agent_config) for i in part_undone_ids]
-        futures = result_ids
+    Jobs are (env_config, episode id) pairs from any number of tasks; each task keeps its own end.json.
+    Ray stays up until every job is done.
+    """
+    def __init__(self,slot_num:int,agent_config:dict,evaluate_config:dict,sim_pool:bool=False):
+        self.slot_num = slot_num
+        self.agent_config = agent_config
+        self.evaluate_config = evaluate_config
+        self.sim_pool = sim_pool
+        self.tasks = {}
+        self.jobs = deque()
+        self.task_bundle = None  # ray.put的TaskBundle，所有worker共享
+        
+    def add_task(self,env_config:str,video_fold:str,episode_num:int):
+        Path(video_fold).mkdir(parents=True,exist_ok=True)
+        video_log_path = os.path.join(video_fold,"end.json") 
+        resultss = file_utils.load_json_file(video_log_path,data_type="list")
+        done_ids = [results[2] for results in resultss]
+        undone_ids = [id for id in range(episode_num) if str(id) not in done_ids]
+        self.tasks[env_config] = dict(video_fold=video_fold,video_log_path=video_log_path,resultss=resultss,failures=[])
+        self.jobs.extend((env_config,id) for id in undone_ids)
         
-        while len(futures) > 0:
-            ready_futures, rest_futures = ray.wait(futures,timeout=24*60*60)
-            results = ray.get(ready_futures,timeout=60*60)  # Retrieve all results
-            resultss.extend(results)
-            # 写入日志文件
-            file_utils.dump_json_file(resultss,video_log_path,if_backup=False)
-            print(f"part frames IDs: {results} done!")
-            futures = rest_futures
+    def _submit(self,job:tuple,actor=None):
+        env_config,id = job
+        video_fold = self.tasks[env_config]["video_fold"]
+        video_path = os.path.join(video_fold,str(id),f"{id}.mp4")
+        evaluate_config = dict(self.evaluate_config,env_config=env_config)
+        if actor is not None:
+            return actor.evaluate.remote(video_path=video_path,evaluate_config=evaluate_config)
+        return evaluate_wrapper.remote(video_path=video_path,evaluate_config=evaluate_config,agent_config=self.agent_config,task_bundle=self.task_bundle)
         
+    def run(self):
+        if not self.jobs:
+            return
+        ray.init()
+        self.task_bundle = ray.put(load_task_bundle(list(self.tasks),cache_dir=self.evaluate_config.get("task_bundle_cache")))
+        if self.agent_config.get("async_inference") and self.agent_config.get("base_url"):
+            # 所有worker共享一个AsyncOpenAI连接池，并发请求由vLLM合批
+            broker = ray.remote(vlm_client.InferenceBroker).options(max_concurrency=1000).remote(
+                api_key=self.agent_config.get("api_key","EMPTY"),base_url=self.agent_config["base_url"])
+            self.agent_config = dict(self.agent_config,inference_broker=broker)
+        in_flight = {}  # future -> (job, actor)
+        idle_actors = deque()
+        if self.sim_pool:
+            idle_actors.extend(SimulatorActor.remote(self.agent_config,self.task_bundle) for _ in range(min(self.slot_num,len(self.jobs))))
+        
+        def fill_slots():
+            while self.jobs and len(in_flight) < self.slot_num:
+                actor = idle_actors.popleft() if self.sim_pool else None
+                job = self.jobs.popleft()
+                in_flight[self._submit(job,actor)] = (job,actor)
+        
+        fill_slots()
+        while in_flight:
+            ready_futures, _ = ray.wait(list(in_flight),num_returns=1,timeout=24*60*60)
+            for future in ready_futures:
+                (env_config,id),actor = in_flight.pop(future)
+                try:
+                    results = ray.get(future,timeout=60*60)
+                except ray.exceptions.RayActorError as e:
+                    console.Console().log(f"[red]{env_config} episode {id} lost its worker[/red]: {e}")
+                    actor = SimulatorActor.remote(self.agent_config,self.task_bundle) if self.sim_pool else None
+                    self.tasks[env_config]["failures"].append((id,"worker lost"))
+                    results = None
+                except ray.exceptions.RayTaskError as e:
+                    console.Console().log(f"[red]{env_config} episode {id} failed[/red]: {e}")
+                    self.tasks[env_config]["failures"].append((id,type(getattr(e,"cause",None) or e).__name__))
+                    results = None
+                if actor is not None:
+                    idle_actors.append(actor)
+                if results is not None:
+                    task = self.tasks[env_config]
+                    task["resultss"].append(results)
+                    # 写入日志文件
+                    file_utils.dump_json_file(task["resultss"],task["video_log_path"],if_backup=False)
+                    print(f"{env_config} frames IDs: {results} done!")
+            fill_slots()
+        
+        if self.sim_pool:
+            ray.get([actor.close.remote() for actor in idle_actors])
         ray.shutdown()
         
-    draw_utils.show_success_rate(resultss,os.path.join(video_fold,"image.png") )
+        for task in self.tasks.values():
+            if task["resultss"]:
+                draw_utils.show_success_rate(task["resultss"],os.path.join(task["video_fold"],"image.png") )
+        self.report_failures()
+        
+    def report_failures(self) -> dict:
+        """Print the episodes that failed in this run, per task, and return {env_config: [(id, reason), ...]}."""
+        failures = {env_config:task["failures"] for env_config,task in self.tasks.items() if task["failures"]}
+        if not failures:
+            return failures
+        table = Table(title=f"failed episodes ({sum(len(v) for v in failures.values())})")
+        table.add_column("task")
+        table.add_column("failed",justify="right")
+        table.add_column("episodes")
+        for env_config,task_failures in failures.items():
+            table.add_row(env_config,str(len(task_failures)),", ".join(f"{id} ({reason})" for id,reason in task_failures))
+        console.Console().print(table)
+        return failures
+
+def multi_evaluate(args,agent_config,evaluate_config):
+    
+    model_ref_name = get_model_ref_name(args.model_path)
+    scheduler = EpisodeScheduler(slot_num=args.split_number,agent_config=agent_config,evaluate_config=evaluate_config,sim_pool=args.sim_pool)
+    for env_config in args.env_config:
+        video_fold  = os.path.join(args.video_main_fold, f"{model_ref_name}-{env_config.split('/')[-1]}") 
+        scheduler.add_task(env_config=env_config,video_fold=video_fold,episode_num=args.workers)
+    scheduler.run()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--workers', type=int, default=1) 
     parser.add_argument('--split-number', type=int, default=5) 
-    parser.add_argument('--env-config',"-e", type=str,) 
+    parser.add_argument('--sim-pool', action="store_true")
+    parser.add_argument('--env-config',"-e", type=str, nargs="+") 
+    parser.add_argument('--task-glob', type=str, nargs="+")
+    parser.add_argument('--task-list', type=str, default="")
     parser.add_argument('--agent-mode', type=str, default="rt2")
     parser.add_argument('--system-prompt-mode', type=str,default="")
     parser.add_argument('--video-main-fold',type=str)
     parser.add_argument('--max-frames', type=int, default=200) 
     parser.add_argument('--verbos', type=bool, default=False)
-    parser.add_argument('--demo', type=str, default="") 
+    parser.add_argument('--demo', type=str, default="", help="demo video overlays, any of: action,instruction; any non-empty value also draws the CoA thought overlay") 
     parser.add_argument('--record', type=bool, default=False)
+    parser.add_argument('--stream-record', action="store_true")
+    parser.add_argument('--record-format', type=str, default="json", choices=["json","npz"])
+    parser.add_argument('--record-info-keys', type=str, nargs="+")
     parser.add_argument('--fps',type=int)
+    parser.add_argument('--inventory-wait-steps', type=int, default=300)
+    parser.add_argument('--inventory-wait-seconds', type=float, default=60)
+    parser.add_argument('--inventory-readiness-log', type=str, default="")
+    parser.add_argument('--task-bundle-cache', type=str, default="")
     
     parser.add_argument('--model-path', type=str)
     parser.add_argument('--LLM_backbone', type=str,default="")
@@ -226,9 +417,19 @@ if __name__ == "__main__":
     parser.add_argument('--temperature','-t',type=float, default=0.7)
     parser.add_argument('--history-num',type=int, default=0)
     parser.add_argument('--action-chunk-len',type=int, default=1)
+    parser.add_argument('--async-inference',action="store_true")
+    parser.add_argument('--pipeline',action="store_true",
+                        help="request the next action chunk in the background one step before the current chunk ends; "
+                             "that chunk is planned from an observation one step stale, needs --action-chunk-len > 1")
+    parser.add_argument('--image-transport',type=str, default="base64")
+    parser.add_argument('--num-samples',type=int, default=1)
+    parser.add_argument('--sample-selection',type=str, default="vote", choices=["vote","logprob"])
+    parser.add_argument('--prompt-layout',type=str, default="default", choices=["default","prefix_cache"])
 
     args = parser.parse_args()
-
+    args.env_config = resolve_tasks(args.env_config,args.task_glob,args.task_list)
+    if not args.env_config:
+        raise AssertionError("no task found, set --env-config, --task-glob or --task-list")
 
     if not args.base_url:
         args.base_url=None
@@ -245,25 +446,34 @@ if __name__ == "__main__":
         LLM_backbone = args.LLM_backbone,
         VLM_backbone = args.VLM_backbone,
         tokenizer_path = args.tokenizer_path,
-        
+        async_inference = args.async_inference,
+        pipeline = args.pipeline,
+        image_transport = args.image_transport,
+        num_samples = args.num_samples,
+        sample_selection = args.sample_selection,
+        prompt_layout = args.prompt_layout,
     )
     evaluate_config = dict(
-        env_config = args.env_config,
         max_frames = args.max_frames,
         verbos = args.verbos,
         demo=args.demo,
         record = args.record,
+        stream_record = args.stream_record,
+        record_format = args.record_format,
+        record_info_keys = args.record_info_keys,
+        inventory_wait_steps = args.inventory_wait_steps,
+        inventory_wait_seconds = args.inventory_wait_seconds,
+        inventory_readiness_log = args.inventory_readiness_log,
+        task_bundle_cache = args.task_bundle_cache,
         fps=args.fps
     )
     
     if args.workers==0:
         evaluate_config["verbos"] = True
-        video_path = f"{args.model_path.split('/')[-1]}-{args.env_config.split('/')[-1]}.mp4"
-        evaluate(video_path=video_path,evaluate_config = evaluate_config, agent_config=agent_config)
-    elif args.workers==1:
-        video_path = f"{args.model_path.split('/')[-1]}-{args.env_config.split('/')[-1]}.mp4"
-        evaluate(video_path=video_path,evaluate_config = evaluate_config,agent_config=agent_config)
+    if args.workers<=1:
+        task_bundle = load_task_bundle(args.env_config,cache_dir=args.task_bundle_cache)
+        for env_config in args.env_config:
+            video_path = f"{args.model_path.split('/')[-1]}-{env_config.split('/')[-1]}.mp4"
+            evaluate(video_path=video_path,evaluate_config = dict(evaluate_config,env_config=env_config), agent_config=agent_config, task_bundle=task_bundle)
     elif args.workers>1:
-        multi_evaluate(args,agent_config=agent_config,evaluate_config=evaluate_config)
-        
-    
+        multi_evaluate(args,agent_config=agent_config,evaluate_config=evaluate_config)
\ No newline at end of file
@@ -0,0 +1,101 @@
+'''
+Precompiled task bundle.
+
+Everything an episode needs before the sim starts is resolved once per sweep: the merged
+``base.yaml`` + task yaml of every task, the candidate quantities of the ``init_inventory``
+conditions, and the item and equipment libraries used by InitInventoryCallback. The bundle is
+a plain picklable object; it is shipped to workers with ``ray.put`` and can be cached on disk
+with ``load_task_bundle(..., cache_dir=...)``, so per-episode setup does no yaml/json parsing.
+'''
+import hashlib
+import pickle
+from pathlib import Path
+from typing import List
+from omegaconf import OmegaConf
+from rich import console
+
+from mcabench.minestudio_plus.simulator.callbacks.init_inventory import (
+    load_items_library,
+    load_equipments_library,
+    parse_quantity_candidates,
+    EQUIPMENTS_FILE_PATH,
+)
+
+CFG_DIR = Path(__file__).parents[2]/"data"/"task_config"
+
+
+def load_env_cfg(env_config:str):
+    # 打开yaml config
+    env_cfg_path = CFG_DIR /  f"{env_config}.yaml"
+    base_cfg_path = env_cfg_path.parent / "base.yaml"
+    base_cfg = OmegaConf.load( base_cfg_path )
+    env_cfg = OmegaConf.load( env_cfg_path)
+    env_cfg = OmegaConf.merge(base_cfg, env_cfg)
+    return env_cfg
+
+
+class TaskBundle:
+    """Resolved env configs plus the shared InitInventoryCallback libraries of one sweep."""
+    def __init__(self, env_configs:List[str]):
+        self.env_cfgs = {}
+        self.items_library = load_items_library()
+        self.equipments_library = load_equipments_library()
+        self.quantity_candidates = {}  # {(condition, stackSize): candidates}
+        for env_config in dict.fromkeys(env_configs):
+            # 存成普通dict，pickle比DictConfig小且快
+            env_cfg = OmegaConf.to_container(load_env_cfg(env_config), resolve=True)
+            self.env_cfgs[env_config] = env_cfg
+            for item_dict in env_cfg.get("init_inventory") or []:
+                quantity, item_type = item_dict.get("quantity"), item_dict.get("type")
+                if isinstance(quantity, str) and quantity != "random" and item_type in self.items_library:
+                    stack_size = int(self.items_library[item_type]["stackSize"])
+                    self.quantity_candidates[(quantity, stack_size)] = parse_quantity_candidates(quantity, stack_size)
+
+    def __contains__(self, env_config:str):
+        return env_config in self.env_cfgs
+
+    def env_cfg(self, env_config:str):
+        if env_config not in self.env_cfgs:
+            # 不在bundle中的任务退化为直接读yaml
+            return load_env_cfg(env_config)
+        return OmegaConf.create(self.env_cfgs[env_config])
+
+    def inventory_kwargs(self) -> dict:
+        """keyword arguments of InitInventoryCallback that replace its own file loading"""
+        return dict(items_library=self.items_library,
+                    equipments_library=self.equipments_library,
+                    quantity_candidates=self.quantity_candidates)
+
+
+def _bundle_key(env_configs:List[str]) -> str:
+    # 任务名 + yaml/装备文件的修改时间，任一文件变化都会重新编译
+    digest = hashlib.sha1()
+    paths = [EQUIPMENTS_FILE_PATH]
+    for env_config in sorted(set(env_configs)):
+        env_cfg_path = CFG_DIR / f"{env_config}.yaml"
+        paths += [env_cfg_path, env_cfg_path.parent / "base.yaml"]
+        digest.update(env_config.encode())
+    for path in dict.fromkeys(paths):
+        stat = path.stat() if path.exists() else None
+        digest.update(f"{path}:{stat.st_mtime_ns if stat else 0}:{stat.st_size if stat else 0}".encode())
+    return digest.hexdigest()[:16]
+
+
+def load_task_bundle(env_configs:List[str], cache_dir:str=None) -> TaskBundle:
+    """Compile a TaskBundle, or load it from ``cache_dir/task_bundle_{key}.pkl`` when the inputs are unchanged."""
+    if not cache_dir:
+        return TaskBundle(env_configs)
+    cache_path = Path(cache_dir) / f"task_bundle_{_bundle_key(env_configs)}.pkl"
+    if cache_path.exists():
+        try:
+            with cache_path.open("rb") as file:
+                return pickle.load(file)
+        except Exception as e:
+            console.Console().log(f"[red]broken task bundle cache {cache_path}[/red]: {e}")
+    bundle = TaskBundle(env_configs)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    with tmp_path.open("wb") as file:
+        pickle.dump(bundle, file, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp_path.replace(cache_path)
+    return bundle
@@ -12,6 +12,7 @@ from typing import (
 )
 from minestudio.simulator.entry import MinecraftSim
 from mcabench.minestudio_plus.models.shell.gui_agent import GUIWorker
+from mcabench.utils.recipe_index import get_recipe_index
 
 def random_dic(dicts):
     dict_key_ls = list(dicts.keys())
@@ -44,37 +45,22 @@ class CraftWorker(GUIWorker):
         # recipe_name = "crafting_table.json"
         try:
             # is item/tag
-            is_tag = False
-            cur_path = os.path.abspath(os.path.dirname(__file__))
-            root_path = cur_path[:cur_path.find('minestudio')]
-            relative_path = os.path.join("assets/tag_items.json")
-            tag_json_path = os.path.join(root_path, relative_path)
-            with open(tag_json_path) as file:
-                tag_info = json.load(file)
-            for key in tag_info:
-                if key[10:] == target:  #minecraft:crafting_table 去掉前面10个词
-                    is_tag = True
+            recipe_index = get_recipe_index()
+            is_tag = recipe_index.is_tag(target)
 
             # open recipe one by one: only shapeless crafting like oak_planks        
             if is_tag:
                 enough_material = False
                 enough_material_target = 'none'
-                item_list = tag_info['minecraft:'+target]
+                item_list = recipe_index.tag_items(target)
 
-                for item in item_list:
-                    subtarget = item[10:]
-                
-                    
-                    recipe_path = recipe_name if recipe_name is not None else subtarget + '.json'
-                    relative_path = os.path.join("assets/recipes", recipe_path)
-                    recipe_json_path = os.path.join(root_path, relative_path)
-                    with open(recipe_json_path) as file:
-                        recipe_info = json.load(file)
+                for subtarget in item_list:
+                    recipe_info = recipe_index.recipe(recipe_name if recipe_name is not None else subtarget)
                     need_table = self.crafting_type(recipe_info)
 
                     # find materials(shapeless) like oak_planks
                     ingredients = recipe_info.get('ingredients')
-                    random.shuffle(ingredients)
+                    ingredients = random.sample(ingredients, len(ingredients))  # recipe是共享的，不能原地打乱
                     items = dict()
                     items_type = dict()
 
@@ -123,13 +109,7 @@ class CraftWorker(GUIWorker):
             if self.info['isGuiOpen']:
                 self._press_inventory_button()
                 
-            cur_path = os.path.abspath(os.path.dirname(__file__))
-            root_path = cur_path[:cur_path.find('minestudio')]
-            recipe_path = recipe_name if recipe_name is not None else target + '.json'
-            relative_path = os.path.join("assets/recipes", recipe_path)
-            recipe_json_path = os.path.join(root_path, relative_path)
-            with open(recipe_json_path) as file:
-                recipe_info = json.load(file)
+            recipe_info = recipe_index.recipe(recipe_name if recipe_name is not None else target)
             need_table = CraftWorker.crafting_type(recipe_info)
 
             if need_table:
@@ -507,16 +487,9 @@ class CraftWorker(GUIWorker):
                         return result[0]
             elif item_type == "tag":
                 # tag info
-                cur_path = os.path.abspath(os.path.dirname(__file__))
-                root_path = cur_path[:cur_path.find('minestudio')]
-                relative_path = os.path.join("assets/tag_items.json")
-                tag_json_path = os.path.join(root_path, relative_path)
-                with open(tag_json_path) as file:
-                    tag_info = json.load(file)
-
-                item_list = tag_info['minecraft:'+item]
+                item_list = get_recipe_index().tag_items(item)
                 for i in range(len(item_list)):
-                    if re.match(item_list[i][10:], str(value)):
+                    if re.match(item_list[i], str(value)):
                         return current_path
                     elif isinstance(value, dict):
                         result = self.find_in_inventory(value, item, item_type, current_path)
@@ -657,7 +630,7 @@ class CraftWorker(GUIWorker):
         slot_pos = self.crafting_slotpos 
         labels = self.get_labels()
         ingredients = recipe_info.get('ingredients')
-        random.shuffle(ingredients)
+        ingredients = random.sample(ingredients, len(ingredients))
         items = dict()
         items_type = dict()
 
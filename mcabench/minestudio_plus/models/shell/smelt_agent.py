@@ -3,7 +3,8 @@ import os
 import json
 from copy import deepcopy
 from typing import Sequence, List, Mapping, Dict, Callable, Any, Tuple, Optional
-from minestudio.models.shell.craft_agent import CraftWorker
+from mcabench.minestudio_plus.models.shell.craft_agent import CraftWorker
+from mcabench.utils.recipe_index import get_recipe_index
 import time
 import random
 
@@ -77,12 +78,8 @@ class SmeltWorker(CraftWorker):
             if self.info['isGuiOpen']:
                 self._call_func('inventory')   
             
-            cur_path = os.path.abspath(os.path.dirname(__file__))
-            root_path = cur_path[:cur_path.find('minestudio')]
-            relative_path = os.path.join("assets/recipes", target + '.json')
-            recipe_json_path = os.path.join(root_path, relative_path)
-            with open(recipe_json_path) as file:
-                recipe_info = json.load(file)
+            recipe_index = get_recipe_index()
+            recipe_info = recipe_index.recipe(target)
             
             self.open_furnace_wo_recipe()
 
@@ -110,10 +107,7 @@ class SmeltWorker(CraftWorker):
             
             if fuels_type == 'coalstodo':
 
-                relative_path_fuels = os.path.join("assets/recipes", 'charcoal' + '.json')
-                recipe_json_path_fuels = os.path.join(root_path, relative_path_fuels)
-                with open(recipe_json_path_fuels) as file:
-                    recipe_info_fuels = json.load(file)
+                recipe_info_fuels = recipe_index.recipe('charcoal')
 
                 self.smelting_once('charcoal', recipe_info_fuels, target_num=1, fuels='planks')
                 fuels_type = 'coals'
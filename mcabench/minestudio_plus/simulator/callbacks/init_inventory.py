@@ -13,7 +13,7 @@ import json
 import re
 from pathlib import Path
 from copy import deepcopy
-from time import sleep
+from time import sleep, time
 from rich import console,print
 import uuid
 
@@ -43,9 +43,91 @@ EQUIP_DISTRACTION_LEVEL = {
     "normal":range(0,6),
 }
 
+EQUIPMENTS_FILE_PATH = Path(__file__).resolve().parents[3] / "assets" / "mc_equipments.1.16.json"
+
+def load_items_library(version:str="1.16") -> dict:
+    """{item name: {"stackSize": n}} from minecraft-data, only the fields the callback uses"""
+    mcd = minecraft_data(version)
+    return {name: {"stackSize": item["stackSize"]} for name, item in mcd.items_name.items()}
+
+def load_equipments_library() -> dict:
+    mc_equipments_file_path = EQUIPMENTS_FILE_PATH
+    if not mc_equipments_file_path.exists():
+        try:
+            from huggingface_hub import hf_hub_download
+            hf_hub_download(repo_id="CraftJarvis/MinecraftResources", repo_type="dataset",filename="mc_equipments.1.16.json", local_dir=mc_equipments_file_path.parent)
+            assert mc_equipments_file_path.exists(), f"File {mc_equipments_file_path} not found after download."
+        except Exception as e:
+            raise FileNotFoundError(f"Failed to download the file: {e}")
+
+    with mc_equipments_file_path.open("r") as file:
+        mc_equipments = json.load(file)
+    
+    return mc_equipments
+
+def parse_quantity_candidates(item_quantity:str, max_items_num:int) -> tuple:
+    """Candidate quantities of a condition string like ">=2" or "<12,>10"; parts without an operator are ignored."""
+    candidate_nums=set(range(MIN_ITEMS_NUM+1, max_items_num + 1))
+    
+    def apply_command(op, val):
+        """Apply a command based on the operator and value provided in the string 
+        """
+        return {
+            '<': set(range(MIN_ITEMS_NUM,val)),
+            '<=': set(range(MIN_ITEMS_NUM,val+1)),
+            '>': set(range(val+1,max_items_num+1)),
+            '>=': set(range(val,max_items_num+1)),
+            '==': {val}
+        }[op]
+
+    for item_quantity_command in item_quantity.split(","):
+        match = re.search(r'([<>]=?|==)\s*(\d+)', item_quantity_command.strip()) #matching "<...", ">...", "<=...", ">=...", "==..."
+        if match:
+            operator, number = match.groups()
+            number = int(number)
+            candidate_nums &= apply_command(operator,number)
+    return tuple(candidate_nums)
+
+def _normalize_item(item_type:str) -> str:
+    # 空slot在inventory中为none，在equipped_items中为air
+    item_type = item_type.replace("minecraft:", "")
+    return "none" if item_type == "air" else item_type
+
+class InventoryReadiness:
+    """Incremental check of an observed inventory against the expected {slot: (type, quantity)} map.
+    
+    Slots are only re-checked while they are still pending, so each ``update`` touches fewer slots as
+    the /replaceitem commands land. Slots absent from the map must end up empty.
+    """
+    def __init__(self, expected_inventory:dict) -> None:
+        self.expected_inventory = expected_inventory
+        self.pending = set(range(MIN_SLOT_IDX, MAX_SLOT_IDX + 1))
+        
+    @property
+    def ready(self) -> bool:
+        return not self.pending
+        
+    def update(self, obs) -> bool:
+        inventory = obs["inventory"]
+        equipped_items = obs["equipped_items"]
+        matched = []
+        for slot in self.pending:
+            expected_type, expected_quantity = self.expected_inventory.get(slot, ("none", 0))
+            if slot <= MAX_INVENTORY_IDX:
+                slot_dict = inventory.get(slot, inventory.get(str(slot)))
+                if _normalize_item(slot_dict["type"]) == expected_type and (expected_type == "none" or slot_dict["quantity"] == expected_quantity):
+                    matched.append(slot)
+            elif _normalize_item(equipped_items[REVERSE_EQUIP_SLOTS_MAP[slot]]["type"]) == expected_type:
+                matched.append(slot)
+        self.pending.difference_update(matched)
+        return self.ready
+
 class InitInventoryCallback(MinecraftCallback):
     
-    def __init__(self, init_inventory:dict,inventory_distraction_level:Union[list,str]=[0],equip_distraction_level:Union[list,str]=[0]) -> None:
+    def __init__(self, init_inventory:dict,inventory_distraction_level:Union[list,str]=[0],equip_distraction_level:Union[list,str]=[0],
+                 max_wait_steps:int=300,max_wait_seconds:float=60,backoff:float=0.05,max_backoff:float=0.5,
+                 readiness_log:str=None,verbose:bool=False,
+                 items_library:dict=None,equipments_library:dict=None,quantity_candidates:dict=None) -> None:
         """
         Examples:
             init_inventory = [{
@@ -53,21 +135,37 @@ class InitInventoryCallback(MinecraftCallback):
                     type: "oak_planks"
                     quantity: 64  # supporting ">...",">=...","<...","<=...","==...","...",1
                 }]
+        After the commands are sent, noop steps are taken until the inventory matches, sleeping
+        ``backoff`` seconds (doubling up to ``max_backoff``) between polls, within a budget of ``max_wait_steps``
+        steps and ``max_wait_seconds`` seconds. Each reset appends a line to ``readiness_log`` (jsonl) if given.
+        ``items_library``, ``equipments_library`` and ``quantity_candidates`` can be injected from a precompiled
+        TaskBundle so that no minecraft-data/json file is loaded here.
         """
         self.init_inventory = init_inventory
         self.inventory_distraction_level = INVENTORY_DISTRACTION_LEVEL.get(inventory_distraction_level,[0]) if isinstance(inventory_distraction_level,str) else inventory_distraction_level
         self.equip_distraction_level = EQUIP_DISTRACTION_LEVEL.get(equip_distraction_level,[0]) if isinstance(equip_distraction_level,str) else equip_distraction_level
+        self.max_wait_steps = max_wait_steps
+        self.max_wait_seconds = max_wait_seconds
+        self.readiness_log = readiness_log
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.verbose = verbose
         
-        mcd = minecraft_data("1.16")
-        self.items_library = mcd.items_name
-        self.items_names = list(mcd.items_name.keys())
-        self.equipments_library = self._get_equipments_library()
+        self.items_library = items_library if items_library is not None else load_items_library()
+        self.items_names = list(self.items_library.keys())
+        self.equipments_library = equipments_library if equipments_library is not None else self._get_equipments_library()
+        self.quantity_candidates = quantity_candidates if quantity_candidates is not None else {}  # {(condition, stackSize): candidates}
+        
+        self.expected_inventory = {}  # {slot: (type, quantity)}，装备栏quantity为None
+        self.setup_latency = {}
+        self.wait_steps_history = []  # 每次reset等待的步数，用于调整等待预算
         
     def after_reset(self, sim, obs, info):
         return self._set_inventory(sim, obs, info)
     
     def _set_inventory(self, sim, obs, info):
-        chats = []
+        start_time = time()
+        task = info.get("task", {}).get("text") if isinstance(info.get("task"), dict) else None
         visited_slots = set()
         uncertain_slots = [] 
         init_inventory = []
@@ -97,9 +195,52 @@ class InitInventoryCallback(MinecraftCallback):
         
         # create init inventory
         self.slot_num = len(init_inventory)
-
+        chats, self.expected_inventory = self._build_commands(init_inventory)
+        
+        obs, reward, done, info = self._execute_cmds(sim, ["/gamerule sendCommandFeedback false"] + chats)
+        #obs, reward, done, info = sim.env.execute_cmd("/gamerule commandblockoutput false")
+        
+        # check whether set up
+        readiness = InventoryReadiness(self.expected_inventory)
+        obs, reward, done, info, kdx, inventory_infos = self.wait_until_ready(sim, readiness, obs, info)
+        init_flag = readiness.ready
+            
+        obs, info = self._clean_screen(sim,obs,info)
+        
+        self.setup_latency = {
+            "seconds": time() - start_time,
+            "command_steps": len(chats) + 1,
+            "wait_steps": kdx,
+            "ready": init_flag,
+        }
+        self.wait_steps_history.append(kdx)
+        if self.readiness_log:
+            Path(self.readiness_log).parent.mkdir(parents=True,exist_ok=True)
+            with open(self.readiness_log,mode="a") as file:
+                file.write(json.dumps(dict(task=task,slot_num=self.slot_num,**self.setup_latency)) + "\n")
+        messages = f"set up {self.slot_num} slots in {self.setup_latency['seconds']:.2f}s ({len(chats) + 1} commands, {kdx} wait steps)"
+            
+        if not init_flag:
+            uuidx = str(uuid.uuid4())
+            Path("logs").mkdir(parents=True,exist_ok=True)
+            with open(f"logs/file_inventory_init_{uuidx}.json",mode="w") as file:
+                json.dump({"init_inventory":init_inventory,"steps":inventory_infos},file)
+            messages = f"[red]can't set up init inventory[/red], need {self.slot_num}, {len(readiness.pending)} slots mismatched {sorted(readiness.pending)}, and has sample {kdx} steps in {self.setup_latency['seconds']:.2f}s. log at file_inventory_init_{uuidx}.json"
+            console.Console().log(messages)
+        elif self.verbose:
+            console.Console().log(messages)
+        message = info.get('message', {})
+        message['InitInventoryCallback'] = messages
+        info["message"] = message
+            
+        return obs, info
+    
+    def _build_commands(self, init_inventory:list):
+        """Return the /replaceitem commands and the expected {slot: (type, quantity)} they should produce."""
+        chats = []
+        expected_inventory = {}
         for item_dict in init_inventory:
-            slot = item_dict["slot"]
+            slot = int(item_dict["slot"])
             
             mc_slot =self._map_slot_number_to_cmd_slot(slot)
             item_type = item_dict["type"]
@@ -113,66 +254,46 @@ class InitInventoryCallback(MinecraftCallback):
                 chat += f" {item_dict['metadata']}"
                 
             chats.append(chat)
-        
-        obs, reward, done, info = sim.env.execute_cmd("/gamerule sendCommandFeedback false")
-        #obs, reward, done, info = sim.env.execute_cmd("/gamerule commandblockoutput false")
+            if item_type == "air" or item_quantity == 0:
+                item_type, item_quantity = "none", 0  # 该slot最终为空
+            expected_inventory[slot] = (item_type, item_quantity if slot <= MAX_INVENTORY_IDX else None)
+        return chats, expected_inventory
+    
+    def _execute_cmds(self, sim, chats:list):
+        """Send each command with its own ``execute_cmd`` (one env step per command), back to back without wrapping
+        obs in between; returns the last raw step result. The commands are not merged: MinecraftSim only exposes
+        one chat command per env step and has no hook to install a datapack for a single ``/function`` call."""
+        result = None
         for chat in chats:
-            obs, reward, done, info = sim.env.execute_cmd(chat)
-        obs, info = sim._wrap_obs_info(obs, info)
-        
-        
-        # check whether set up
-        init_flag = False
-        
-        kdx = 0
+            result = sim.env.execute_cmd(chat)
+        return result
+    
+    def wait_until_ready(self, sim, readiness:InventoryReadiness, obs, info):
+        """Take noop steps until ``readiness`` matches or the step/second budget runs out, backing off between polls.
+        Returns the last raw step result plus the number of wait steps and the observed inventories."""
+        reward, done = 0, False
         inventory_infos = []
-        for kdx in range(300):
+        start_time = time()
+        kdx = 0
+        backoff = self.backoff
+        while not readiness.update(obs) and kdx < self.max_wait_steps and time() - start_time < self.max_wait_seconds:
+            if kdx:
+                sleep(backoff)
+                backoff = min(backoff*2, self.max_backoff)
             action = sim.env.noop_action()
             obs, reward, done, info = sim.env.step(action)
+            kdx += 1
             inventory_infos.append({
-                "init_inventory":init_inventory,
+                "pending_slots":sorted(readiness.pending),
                 "current_inventory":obs["inventory"]})
-            init_flag,current_slot_num = self._check(obs)
-            if init_flag or current_slot_num > self.slot_num:
-                break
-            if kdx%40==0:
-                sleep(1)
-            
-        obs, info = self._clean_screen(sim,obs,info)
-            
-        if not init_flag:
-            uuidx = str(uuid.uuid4())
-            Path("logs").mkdir(parents=True,exist_ok=True)
-            with open(f"logs/file_inventory_init_{uuidx}.json",mode="w") as file:
-                json.dump(inventory_infos,file)
-            messages = f"[red]can't set up init inventory[/red], need {self.slot_num}, has {current_slot_num} only, and has sample {kdx} steps. log at file_inventory_init_{uuidx}.json"
-            console.Console().log(messages)
-            message = info.get('message', {})
-            message['InitInventoryCallback'] = messages
-            info["message"] = message
-            
-        inventory_infos = []
-            
-        return obs, info
+        return obs, reward, done, info, kdx, inventory_infos
     
     def _clean_screen(self, sim, obs, info):
         obs, info = sim._wrap_obs_info(obs, info)
         return obs,info
     
     def _get_equipments_library(self):
-        mc_equipments_file_path = Path(__file__).resolve().parents[3] / "assets" / "mc_equipments.1.16.json"
-        if not mc_equipments_file_path.exists():
-            try:
-                from huggingface_hub import hf_hub_download
-                hf_hub_download(repo_id="CraftJarvis/MinecraftResources", repo_type="dataset",filename="mc_equipments.1.16.json", local_dir=mc_equipments_file_path.parent)
-                assert mc_equipments_file_path.exists(), f"File {mc_equipments_file_path} not found after download."
-            except Exception as e:
-                raise FileNotFoundError(f"Failed to download the file: {e}")
-
-        with mc_equipments_file_path.open("r") as file:
-            mc_equipments = json.load(file)
-        
-        return mc_equipments
+        return load_equipments_library()
     
     def _sample_inventory(self,init_inventory,visited_slots,unvisited_slots):
         distraction_num = min(random.choice(self.inventory_distraction_level),len(unvisited_slots))
@@ -224,34 +345,17 @@ class InitInventoryCallback(MinecraftCallback):
         
         if isinstance(item_quantity,str):
             
-            candidate_nums=set(range(MIN_ITEMS_NUM+1, max_items_num + 1))
-            
             if item_quantity == "random":
                 one_flag = random.choices([True, False], weights=[one_p, 1 - one_p], k=1)[0]
-                item_quantity = 1 if one_flag else random.choice(list(candidate_nums))
+                item_quantity = 1 if one_flag else random.randint(MIN_ITEMS_NUM+1, max_items_num)
                 return item_quantity
             
-            item_quantity_commands = item_quantity.split(",")
-        
-            def apply_command(op, val):
-                """Apply a command based on the operator and value provided in the string 
-                """
-                return {
-                    '<': set(range(MIN_ITEMS_NUM,val)),
-                    '<=': set(range(MIN_ITEMS_NUM,val+1)),
-                    '>': set(range(val+1,max_items_num+1)),
-                    '>=': set(range(val,max_items_num+1)),
-                    '==': {val}
-                }[op]
-        
-            for item_quantity_command in item_quantity_commands:
-                match = re.search(r'([<>]=?|==)\s*(\d+)', item_quantity_command.strip()) #matching "<...", ">...", "<=...", ">=...", "==..."
-                if match:
-                    operator, number = match.groups()
-                    number = int(number)
-                    candidate_nums &= apply_command(operator,number)
+            candidate_nums = self.quantity_candidates.get((item_quantity, max_items_num))
+            if candidate_nums is None:
+                candidate_nums = parse_quantity_candidates(item_quantity, max_items_num)
+                self.quantity_candidates[(item_quantity, max_items_num)] = candidate_nums
             if candidate_nums:
-                item_quantity = random.choice(list(candidate_nums))
+                item_quantity = random.choice(candidate_nums)
             else:
                 item_quantity = 1
                 
@@ -261,19 +365,6 @@ class InitInventoryCallback(MinecraftCallback):
 
         return item_quantity
     
-    def _check(self,obs):
-        # check whether it set up the init inventory
-        current_slot_num = 0
-        for slot_dict in obs["inventory"].values():
-            if slot_dict["type"] != "none":
-                current_slot_num+=1
-        for slot_name,slot_dict in obs["equipped_items"].items():
-            if slot_name != "mainhand" and slot_dict["type"] != "air":
-                current_slot_num += 1
-        if current_slot_num == self.slot_num:
-            return True,current_slot_num
-        return False,current_slot_num
-    
 if __name__ == "__main__":
 
     import numpy as np
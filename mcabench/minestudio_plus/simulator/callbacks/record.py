@@ -9,20 +9,98 @@ from pathlib import Path
 from minestudio.simulator.callbacks.callback import MinecraftCallback
 from typing import Literal
 from rich import print
-from copy import deepcopy
+from copy import copy, deepcopy
+import sys
 import numpy as np
 from gymnasium import spaces
 from collections import defaultdict
 from omegaconf import DictConfig
 import json
 import cv2
+import queue
+import threading
+from mcabench.utils.episode_log import EpisodeLogWriter
+from mcabench.utils.frame_store import FrameStoreWriter
+
+
+def _nbytes(data):
+    # 估算记录数据占用的内存
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    size = sys.getsizeof(data)
+    if isinstance(data, dict):
+        size += sum(_nbytes(key) + _nbytes(value) for key, value in data.items())
+    elif isinstance(data, (list, tuple)):
+        size += sum(_nbytes(value) for value in data)
+    return size
+
+
+class VideoStreamWriter:
+    """在后台线程中逐帧编码mp4，队列有界，内存占用与episode长度无关"""
+    def __init__(self, output_path, fps: int, render=None, queue_size: int = 32):
+        self.output_path = Path(output_path)
+        self.fps = fps
+        self.render = render
+        self.error = None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, frame, *render_args):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((frame, render_args))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        try:
+            self.close()
+        finally:
+            self.output_path.unlink(missing_ok=True)
+
+    def _run(self):
+        container, stream = None, None
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                frame, render_args = item
+                if self.render is not None:
+                    frame = self.render(frame, *render_args)
+                if container is None:
+                    container = av.open(self.output_path, mode="w", format='mp4')
+                    stream = container.add_stream("h264", rate=self.fps)
+                    stream.width, stream.height = frame.shape[1], frame.shape[0]
+                video_frame = av.VideoFrame.from_ndarray(frame, format="rgb24")
+                for packet in stream.encode(video_frame):
+                    container.mux(packet)
+            if container is not None:
+                for packet in stream.encode():
+                    container.mux(packet)
+        except Exception as e:
+            self.error = e
+            # 继续取空队列，避免生产者阻塞
+            while self.queue.get() is not None:
+                pass
+        finally:
+            if container is not None:
+                container.close()
 
 
 class RecordCallback(MinecraftCallback):
     def __init__(self, record_path: str, fps: int = 20, frame_type: Literal['pov', 'obs'] = 'pov', recording: bool = True,
-                    show_actions=False,show_instruction=False, 
+                    show_actions=False,show_instruction=False,show_annotations=False, 
                     record_actions=False,record_infos=False, record_raw_observation = True,
                     record_npy_observation=False, 
+                    stream_encode=False, stream_queue_size=32,
+                    log_format: Literal['json', 'npz'] = 'json', info_keys: list = None,
+                    measure_info_bytes=False, max_frames: int = None,
                  **kwargs):
         #print("record_actions ",record_actions,"record_infos ",record_infos,"record_raw_observation ",record_raw_observation,"show_instruction ",show_instruction,"show_actions ",show_actions)
         super().__init__(**kwargs)
@@ -32,9 +110,35 @@ class RecordCallback(MinecraftCallback):
         self.record_actions = record_actions
         self.show_actions = show_actions
         self.show_instruction = show_instruction
+        # agent的标注(如CoA的thought/grounding)按帧保存，只在编码demo视频时才画上去
+        self.show_annotations = show_annotations
+        self.annotation_renderer = None
+        self.annotations = {}
         self.record_raw_observation = record_raw_observation
         self.record_infos = record_infos
+        # 只记录这些info字段(浅拷贝)，None表示除pov外全部记录
+        self.info_keys = list(info_keys) if info_keys is not None else None
+        # debug计数器：记录的info每步占用的字节数(统计本身有开销，默认关闭)
+        self.measure_info_bytes = measure_info_bytes
+        self.info_bytes = 0
+        self.info_bytes_total = 0
+        self.info_steps = 0
         self.record_origin_observation = record_npy_observation
+        # 流式编码：只保留一帧待编码的frame(供agent.show修改)，其余帧在后台线程写入视频
+        self.stream_encode = stream_encode
+        self.stream_queue_size = stream_queue_size
+        self.writers = []
+        self.stream_idx = 0
+        # npy原始帧直接写入按max_frames预分配的memmap文件
+        self.max_frames = max_frames
+        self.frame_store = None
+        self.last_raw_frame = None
+        # npz: info/action/reward逐步写入列式日志(见mcabench.utils.episode_log)，不再在内存中保留info
+        if log_format not in {'json', 'npz'}:
+            raise ValueError(f'Invalid log_format: {log_format}')
+        self.log_format = log_format
+        self.episode_log = None
+        self.last_log_step = None
         if recording:
             print(f'[green]Recording enabled, saving episodes to {self.record_path}[/green]')
         self.fps = fps
@@ -45,9 +149,23 @@ class RecordCallback(MinecraftCallback):
         self.actions = []
         self.texts = []
     
+    @property
+    def show_demo(self):
+        return self.show_actions or self.show_instruction or self.show_annotations
+
+    def annotate(self, annotation, renderer=None):
+        """Attach ``annotation`` to the latest frame. ``renderer(frame, annotation)`` draws it when the demo
+        video is encoded and is also called with ``annotation=None`` for frames without one, so it has to keep
+        the frame size fixed. Does nothing unless ``show_annotations`` is on."""
+        if not (self.recording and self.show_annotations and self.frames):
+            return
+        if renderer is not None:
+            self.annotation_renderer = renderer
+        self.annotations[self.stream_idx + len(self.frames) - 1] = annotation
+
     def _get_message(self, info):
         message = info.get('message', {})
-        message['RecordCallback'] = f'Recording: {"On" if self.recording else "Off"}, Recording Time: {len(self.frames)}'
+        message['RecordCallback'] = f'Recording: {"On" if self.recording else "Off"}, Recording Time: {self.stream_idx + len(self.frames)}'
         return message
 
     def before_reset(self, sim, reset_flag: bool) -> bool:
@@ -61,18 +179,15 @@ class RecordCallback(MinecraftCallback):
         # this message would be displayed in the GUI when command mode is on
         info['message'] = self._get_message(info)
         if self.recording:
-            if self.frame_type == 'obs':
-                self.frames.append(obs['image'])
-            elif self.frame_type == 'pov':
-                self.frames.append(info['pov'])
-            else:
-                raise ValueError(f'Invalid frame_type: {self.frame_type}')
+            self._add_frame(obs, info)
             if self.record_actions:
                 self.actions.append({}) #empty for reset
             if self.show_instruction:
                 self.texts.append(info["task"]["text"])
-            if self.record_infos:
-                self.infos.append(info)
+            if self.log_format == 'npz':
+                self._log_step(info, {})
+            elif self.record_infos:
+                self.infos.append(self._capture_info(info))
         
         return obs, info
     
@@ -96,16 +211,11 @@ class RecordCallback(MinecraftCallback):
             print(f'[green]Start recording[/green]')
 
         if self.recording:
-            if self.frame_type == 'obs':
-                self.frames.append(obs['image'])
-            elif self.frame_type == 'pov':
-                self.frames.append(info['pov'])
-            else:
-                raise ValueError(f'Invalid frame_type: {self.frame_type}')
-            if self.record_infos:
-                new_info = deepcopy(info)
-                new_info.pop('pov')
-                self.infos.append(info)
+            self._add_frame(obs, info)
+            if self.log_format == 'npz':
+                self._log_step(info, self.actions[-1] if self.actions else None, reward)
+            elif self.record_infos:
+                self.infos.append(self._capture_info(info))
             
         info['message'] = self._get_message(info)
         
@@ -115,17 +225,167 @@ class RecordCallback(MinecraftCallback):
         if self.recording:
             self._save_episode()
     
-    def _save_episode(self):
-        if len(self.frames) == 0:
-            return 
-        output_path = self.record_path / f'episode_{self.episode_id}.mp4'
-        
+    def _log_step(self, info, action, reward=None):
+        if not (self.record_infos or self.record_actions):
+            return
+        if self.episode_log is None:
+            self.episode_log = EpisodeLogWriter(self.record_path / f'episode_{self.episode_id}_log.npz')
+        step = (self._capture_info(info) if self.record_infos else None, action if self.record_actions else None, reward)
+        self.episode_log.append(*step)
+        self.last_log_step = step
+    
+    def _capture_info(self, info):
+        if info is None:
+            return None
+        keys = self.info_keys if self.info_keys is not None else info.keys()
+        record_info = {key: copy(info[key]) for key in keys if key in info and key != 'pov'}
+        if self.measure_info_bytes:
+            self.info_bytes = _nbytes(record_info)
+            self.info_bytes_total += self.info_bytes
+            self.info_steps += 1
+        return record_info
+    
+    def _add_frame(self, obs, info):
+        if self.frame_type == 'obs':
+            frame = obs['image']
+        elif self.frame_type == 'pov':
+            frame = info['pov']
+        else:
+            raise ValueError(f'Invalid frame_type: {self.frame_type}')
+        if self.record_origin_observation:
+            # 在agent.show修改之前保存原始帧
+            if self.frame_store is None:
+                self.frame_store = FrameStoreWriter(self.record_path / f'episode_{self.episode_id}.npy', max_frames=self.max_frames or 1024)
+            self.frame_store.append(frame)
+            self.last_raw_frame = frame
+        if self.stream_encode:
+            # 上一帧已经不会再被修改，送去编码
+            self._flush_frames()
+        self.frames.append(frame)
+    
+    def _flush_frames(self):
+        if not self.frames:
+            return
+        if not self.writers:
+            output_path = self.record_path / f'episode_{self.episode_id}.mp4'
+            if self.record_raw_observation:
+                self.writers.append(VideoStreamWriter(output_path, self.fps, queue_size=self.stream_queue_size))
+            if self.show_demo:
+                demo_path = output_path.parent / ("demo_" + output_path.name)
+                self.writers.append(VideoStreamWriter(demo_path, self.fps, render=self._render_demo_frame, queue_size=self.stream_queue_size))
+        for frame in self.frames:
+            idx = self.stream_idx
+            text = self.texts[idx] if self.show_instruction and idx < len(self.texts) else None
+            action = self.actions[idx] if self.show_actions and idx < len(self.actions) else None
+            annotation = self.annotations.pop(idx, None)
+            for writer in self.writers:
+                writer.write(frame, text, action, annotation)
+            self.stream_idx += 1
+        self.frames = []
+    
+    def _close_writers(self, abort=False):
+        # 每个writer都要收到结束信号，否则其编码线程一直阻塞在queue.get()；第一个错误在全部关闭后再抛出
+        writers, self.writers = self.writers, []
+        error = None
+        for writer in writers:
+            try:
+                if abort:
+                    writer.abort()
+                else:
+                    writer.close()
+            except Exception as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+    
+    def _close_stores(self):
+        try:
+            if self.frame_store is not None:
+                self.frame_store.close()
+        finally:
+            self.frame_store = None
+            self.last_raw_frame = None
+            episode_log, self.episode_log = self.episode_log, None
+            self.last_log_step = None
+            if episode_log is not None:
+                episode_log.close()
+    
+    def _render_demo_frame(self, frame, text=None, action=None, annotation=None):
+        rendered = self.show_annotations and self.annotation_renderer is not None
+        if rendered:
+            # 在编码线程里画，renderer需要自己copy，原始帧还会被其他writer使用
+            frame = self.annotation_renderer(frame, annotation)
+        if text is None and action is None:
+            return frame
         font = cv2.FONT_HERSHEY_SIMPLEX # cv2.FONT_HERSHEY_PLAIN # cv2.FONT_HERSHEY_SIMPLEX
         font_scale = 0.5
         font_color = (255, 255, 255)
         thickness = 1
         line_type = cv2.LINE_AA
+        
+        # 只在需要加文字时才copy()，renderer返回的已经是新数组
+        frame_with_text = frame if rendered else frame.copy()
+
+        # 如果有指令文本
+        if text is not None:
+            cv2.putText(frame_with_text, text[:50], (500, 20), font, font_scale, font_color, thickness, line_type)
+
+        # 如果有动作文本
+        if action is not None:
+            for row, (k, v) in enumerate(action.items()):
+                if k in {"chat", "mobs", "voxels"}:
+                    continue
+                display_v = "[{:.2f}, {:.2f}]".format(v[0], v[1]) if k == "camera" else v
+                cv2.putText(frame_with_text, f"{k}: {display_v}", (10, 25 + row * 15),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, font_color, thickness)
+        return frame_with_text
     
+    def _save_episode(self):
+        output_path = self.record_path / f'episode_{self.episode_id}.mp4'
+        if len(self.frames) == 0 and not (self.stream_encode and self.stream_idx):
+            return
+        try:
+            if self.stream_encode:
+                try:
+                    self._flush_frames()
+                finally:
+                    self._close_writers()
+            else:
+                self._save_frames(output_path)
+        except Exception:
+            # 编码失败也要释放frame_store/episode_log，并丢弃这一段的记录，不带到下一个episode
+            self.actions, self.infos = [], []
+            raise
+        finally:
+            self.stream_idx = 0
+            self.frames = []
+            self.annotations = {}
+            self._close_stores()
+        
+        if self.log_format == 'npz':
+            self.actions = []
+        
+        if self.record_actions and self.log_format == 'json': # assert self.actions>0 sense self.frame > 0
+            output_action_path = self.record_path / f'episode_{self.episode_id}_action.json'
+            record_actions = [self._process_action(action) for action in self.actions]
+            with open(output_action_path, 'w', encoding="utf-8") as file:
+                json.dump(record_actions, file)
+            self.actions = []
+        
+        if self.record_infos and self.log_format == 'json': # assert self.actions>0 sense self.frame > 0
+            output_info_path = self.record_path / f'episode_{self.episode_id}_info.json'
+            record_infos = [self._process_info(info) for info in self.infos]
+            with open(output_info_path, 'w', encoding="utf-8") as file:
+                json.dump(record_infos, file)
+            self.infos = []
+            
+        print(f'[green]Episode {self.episode_id} saved at {output_path}[/green]')
+        if self.info_steps:
+            print(f'[green]Info: {self.info_bytes_total / self.info_steps:.0f} bytes/step over {self.info_steps} steps[/green]')
+            self.info_bytes_total, self.info_steps = 0, 0
+    
+    def _save_frames(self, output_path):
         if self.record_raw_observation:
             with av.open(output_path, mode="w", format='mp4') as container:
                 stream = container.add_stream("h264", rate=self.fps)
@@ -138,29 +398,18 @@ class RecordCallback(MinecraftCallback):
                 for packet in stream.encode():
                     container.mux(packet)
 
-        if self.show_actions or self.show_instruction:
+        if self.show_demo:
             demo_path = output_path.parent / ("demo_" + output_path.name)
             with av.open(demo_path, mode="w", format='mp4') as container:
                 stream = container.add_stream("h264", rate=self.fps)
-                stream.width, stream.height = self.frames[0].shape[1], self.frames[0].shape[0]
 
                 for idx, frame in enumerate(self.frames):
-                    # 只在需要加文字时才copy()
-                    frame_with_text = frame.copy()
-
-                    # 如果有指令文本
-                    if self.show_instruction and idx < len(self.texts):
-                        cv2.putText(frame_with_text, self.texts[idx][:50], (500, 20), font, font_scale, font_color, thickness, line_type)
-
-                    # 如果有动作文本
-                    if self.show_actions:
-                        for row, (k, v) in enumerate(self.actions[idx].items()):
-                            if k in {"chat", "mobs", "voxels"}:
-                                continue
-                            display_v = "[{:.2f}, {:.2f}]".format(v[0], v[1]) if k == "camera" else v
-                            cv2.putText(frame_with_text, f"{k}: {display_v}", (10, 25 + row * 15),
-                                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, font_color, thickness)
-
+                    text = self.texts[idx] if self.show_instruction and idx < len(self.texts) else None
+                    action = self.actions[idx] if self.show_actions else None
+                    frame_with_text = self._render_demo_frame(frame, text, action, self.annotations.get(idx))
+                    if idx == 0:
+                        # 标注可能改变帧的大小，按渲染后的第一帧设置
+                        stream.width, stream.height = frame_with_text.shape[1], frame_with_text.shape[0]
                     video_frame = av.VideoFrame.from_ndarray(frame_with_text, format="rgb24")
 
                     for packet in stream.encode(video_frame):
@@ -168,45 +417,38 @@ class RecordCallback(MinecraftCallback):
                 for packet in stream.encode():
                     container.mux(packet)
                 
-        if self.record_origin_observation:
-            output_origin_path = self.record_path / f'episode_{self.episode_id}.npy'
-            all_frames = np.array(self.frames)
-            np.save(output_origin_path, all_frames)
-        
-        self.frames = []
-        
-        if self.record_actions: # assert self.actions>0 sense self.frame > 0
-            output_action_path = self.record_path / f'episode_{self.episode_id}_action.json'
-            record_actions = [self._process_action(action) for action in self.actions]
-            with open(output_action_path, 'w', encoding="utf-8") as file:
-                json.dump(record_actions, file)
-            self.actions = []
-        
-        if self.record_infos: # assert self.actions>0 sense self.frame > 0
-            output_info_path = self.record_path / f'episode_{self.episode_id}_info.json'
-            record_infos = [self._process_info(info) for info in self.infos]
-            with open(output_info_path, 'w', encoding="utf-8") as file:
-                json.dump(record_infos, file)
-            self.infos = []
-            
-        print(f'[green]Episode {self.episode_id} saved at {output_path}[/green]')
         
     def forget(self):
+        # 留下的最新一帧变成第0帧
+        last_annotation = self.annotations.get(self.stream_idx + len(self.frames) - 1)
+        self.annotations = {0: last_annotation} if last_annotation is not None and self.frames else {}
+        if self.stream_encode:
+            # 丢弃已经编码的部分，从最新的一帧重新开始
+            self._close_writers(abort=True)
+            self.stream_idx = 0
+        if self.frame_store is not None:
+            self.frame_store.truncate(0)
+            self.frame_store.append(self.last_raw_frame)
+        self.info_bytes_total, self.info_steps = 0, 0
+        if self.episode_log is not None:
+            self.episode_log.abort()
+            self.episode_log = None
+            self._log_step(self.last_log_step[0], {})
         if self.frames:
             self.frames = self.frames[-1:]
         if self.actions:
             self.actions = [{}]
         if self.infos:
             self.infos = self.infos[-1:]
+            if self.measure_info_bytes:
+                self.info_bytes_total, self.info_steps = _nbytes(self.infos[0]), 1
         if self.texts:
             self.texts = self.texts[-1:]
     
         
     def _process_info(self,info:dict):
-        record_info = deepcopy(info)
-        if self.frame_type == 'pov':
-            del record_info['pov']
-        record_info = self._convert_data(record_info)
+        # info已经是_capture_info得到的副本，不含pov
+        record_info = self._convert_data(info)
         return record_info
     
     def _process_action(self,action:spaces.Dict):
@@ -0,0 +1,310 @@
+'''
+Columnar episode log.
+
+Each step (info, action, reward) is flattened into columns such as ``health``,
+``location_stats/xpos``, ``action/camera`` and ``reward``. Every ``chunk_size``
+steps the columns are written into one compressed ``.npz`` file as ``{column}#{chunk}``
+members, so memory stays bounded and a loader can read single columns without
+touching the rest of the file.
+
+Slot tables like ``inventory`` barely change between steps, so they are
+delta-encoded. Only the slots that differ from the previous step are stored,
+as rows ``{key}[step]``, ``{key}[slot]``, ``{key}[present]``, ``{key}[<field>]``.
+'''
+import json
+import zipfile
+import pathlib
+import argparse
+from collections.abc import Mapping
+from typing import Union, List
+import numpy as np
+
+STEPS_KEY = "__steps__"
+DELTA_KEYS = ("inventory", "equipped_items", "resource")
+SKIP_KEYS = ("pov",)
+
+
+def _member_name(column: str, chunk: int) -> str:
+    return f"{column}#{chunk:05d}"
+
+
+def _fill_value(value):
+    if isinstance(value, (bool, np.bool_)):
+        return False
+    if isinstance(value, (int, np.integer)):
+        return 0
+    if isinstance(value, (float, np.floating)):
+        return np.nan
+    if isinstance(value, str):
+        return ""
+    if isinstance(value, np.ndarray):
+        return np.zeros_like(value)
+    return None
+
+
+def _to_leaf(value):
+    """Return a storable scalar/ndarray, or a JSON string for irregular values."""
+    if value is None or isinstance(value, (bool, int, float, str, np.bool_, np.integer, np.floating)):
+        return value
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        return value
+    if isinstance(value, (list, tuple)):
+        try:
+            array = np.asarray(value)
+        except ValueError:
+            array = None
+        if array is not None and array.dtype.kind in "biuf" and array.size:
+            return array
+    return json.dumps(value, default=str)
+
+
+def _build_column(values: list, num: int):
+    """values: list of (local_step, leaf). Returns (array, mask or None)."""
+    present = [leaf for _, leaf in values if leaf is not None]
+    mask = np.zeros(num, dtype=bool)
+    if not present:
+        return None, None
+    fill = _fill_value(present[0])
+    dense = [fill] * num
+    for step, leaf in values:
+        if leaf is not None:
+            dense[step] = leaf
+            mask[step] = True
+    try:
+        array = np.asarray(dense)
+        if array.dtype == object:
+            raise ValueError
+    except ValueError:
+        # 形状不一致等不规则数据退化为json字符串
+        array = np.asarray([json.dumps(v.tolist() if isinstance(v, np.ndarray) else v, default=str) if m else "" for v, m in zip(dense, mask)])
+    return array, (None if mask.all() else mask)
+
+
+class EpisodeLogWriter:
+    """Write an episode log chunk by chunk. Call ``append`` once per step and ``close`` at the end."""
+    def __init__(self, file_path: Union[str, pathlib.Path], chunk_size: int = 256,
+                 delta_keys=DELTA_KEYS, skip_keys=SKIP_KEYS):
+        self.file_path = pathlib.Path(file_path)
+        self.chunk_size = chunk_size
+        self.delta_keys = set(delta_keys)
+        self.skip_keys = set(skip_keys)
+        self.zip_file = zipfile.ZipFile(self.file_path, mode="w", compression=zipfile.ZIP_DEFLATED)
+        self.num_steps = 0
+        self.chunk_idx = 0
+        self.chunk_len = 0
+        self.columns = {}
+        self.delta_rows = {}
+        self.delta_state = {}
+
+    def append(self, info: Mapping = None, action: Mapping = None, reward=None):
+        step = self.chunk_len
+        if info is not None:
+            for key, value in info.items():
+                if key in self.skip_keys:
+                    continue
+                if key in self.delta_keys and isinstance(value, Mapping):
+                    self._append_delta(key, value)
+                else:
+                    self._append_value(key, value, step)
+        if action is not None:
+            self._append_value("action", action, step)
+        if reward is not None:
+            self._append_value("reward", reward, step)
+        self.num_steps += 1
+        self.chunk_len += 1
+        if self.chunk_len >= self.chunk_size:
+            self.flush()
+
+    def _append_value(self, column: str, value, step: int):
+        if isinstance(value, Mapping):
+            for key, sub_value in value.items():
+                self._append_value(f"{column}/{key}", sub_value, step)
+            return
+        self.columns.setdefault(column, []).append((step, _to_leaf(value)))
+
+    def _append_delta(self, key: str, table: Mapping):
+        state = self.delta_state.setdefault(key, {})
+        rows = self.delta_rows.setdefault(key, [])
+        for slot, record in table.items():
+            slot = str(slot)
+            record = dict(record) if isinstance(record, Mapping) else {"value": record}
+            if state.get(slot) != record:
+                state[slot] = record
+                rows.append((self.num_steps, slot, True, record))
+        slots = {str(slot) for slot in table}
+        for slot in [slot for slot in state if slot not in slots]:
+            del state[slot]
+            rows.append((self.num_steps, slot, False, {}))
+
+    def flush(self):
+        if self.chunk_len == 0:
+            return
+        self._write(STEPS_KEY, np.arange(self.num_steps - self.chunk_len, self.num_steps))
+        for column, values in self.columns.items():
+            array, mask = _build_column(values, self.chunk_len)
+            if array is None:
+                continue
+            self._write(column, array)
+            if mask is not None:
+                self._write(f"{column}@valid", mask)
+        for key, rows in self.delta_rows.items():
+            if not rows:
+                continue
+            fields = sorted({field for *_, record in rows for field in record})
+            self._write(f"{key}[step]", np.asarray([row[0] for row in rows], dtype=np.int64))
+            self._write(f"{key}[slot]", np.asarray([row[1] for row in rows]))
+            self._write(f"{key}[present]", np.asarray([row[2] for row in rows], dtype=bool))
+            for field in fields:
+                array, _ = _build_column([(i, _to_leaf(row[3].get(field))) for i, row in enumerate(rows)], len(rows))
+                if array is not None:
+                    self._write(f"{key}[{field}]", array)
+        self.columns = {}
+        self.delta_rows = {}
+        self.chunk_idx += 1
+        self.chunk_len = 0
+
+    def _write(self, column: str, array: np.ndarray):
+        with self.zip_file.open(_member_name(column, self.chunk_idx) + ".npy", mode="w", force_zip64=True) as file:
+            np.lib.format.write_array(file, np.asanyarray(array), allow_pickle=False)
+
+    def close(self):
+        if self.zip_file is None:
+            return
+        self.flush()
+        self.zip_file.close()
+        self.zip_file = None
+
+    def abort(self):
+        """Drop everything written so far."""
+        if self.zip_file is not None:
+            self.zip_file.close()
+            self.zip_file = None
+        self.file_path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EpisodeLog:
+    """Lazy reader; only the members of the requested columns are decompressed."""
+    def __init__(self, file_path: Union[str, pathlib.Path]):
+        self.npz = np.load(file_path, allow_pickle=False)
+        self.members = {}
+        for name in self.npz.files:
+            column, chunk = name.rsplit("#", 1)
+            self.members.setdefault(column, {})[int(chunk)] = name
+        self.chunk_steps = [len(self.npz[self.members[STEPS_KEY][k]]) for k in sorted(self.members.get(STEPS_KEY, {}))]
+        self.num_steps = sum(self.chunk_steps)
+
+    @property
+    def columns(self) -> List[str]:
+        return sorted(column for column in self.members
+                      if column != STEPS_KEY and "[" not in column and not column.endswith("@valid"))
+
+    @property
+    def delta_keys(self) -> List[str]:
+        return sorted({column.split("[")[0] for column in self.members if column.endswith("[step]")})
+
+    def column(self, column: str) -> np.ndarray:
+        """Dense (T, ...) values of a column; ``{column}@valid`` gives the mask of steps where it was present."""
+        if column.endswith("@valid") and column[:-len("@valid")] in self.members:
+            return self._valid(column[:-len("@valid")])
+        if column not in self.members:
+            raise KeyError(f"column {column} not in episode log")
+        chunks = self.members[column]
+        sample = self.npz[next(iter(chunks.values()))]
+        parts = []
+        for k, steps in enumerate(self.chunk_steps):
+            if k in chunks:
+                parts.append(self.npz[chunks[k]])
+            else:
+                parts.append(np.full((steps,) + sample.shape[1:], _fill_value(sample.flat[0]) if sample.size else 0, dtype=sample.dtype))
+        return np.concatenate(parts)
+
+    def _valid(self, column: str) -> np.ndarray:
+        chunks, masks = self.members[column], self.members.get(f"{column}@valid", {})
+        parts = []
+        for k, steps in enumerate(self.chunk_steps):
+            if k in masks:
+                parts.append(self.npz[masks[k]])
+            else:
+                parts.append(np.full(steps, k in chunks, dtype=bool))
+        return np.concatenate(parts)
+
+    def delta_table(self, key: str) -> dict:
+        """Raw change rows of a delta-encoded key: {"step", "slot", "present", <fields>...}."""
+        fields = [column[len(key) + 1:-1] for column in self.members if column.startswith(f"{key}[")]
+        if not fields:
+            raise KeyError(f"delta key {key} not in episode log")
+        table = {}
+        for field in fields:
+            chunks = self.members[f"{key}[{field}]"]
+            table[field] = np.concatenate([self.npz[chunks[k]] for k in sorted(chunks)])
+        return table
+
+    def expand(self, key: str, field: str = "quantity"):
+        """Rebuild the per-step state of a delta-encoded field: returns (slots, (T, n_slots) array)."""
+        table = self.delta_table(key)
+        slots = sorted(set(table["slot"].tolist()), key=lambda s: (not s.isdigit(), int(s) if s.isdigit() else 0, s))
+        slot_idx = {slot: i for i, slot in enumerate(slots)}
+        values = table[field]
+        fill = _fill_value(values.flat[0]) if values.size else 0
+        state = np.full((self.num_steps, len(slots)), fill, dtype=values.dtype)
+        current = np.full(len(slots), fill, dtype=values.dtype)
+        rows = np.argsort(table["step"], kind="stable")
+        bounds = np.searchsorted(table["step"][rows], np.arange(self.num_steps + 1))
+        for step in range(self.num_steps):
+            for row in rows[bounds[step]:bounds[step + 1]]:
+                current[slot_idx[table["slot"][row]]] = values[row] if table["present"][row] else fill
+            state[step] = current
+        return slots, state
+
+    def close(self):
+        self.npz.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_episode_log(file_path: Union[str, pathlib.Path], columns: List[str] = None) -> dict:
+    """Load some (default: all) step-indexed columns of an episode log into a dict."""
+    with EpisodeLog(file_path) as log:
+        return {column: log.column(column) for column in (columns or log.columns)}
+
+
+def convert_json_episode(info_path: Union[str, pathlib.Path], action_path: Union[str, pathlib.Path] = None,
+                         output_path: Union[str, pathlib.Path] = None, chunk_size: int = 256) -> pathlib.Path:
+    """Convert episode_N_info.json (+ episode_N_action.json) written by RecordCallback into a columnar log."""
+    info_path = pathlib.Path(info_path)
+    with open(info_path, encoding="utf-8") as f:
+        infos = json.load(f)
+    actions = [None] * len(infos)
+    if action_path:
+        with open(action_path, encoding="utf-8") as f:
+            actions = json.load(f)
+    if output_path is None:
+        output_path = info_path.with_name(info_path.name.replace("_info.json", "_log.npz"))
+    with EpisodeLogWriter(output_path, chunk_size=chunk_size) as writer:
+        for info, action in zip(infos, actions):
+            writer.append(info, action)
+    return pathlib.Path(output_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--info", type=str, required=True)
+    parser.add_argument("--action", type=str, default="")
+    parser.add_argument("--output", type=str, default="")
+    args = parser.parse_args()
+    output_path = convert_json_episode(args.info, args.action or None, args.output or None)
+    size = lambda p: pathlib.Path(p).stat().st_size / 1024
+    print(f"{args.info}: {size(args.info):.1f} KB" + (f" + {args.action}: {size(args.action):.1f} KB" if args.action else ""))
+    print(f"{output_path}: {size(output_path):.1f} KB")
+    with EpisodeLog(output_path) as log:
+        print(f"{log.num_steps} steps, {len(log.columns)} columns, delta keys: {log.delta_keys}")
@@ -0,0 +1,101 @@
+'''
+Memory-mapped frame store.
+
+Frames are written straight into a ``.npy`` file through ``np.memmap`` as they
+arrive, so an episode never has to be held in RAM. The file is pre-sized for
+``max_frames`` frames, grows by doubling when needed and is truncated to the
+real length on close. The result is a plain ``.npy`` file, so
+``np.load(path, mmap_mode="r")`` and ``read_frames`` can slice frame ranges
+without loading the whole episode.
+'''
+import pathlib
+from typing import Union
+import numpy as np
+
+# 固定长度的npy头，扩容/截断时只需原地重写shape，数据偏移不变
+HEADER_SIZE = 128
+
+
+def _write_header(file, shape: tuple, dtype: np.dtype):
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': tuple(shape)})
+    prefix = np.lib.format.magic(1, 0)
+    header_len = HEADER_SIZE - len(prefix) - 2
+    if len(header) + 1 > header_len:
+        raise ValueError(f"npy header too long for shape {shape}")
+    header = header.ljust(header_len - 1) + "\n"
+    file.seek(0)
+    file.write(prefix + header_len.to_bytes(2, "little") + header.encode("latin1"))
+
+
+class FrameStoreWriter:
+    """Append frames of one shape into a memory-mapped ``.npy`` file."""
+    def __init__(self, file_path: Union[str, pathlib.Path], max_frames: int = 1024, dtype=np.uint8):
+        self.file_path = pathlib.Path(file_path)
+        self.capacity = max(int(max_frames), 1)
+        self.dtype = np.dtype(dtype)
+        self.frame_shape = None
+        self.count = 0
+        self.memmap = None
+
+    def __len__(self):
+        return self.count
+
+    def append(self, frame: np.ndarray):
+        frame = np.asarray(frame)
+        if self.memmap is None:
+            self.frame_shape = frame.shape
+            self._open(self.capacity, create=True)
+        elif frame.shape != self.frame_shape:
+            raise ValueError(f"frame shape {frame.shape} does not match {self.frame_shape}")
+        if self.count >= self.capacity:
+            self._open(self.capacity * 2)
+        self.memmap[self.count] = frame
+        self.count += 1
+
+    def truncate(self, count: int = 0):
+        """Keep only the first ``count`` frames; later appends overwrite the rest."""
+        self.count = min(count, self.count)
+
+    def _open(self, capacity: int, create=False):
+        if self.memmap is not None:
+            self.memmap.flush()
+            self.memmap = None
+        frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        with open(self.file_path, "w+b" if create else "r+b") as file:
+            _write_header(file, (capacity,) + self.frame_shape, self.dtype)
+            file.truncate(HEADER_SIZE + capacity * frame_bytes)
+        self.capacity = capacity
+        self.memmap = np.memmap(self.file_path, dtype=self.dtype, mode="r+", offset=HEADER_SIZE,
+                                shape=(capacity,) + self.frame_shape)
+
+    def close(self):
+        """Shrink the file to the frames written. Returns the number of frames."""
+        if self.memmap is None:
+            return 0
+        self.memmap.flush()
+        self.memmap = None
+        frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        with open(self.file_path, "r+b") as file:
+            _write_header(file, (self.count,) + self.frame_shape, self.dtype)
+            file.truncate(HEADER_SIZE + self.count * frame_bytes)
+        return self.count
+
+    def abort(self):
+        self.memmap = None
+        self.file_path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_frames(file_path: Union[str, pathlib.Path]) -> np.ndarray:
+    """Read-only memory map of a whole frame file (also works for files written by ``np.save``)."""
+    return np.load(file_path, mmap_mode="r")
+
+
+def read_frames(file_path: Union[str, pathlib.Path], start: int = 0, stop: int = None, step: int = 1) -> np.ndarray:
+    """Load frames ``[start:stop:step]``; only that range is read from disk."""
+    return np.array(open_frames(file_path)[start:stop:step])
@@ -0,0 +1,175 @@
+'''
+In-memory recipe and tag index.
+
+``data/assets/recipes/*.json`` and ``data/assets/tag_items.json`` are read once per process by
+``get_recipe_index()``; afterwards recipe lookup by name or by result item and tag -> items lookup
+are dict accesses. Recipes are shared between callers, so treat them as read-only.
+
+The directory can be packed into one file, ``data/assets/recipes.pack``::
+
+    python -m mcabench.utils.recipe_index --build
+
+A pack is a magic line, a json header (lookup tables, tags and the offset/length of every recipe)
+and the concatenated recipe json. It is read through mmap and a recipe is only decoded when it is
+looked up, so a cold process touches one file instead of hundreds. Without a pack, or with a
+broken one, the directory is read as before. Rebuild the pack after editing the recipes.
+'''
+import io
+import json
+import mmap
+import struct
+import argparse
+from pathlib import Path
+from functools import lru_cache
+from collections.abc import Mapping
+from typing import List, Union
+
+ASSETS_DIR = Path(__file__).parents[2]/"data"/"assets"
+RECIPES_DIR = ASSETS_DIR/"recipes"
+TAG_ITEMS_PATH = ASSETS_DIR/"tag_items.json"
+PACKED_PATH = ASSETS_DIR/"recipes.pack"
+PREFIX = "minecraft:"
+PACK_MAGIC = b"MCARECIPES1\n"
+
+
+def strip_prefix(name:str) -> str:
+    return name[len(PREFIX):] if name.startswith(PREFIX) else name
+
+
+class RecipeIndex:
+    def __init__(self, recipes_dir:Union[str,Path]=RECIPES_DIR, tag_items_path:Union[str,Path]=TAG_ITEMS_PATH):
+        self.recipes = {}    # recipe name (file stem) -> recipe
+        self.by_result = {}  # result item -> [recipe name]
+        self.by_type = {}    # "minecraft:crafting_shaped" -> [recipe name]
+        for recipe_path in sorted(Path(recipes_dir).glob("*.json")):
+            if recipe_path.name.startswith("_"):  # _type_index.json
+                continue
+            with recipe_path.open(encoding="utf-8") as file:
+                self.add_recipe(recipe_path.stem, json.load(file))
+        with open(tag_items_path, encoding="utf-8") as file:
+            tag_info = json.load(file)
+        # tag -> items, 都去掉minecraft:前缀
+        self.tags = {strip_prefix(tag): [strip_prefix(item) for item in items] for tag, items in tag_info.items()}
+
+    def add_recipe(self, name:str, recipe:dict):
+        self.recipes[name] = recipe
+        result = recipe.get("result")
+        result_item = result.get("item") if isinstance(result, dict) else result
+        if result_item:
+            self.by_result.setdefault(strip_prefix(result_item), []).append(name)
+        self.by_type.setdefault(recipe.get("type"), []).append(name)
+
+    def recipe(self, name:str) -> dict:
+        """recipe by file name, with or without ``.json``"""
+        name = name[:-len(".json")] if name.endswith(".json") else name
+        if name not in self.recipes:
+            raise KeyError(f"recipe {name} not found")
+        return self.recipes[name]
+
+    def recipes_for(self, item:str) -> List[str]:
+        """names of the recipes whose result is ``item``"""
+        return self.by_result.get(strip_prefix(item), [])
+
+    def is_tag(self, name:str) -> bool:
+        return strip_prefix(name) in self.tags
+
+    def tag_items(self, tag:str) -> List[str]:
+        return self.tags[strip_prefix(tag)]
+
+
+class _PackedRecipes(Mapping):
+    """recipe name -> recipe, decoded from the mmap on first access"""
+    def __init__(self, buffer, offsets:dict, data_start:int):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.data_start = data_start
+        self.decoded = {}
+
+    def __getitem__(self, name:str) -> dict:
+        if name not in self.decoded:
+            offset, length = self.offsets[name]
+            start = self.data_start + offset
+            self.decoded[name] = json.loads(self.buffer[start:start + length])
+        return self.decoded[name]
+
+    def __contains__(self, name) -> bool:
+        return name in self.offsets
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+
+class PackedRecipeIndex(RecipeIndex):
+    """RecipeIndex over a pack written by ``pack_recipes``."""
+    def __init__(self, packed_path:Union[str,Path]=PACKED_PATH):
+        with open(packed_path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(PACK_MAGIC)] != PACK_MAGIC:
+            raise ValueError(f"{packed_path} is not a recipe pack")
+        header_start = len(PACK_MAGIC) + 8
+        header_len, = struct.unpack("<Q", self.buffer[len(PACK_MAGIC):header_start])
+        header = json.loads(self.buffer[header_start:header_start + header_len])
+        self.recipes = _PackedRecipes(self.buffer, header["offsets"], header_start + header_len)
+        self.by_result = header["by_result"]
+        self.by_type = header["by_type"]
+        self.tags = header["tags"]
+
+
+def pack_recipes(recipes_dir:Union[str,Path]=RECIPES_DIR, tag_items_path:Union[str,Path]=TAG_ITEMS_PATH,
+                 packed_path:Union[str,Path]=PACKED_PATH) -> Path:
+    """Pack a recipe directory and its tag file into one file."""
+    index = RecipeIndex(recipes_dir, tag_items_path)
+    data = io.BytesIO()
+    offsets = {}
+    for name, recipe in index.recipes.items():
+        blob = json.dumps(recipe, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        offsets[name] = (data.tell(), len(blob))
+        data.write(blob)
+    header = json.dumps({
+        "offsets": offsets,
+        "by_result": index.by_result,
+        "by_type": index.by_type,
+        "tags": index.tags,
+    }, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    packed_path = Path(packed_path)
+    tmp_path = packed_path.with_name(packed_path.name + ".tmp")
+    with open(tmp_path, "wb") as file:
+        file.write(PACK_MAGIC + struct.pack("<Q", len(header)) + header)
+        file.write(data.getvalue())
+    tmp_path.replace(packed_path)
+    return packed_path
+
+
+@lru_cache(maxsize=None)
+def _load_recipe_index(recipes_dir:Path, tag_items_path:Path) -> RecipeIndex:
+    # recipes目录旁边的recipes.pack优先，损坏或缺失时读目录
+    packed_path = recipes_dir.with_name(recipes_dir.name + ".pack")
+    if packed_path.exists():
+        try:
+            return PackedRecipeIndex(packed_path)
+        except (ValueError, KeyError, struct.error) as e:
+            print(f"can't read {packed_path}, fall back to {recipes_dir}: {e}")
+    return RecipeIndex(recipes_dir, tag_items_path)
+
+
+def get_recipe_index(recipes_dir:Union[str,Path]=RECIPES_DIR, tag_items_path:Union[str,Path]=TAG_ITEMS_PATH) -> RecipeIndex:
+    """the process-wide index of these files, built on first use"""
+    return _load_recipe_index(Path(recipes_dir).resolve(), Path(tag_items_path).resolve())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--build", action="store_true")
+    parser.add_argument("--recipes-dir", type=str, default=str(RECIPES_DIR))
+    parser.add_argument("--tag-items", type=str, default=str(TAG_ITEMS_PATH))
+    parser.add_argument("--output", type=str, default="")
+    args = parser.parse_args()
+    recipes_dir = Path(args.recipes_dir)
+    packed_path = Path(args.output) if args.output else recipes_dir.with_name(recipes_dir.name + ".pack")
+    if args.build:
+        pack_recipes(recipes_dir, args.tag_items, packed_path)
+    index = PackedRecipeIndex(packed_path)
+    print(f"{packed_path}: {packed_path.stat().st_size / 1024:.1f} KB, {len(index.recipes)} recipes, {len(index.tags)} tags")
@@ -0,0 +1,30 @@
+#!/bin/bash
+
+base_url=http://localhost:9000/v1
+workers=5
+split_number=30
+max_frames=400
+temperature=0.8
+history_num=0
+action_chunk_len=1
+instruction_type="recipe"
+model_name_or_path="/public/models/JarvisVLA-qwen2-vl-7b"
+model_local_path="JarvisVLA-qwen2-vl-7b"
+
+# 在一个进程里评测所有任务，也可以用 --task-list data/task_config/list.txt
+python mcabench/evaluate/evaluate.py \
+    --agent-mode "rt2" \
+    --workers $workers \
+    --split-number $split_number \
+    --sim-pool \
+    --stream-record \
+    --task-glob "craft/*" "smelt/*" \
+    --max-frames $max_frames \
+    --temperature $temperature \
+    --model-path $model_name_or_path \
+    --demo "" \
+    --video-main-fold "/publicX/lmy/evaluate/$model_local_path" \
+    --base-url "$base_url" \
+    --history-num $history_num \
+    --instruction-type $instruction_type \
+    --action-chunk-len $action_chunk_len \
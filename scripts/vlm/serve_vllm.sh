@@ -12,7 +12,9 @@ CUDA_VISIBLE_DEVICES=$cuda_visible_devices vllm serve $model_name_or_path \
     --tensor-parallel-size $card_num \
     --trust-remote-code \
     --served_model_name "jarvisvla-qwen2-vl" \
-    --limit-mm-per-prompt image=5 \
+    --limit-mm-per-prompt image=5
     #--dtype "float32" \
     #--kv-cache-dtype "fp8" \
 
+# --image-transport file 需要在上面加上 --allowed-local-media-path "/dev/shm/mcabench"
+
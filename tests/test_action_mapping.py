@@ -0,0 +1,114 @@
+import copy
+import random
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("minestudio")
+
+from mcabench.agents import action_mapping
+
+
+def token_2_group_action_reference(tokenizer, tokens):
+    """The loop-based decoder that token_2_group_action replaced."""
+    actions = []
+    action_base = [0] * len(tokenizer.bases)
+    camera_null = [tokenizer.bases[-1] // 2, tokenizer.bases[-2] // 2]
+    action_base[-2:] = camera_null
+    start_idx = 0
+    while start_idx < len(tokens):
+        try:
+            first_index_n1 = tokens.index(tokenizer.act_beg_id, start_idx)
+            first_index_n2 = tokens.index(tokenizer.act_end_id, first_index_n1 + 1)
+        except ValueError:
+            break
+        action = copy.copy(action_base)
+        for token in tokens[first_index_n1 + 1:first_index_n2]:
+            place, num = action_mapping.remap_control_token(token, use_num=True, tokenizer_type=tokenizer.tokenizer_type)
+            if place != -1:
+                action[place] = num
+        if action[-2:] != camera_null:
+            action[-4] = 1
+        actions.append(copy.copy(action))
+        start_idx = first_index_n2 + 1
+    if len(actions) == 0:
+        actions.append(action_base)
+    return actions
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return action_mapping.get_action_tokenizer("qwen2_vl")
+
+
+def random_tokens(tokenizer, rng):
+    """Control tokens of random groups, mixed with tags, text tokens and truncated segments."""
+    noise = [tokenizer.act_beg_id, tokenizer.act_end_id, 151643, 872, 151834, 151900]
+    tokens = []
+    for _ in range(rng.randint(0, 6)):
+        if rng.random() < 0.8:
+            tokens.append(tokenizer.act_beg_id)
+        for _ in range(rng.randint(0, 8)):
+            if rng.random() < 0.2:
+                tokens.append(rng.choice(noise))
+            else:
+                place = rng.randrange(len(tokenizer.bases))
+                num = rng.randrange(tokenizer.bases[place])
+                tokens.append(action_mapping.map_control_token(num, place, tokenizer.tokenizer_type, not_text=True))
+        if rng.random() < 0.8:
+            tokens.append(tokenizer.act_end_id)
+    return tokens
+
+
+def test_token_2_group_action_matches_reference(tokenizer):
+    rng = random.Random(0)
+    for _ in range(2000):
+        tokens = random_tokens(tokenizer, rng)
+        assert tokenizer.token_2_group_action(tokens) == token_2_group_action_reference(tokenizer, tokens), tokens
+
+
+def test_token_2_group_action_inputs(tokenizer):
+    tokens = random_tokens(tokenizer, random.Random(1))
+    expected = token_2_group_action_reference(tokenizer, tokens)
+    assert tokenizer.token_2_group_action(np.array(tokens)) == expected
+    assert tokenizer.token_2_group_action(torch.tensor([tokens])) == expected
+    assert tokenizer.token_2_group_action([]) == token_2_group_action_reference(tokenizer, [])
+
+
+def random_env_steps(tokenizer, rng, num):
+    steps = []
+    for _ in range(num):
+        step = {key: int(rng.random() < 0.2) for key in tokenizer.null_action if key != "camera"}
+        step["camera"] = [rng.uniform(-10, 10), rng.uniform(-10, 10)] if rng.random() < 0.7 else [0.0, 0.0]
+        steps.append(step)
+    return steps
+
+
+def test_encode_batch_matches_per_step_encoding(tokenizer):
+    steps = random_env_steps(tokenizer, random.Random(2), 300)
+    trajectory = tokenizer.stack_env_actions(steps)
+    decimals = tokenizer.env_action_2_decimal_action(trajectory)
+    token_ids, lengths = tokenizer.encode_batch(trajectory, pad_id=-1)
+    assert token_ids.shape[0] == len(steps)
+    for row, length, decimal in zip(token_ids, lengths, decimals):
+        group_action = tokenizer.decimal_action_2_group_action(tuple(decimal.tolist()))
+        expected = [tokenizer.act_beg_id]
+        expected += [action_mapping.map_control_token(num, i, tokenizer.tokenizer_type, not_text=True)
+                     for i, num in enumerate(group_action[:-4]) if num != 0]
+        expected += [action_mapping.map_control_token(num, i, tokenizer.tokenizer_type, not_text=True)
+                     for i, num in list(enumerate(group_action))[-2:]]
+        expected.append(tokenizer.act_end_id)
+        assert row[:length].tolist() == expected
+        assert (row[length:] == -1).all()
+        # the decoder reads the ids back to the same decimal action; the inventory group is not encoded
+        if decimal[0] != 8640:
+            assert tokenizer.group_action_2_decimal_action(tokenizer.token_2_group_action(row[:length].tolist())[0]) == tuple(decimal.tolist())
+
+
+def test_batched_base_conversion_matches_scalar(tokenizer):
+    steps = random_env_steps(tokenizer, random.Random(3), 300)
+    decimals = tokenizer.env_action_2_decimal_action(tokenizer.stack_env_actions(steps))
+    group_actions = tokenizer.decimal_action_2_group_action(decimals)
+    assert group_actions.tolist() == [list(tokenizer.decimal_action_2_group_action(tuple(d))) for d in decimals.tolist()]
+    assert (tokenizer.group_action_2_decimal_action(group_actions) == decimals).all()
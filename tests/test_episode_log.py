@@ -0,0 +1,94 @@
+import json
+import pathlib
+import random
+
+import numpy as np
+
+from mcabench.utils.episode_log import EpisodeLog, EpisodeLogWriter, convert_json_episode, load_episode_log
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+
+
+def random_episode(num_steps, seed=0):
+    rng = random.Random(seed)
+    items = ["none", "oak_log", "stick", "iron_ingot", "crafting_table"]
+    inventory = {str(slot): {"type": "none", "quantity": 0} for slot in range(9)}
+    infos, actions = [], []
+    for step in range(num_steps):
+        for _ in range(rng.randint(0, 2)):
+            slot = str(rng.randrange(12))
+            if rng.random() < 0.15:
+                inventory.pop(slot, None)
+            else:
+                item = rng.choice(items)
+                inventory[slot] = {"type": item, "quantity": 0 if item == "none" else rng.randint(1, 64)}
+        info = {
+            "health": float(rng.randint(1, 20)),
+            "food_level": rng.randint(0, 20),
+            "location_stats": {"xpos": rng.uniform(-100, 100), "ypos": 64.0},
+            "inventory": {slot: dict(record) for slot, record in inventory.items()},
+            "pov": np.zeros((4, 4, 3), dtype=np.uint8),
+        }
+        if step % 3 == 0:
+            info["message"] = f"step {step}"
+        infos.append(info)
+        actions.append({"attack": rng.randint(0, 1), "camera": [rng.uniform(-10, 10), rng.uniform(-10, 10)]})
+    return infos, actions
+
+
+def write_episode(path, infos, actions, chunk_size):
+    with EpisodeLogWriter(path, chunk_size=chunk_size) as writer:
+        for step, (info, action) in enumerate(zip(infos, actions)):
+            writer.append(info, action, reward=float(step))
+
+
+def test_columns_round_trip(tmp_path):
+    infos, actions = random_episode(50)
+    path = tmp_path / "episode_log.npz"
+    write_episode(path, infos, actions, chunk_size=7)
+    with EpisodeLog(path) as log:
+        assert log.num_steps == 50
+        assert "pov" not in log.columns
+        np.testing.assert_array_equal(log.column("health"), [info["health"] for info in infos])
+        np.testing.assert_array_equal(log.column("food_level"), [info["food_level"] for info in infos])
+        np.testing.assert_array_equal(log.column("location_stats/xpos"), [info["location_stats"]["xpos"] for info in infos])
+        np.testing.assert_array_equal(log.column("action/camera"), [action["camera"] for action in actions])
+        np.testing.assert_array_equal(log.column("reward"), np.arange(50, dtype=float))
+        # sparse column: present every third step, the mask tells which
+        valid = log.column("message@valid")
+        np.testing.assert_array_equal(valid, [step % 3 == 0 for step in range(50)])
+        assert log.column("message")[valid].tolist() == [info["message"] for info in infos if "message" in info]
+
+
+def test_delta_encoding_round_trip(tmp_path):
+    infos, actions = random_episode(80, seed=1)
+    path = tmp_path / "episode_log.npz"
+    write_episode(path, infos, actions, chunk_size=16)
+    with EpisodeLog(path) as log:
+        assert log.delta_keys == ["inventory"]
+        # only changed slots are stored
+        assert len(log.delta_table("inventory")["step"]) < 80 * 9
+        for field in ("type", "quantity"):
+            slots, state = log.expand("inventory", field)
+            for step, info in enumerate(infos):
+                fill = "" if field == "type" else 0
+                expected = [info["inventory"][slot][field] if slot in info["inventory"] else fill for slot in slots]
+                assert state[step].tolist() == expected, (field, step)
+
+
+def test_convert_json_episode(tmp_path):
+    info_path = tmp_path / "episode_1_info.json"
+    info_path.write_bytes((REPO / "episode_1_info.json").read_bytes())
+    output_path = convert_json_episode(info_path, REPO / "episode_1_action.json", chunk_size=64)
+    with open(info_path, encoding="utf-8") as f:
+        infos = json.load(f)
+    columns = load_episode_log(output_path, ["health", "location_stats/xpos"])
+    np.testing.assert_array_equal(columns["health"], [info["health"] for info in infos])
+    np.testing.assert_array_equal(columns["location_stats/xpos"], [info["location_stats"]["xpos"] for info in infos])
+    with EpisodeLog(output_path) as log:
+        slots, state = log.expand("inventory", "quantity")
+        for step, info in enumerate(infos):
+            assert state[step].tolist() == [info["inventory"][slot]["quantity"] for slot in slots]
+        slots, state = log.expand("equipped_items", "type")
+        for step, info in enumerate(infos):
+            assert state[step].tolist() == [info["equipped_items"][slot]["type"] for slot in slots]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from mcabench.utils.frame_store import FrameStoreWriter, open_frames, read_frames
+
+
+def random_frames(num, shape=(6, 8, 3), seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (num,) + shape, dtype=np.uint8)
+
+
+def test_grow_past_capacity(tmp_path):
+    frames = random_frames(11)
+    path = tmp_path / "frames.npy"
+    with FrameStoreWriter(path, max_frames=2) as writer:
+        for frame in frames:
+            writer.append(frame)
+        assert writer.capacity == 16
+        assert len(writer) == 11
+    # close truncates the file to the frames written; it is a plain .npy file
+    np.testing.assert_array_equal(np.load(path), frames)
+    assert path.stat().st_size == 128 + frames.nbytes
+    np.testing.assert_array_equal(read_frames(path, 3, 9, 2), frames[3:9:2])
+    assert open_frames(path).shape == frames.shape
+
+
+def test_truncate_then_append(tmp_path):
+    frames = random_frames(10)
+    path = tmp_path / "frames.npy"
+    writer = FrameStoreWriter(path, max_frames=4)
+    for frame in frames[:7]:
+        writer.append(frame)
+    writer.truncate(3)
+    for frame in frames[7:]:
+        writer.append(frame)
+    assert writer.close() == 6
+    np.testing.assert_array_equal(np.load(path), np.concatenate((frames[:3], frames[7:])))
+    # truncating never extends the store
+    writer = FrameStoreWriter(tmp_path / "short.npy")
+    writer.append(frames[0])
+    writer.truncate(5)
+    assert writer.close() == 1
+
+
+def test_shape_mismatch_and_abort(tmp_path):
+    path = tmp_path / "frames.npy"
+    writer = FrameStoreWriter(path)
+    writer.append(random_frames(1)[0])
+    with pytest.raises(ValueError):
+        writer.append(random_frames(1, shape=(4, 4, 3))[0])
+    writer.abort()
+    assert not path.exists()
+    assert FrameStoreWriter(tmp_path / "empty.npy").close() == 0
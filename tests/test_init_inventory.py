@@ -0,0 +1,97 @@
+import copy
+import types
+
+import pytest
+
+pytest.importorskip("minecraft_data")
+pytest.importorskip("minestudio")
+
+from mcabench.minestudio_plus.simulator.callbacks.init_inventory import InitInventoryCallback, InventoryReadiness
+
+EQUIPMENT_SLOTS = ("mainhand", "offhand", "head", "chest", "legs", "feet")
+
+
+def make_obs(inventory=None, equipped=None, str_keys=False):
+    """A raw obs with every slot empty except the given ones; equipment reports empty slots as air."""
+    slots = {slot: {"type": "none", "quantity": 0} for slot in range(36)}
+    for slot, (item_type, quantity) in (inventory or {}).items():
+        slots[slot] = {"type": item_type, "quantity": quantity}
+    if str_keys:
+        slots = {str(slot): record for slot, record in slots.items()}
+    equipped_items = {name: {"type": "air", "damage": 0, "maxDamage": 0} for name in EQUIPMENT_SLOTS}
+    for name, item_type in (equipped or {}).items():
+        equipped_items[name]["type"] = item_type
+    return {"inventory": slots, "equipped_items": equipped_items}
+
+
+def test_ready_once_every_slot_lands():
+    expected = {0: ("oak_log", 4), 5: ("stick", 12), 36: ("iron_boots", None), 40: ("oak_planks", None)}
+    readiness = InventoryReadiness(expected)
+    assert not readiness.update(make_obs({0: ("oak_log", 4)}))
+    assert readiness.pending == {5, 36, 40}
+    # wrong quantity keeps the slot pending
+    assert not readiness.update(make_obs({0: ("oak_log", 4), 5: ("stick", 11)}, {"feet": "minecraft:iron_boots"}))
+    assert readiness.pending == {5, 40}
+    assert readiness.update(make_obs({0: ("oak_log", 4), 5: ("minecraft:stick", 12)},
+                                     {"feet": "iron_boots", "offhand": "oak_planks"}, str_keys=True))
+    assert readiness.ready
+
+
+def test_unexpected_items_stay_pending():
+    readiness = InventoryReadiness({3: ("stick", 1)})
+    assert not readiness.update(make_obs({3: ("stick", 1), 7: ("dirt", 1)}, {"head": "golden_helmet"}))
+    assert readiness.pending == {7, 39}
+    # an empty slot matches regardless of the reported quantity, and air counts as empty
+    assert readiness.update(make_obs({3: ("stick", 1), 7: ("air", 1)}))
+
+
+class FakeEnv:
+    """Applies one queued inventory change per env step, like /replaceitem landing with a delay."""
+    def __init__(self, landing):
+        self.landing = list(landing)
+        self.obs = make_obs()
+        self.steps = 0
+
+    def noop_action(self):
+        return {}
+
+    def step(self, action):
+        self.steps += 1
+        if self.landing:
+            slot, record = self.landing.pop(0)
+            self.obs["inventory"][slot] = record
+        return copy.deepcopy(self.obs), 0.0, False, {}
+
+
+def make_callback(**kwargs):
+    items_library = {"oak_log": {"stackSize": 64}, "stick": {"stackSize": 64}, "air": {"stackSize": 64},
+                     "iron_boots": {"stackSize": 1}}
+    return InitInventoryCallback([], items_library=items_library, equipments_library={name: [] for name in EQUIPMENT_SLOTS},
+                                 backoff=0, max_backoff=0, **kwargs)
+
+
+def test_build_commands_expected_inventory():
+    callback = make_callback()
+    chats, expected = callback._build_commands([
+        {"slot": 0, "type": "oak_log", "quantity": 4},
+        {"slot": 2, "type": "air", "quantity": 1},
+        {"slot": 36, "type": "iron_boots", "quantity": 1},
+    ])
+    assert len(chats) == 3 and all(chat.startswith("/replaceitem entity @p ") for chat in chats)
+    assert expected == {0: ("oak_log", 4), 2: ("none", 0), 36: ("iron_boots", None)}
+
+
+def test_wait_until_ready_polls_until_match():
+    callback = make_callback(max_wait_steps=10)
+    env = FakeEnv([(0, {"type": "oak_log", "quantity": 4}), (1, {"type": "stick", "quantity": 2})])
+    sim = types.SimpleNamespace(env=env)
+    readiness = InventoryReadiness({0: ("oak_log", 4), 1: ("stick", 2)})
+    *_, kdx, inventory_infos = callback.wait_until_ready(sim, readiness, make_obs(), {})
+    assert readiness.ready and kdx == 2 and env.steps == 2
+    assert [info["current_inventory"][1]["quantity"] for info in inventory_infos] == [0, 2]
+
+    # a slot that never lands stops at the step budget
+    env = FakeEnv([])
+    readiness = InventoryReadiness({0: ("oak_log", 4)})
+    *_, kdx, _ = callback.wait_until_ready(types.SimpleNamespace(env=env), readiness, make_obs(), {})
+    assert not readiness.ready and kdx == 10 and readiness.pending == {0}
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+from PIL import Image
+
+from mcabench.agents.local_engine import LocalInferenceEngine
+
+SPECIAL_TOKENS = ["<|endoftext|>", "<|im_start|>", "<|im_end|>", "<|vision_start|>", "<|vision_end|>", "<|image_pad|>", "<|video_pad|>"]
+CHAT_TEMPLATE = """{% for message in messages %}<|im_start|>{{ message['role'] }}
+{% if message['content'] is string %}{{ message['content'] }}<|im_end|>
+{% else %}{% for content in message['content'] %}{% if content['type'] == 'image' %}<|vision_start|><|image_pad|><|vision_end|>{% elif content['type'] == 'text' %}{{ content['text'] }}{% endif %}{% endfor %}<|im_end|>
+{% endif %}{% endfor %}{% if add_generation_prompt %}<|im_start|>assistant
+{% endif %}"""
+MAX_TOKENS = 12
+
+
+def tiny_qwen2_vl(seed=0):
+    """A randomly initialized two-layer Qwen2-VL with a byte-level tokenizer, built offline."""
+    from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+    byte_level = tokenizers.Tokenizer(tokenizers.models.BPE(vocab={c: i for i, c in enumerate(bytes_to_unicode().values())}, merges=[]))
+    byte_level.pre_tokenizer = tokenizers.pre_tokenizers.ByteLevel(add_prefix_space=False)
+    byte_level.decoder = tokenizers.decoders.ByteLevel()
+    tokenizer = transformers.Qwen2TokenizerFast(tokenizer_object=byte_level, eos_token="<|im_end|>", pad_token="<|endoftext|>",
+                                                unk_token=None, bos_token=None)
+    tokenizer.add_special_tokens({"additional_special_tokens": SPECIAL_TOKENS})
+    image_processor = transformers.Qwen2VLImageProcessor(min_pixels=56 * 56, max_pixels=112 * 112)
+    processor = transformers.Qwen2VLProcessor(image_processor=image_processor, tokenizer=tokenizer, chat_template=CHAT_TEMPLATE)
+    ids = {token: tokenizer.convert_tokens_to_ids(token) for token in SPECIAL_TOKENS}
+    config = transformers.Qwen2VLConfig(
+        vocab_size=len(tokenizer), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=4096,
+        vision_config=dict(depth=1, embed_dim=32, num_heads=2, hidden_size=64, patch_size=14, spatial_merge_size=2,
+                           temporal_patch_size=2, in_chans=3, mlp_ratio=2),
+        rope_scaling={"type": "mrope", "mrope_section": [4, 2, 2]},
+        image_token_id=ids["<|image_pad|>"], video_token_id=ids["<|video_pad|>"], vision_start_token_id=ids["<|vision_start|>"],
+        eos_token_id=ids["<|im_end|>"], pad_token_id=ids["<|endoftext|>"])
+    torch.manual_seed(seed)
+    model = transformers.Qwen2VLForConditionalGeneration(config).eval()
+    model.generation_config.eos_token_id = ids["<|im_end|>"]
+    return model, processor
+
+
+@pytest.fixture(scope="module")
+def tiny():
+    return tiny_qwen2_vl()
+
+
+@pytest.fixture(scope="module")
+def images():
+    rng = np.random.default_rng(0)
+    return [Image.fromarray(rng.integers(0, 256, (84, 112, 3), dtype=np.uint8)) for _ in range(3)]
+
+
+def chat_request(instruction, images, **kwargs):
+    content = [{"type": "text", "text": instruction}]
+    for image in images:
+        content += [{"type": "text", "text": "\nobservation: "}, {"type": "image", "image": image}]
+    system = {"role": "system", "content": "You are a Minecraft agent. Follow the instruction.\n"}
+    return dict(dict(messages=[system, {"role": "user", "content": content}], temperature=0, max_tokens=MAX_TOKENS), **kwargs)
+
+
+def greedy_reference(model, processor, request):
+    """model.generate on the unpadded prompt: (content, summed logprob of the generated tokens including EOS)"""
+    text = processor.apply_chat_template(request["messages"], add_generation_prompt=True)
+    images = [part["image"] for message in request["messages"] if isinstance(message["content"], list)
+              for part in message["content"] if part["type"] == "image"]
+    inputs = processor(text=[text], images=images or None, return_tensors="pt")
+    with torch.no_grad():
+        outputs = model.generate(**inputs, max_new_tokens=MAX_TOKENS, do_sample=False, output_logits=True, return_dict_in_generate=True)
+    tokens = outputs.sequences[0, inputs.input_ids.shape[1]:].tolist()
+    logprob = sum(float(torch.log_softmax(logits[0].double(), -1)[token]) for logits, token in zip(outputs.logits, tokens))
+    content = processor.tokenizer.decode([token for token in tokens if token != model.generation_config.eos_token_id], skip_special_tokens=False)
+    return content, logprob
+
+
+def test_batched_matches_unbatched(tiny, images):
+    model, processor = tiny
+    engine = LocalInferenceEngine("tiny", model=model, processor=processor, min_prefix_len=10 ** 9)
+    requests = [chat_request("craft a stick.", images[:1]),
+                chat_request("craft a crafting table please.", images[1:3]),
+                chat_request("mine oak log", [])]
+    expected = [greedy_reference(model, processor, request)[0] for request in requests]
+    assert [engine.generate_batch([request])[0] for request in requests] == expected
+    assert engine.generate_batch(requests) == expected
+    assert engine.generate_batch(requests[::-1]) == expected[::-1]
+    # submit from several callers is batched by the worker thread with the same results
+    assert [future.result(timeout=60) for future in [engine.submit(request) for request in requests]] == expected
+
+
+def test_prefix_reuse_matches_cold_prefill(tiny, images):
+    model, processor = tiny
+    requests = [chat_request("craft a stick.", images[:1]), chat_request("craft a stick.", images[1:3])]
+    cold = LocalInferenceEngine("tiny", model=model, processor=processor, min_prefix_len=10 ** 9)
+    warm = LocalInferenceEngine("tiny", model=model, processor=processor, min_prefix_len=4)
+    expected = cold.generate_batch(requests)
+    assert warm.generate_batch(requests) == expected
+    # second round: the system prompt + instruction is served from the prefix cache
+    prefill_tokens = warm.stats["prefill_tokens"]
+    assert warm.generate_batch(requests[::-1]) == expected[::-1]
+    assert warm.stats["prefill_tokens"] - prefill_tokens < cold.stats["prefill_tokens"]
+    assert warm.stats["image_cache_hits"] >= 3
+
+
+def test_n_samples(tiny, images):
+    model, processor = tiny
+    engine = LocalInferenceEngine("tiny", model=model, processor=processor, min_prefix_len=4)
+    samples = engine.generate_batch([chat_request("craft a stick.", images[:1], temperature=0.9, n=3)])[0]
+    assert len(samples) == 3
+    assert all(isinstance(content, str) and np.isfinite(logprob) and logprob <= 0 for content, logprob in samples)
+    # without n the result is the bare content
+    assert isinstance(engine.generate_batch([chat_request("craft a stick.", images[:1])])[0], str)
+
+
+def test_logprob_includes_eos(images):
+    """Like vLLM's cumulative_logprob, the EOS token that ends a sample is counted in its logprob."""
+    model, processor = tiny_qwen2_vl()
+    request = chat_request("craft a stick.", images[:1])
+    # make the third greedy token the EOS so that the sample stops early
+    text = processor.apply_chat_template(request["messages"], add_generation_prompt=True)
+    inputs = processor(text=[text], images=[images[0]], return_tensors="pt")
+    with torch.no_grad():
+        tokens = model.generate(**inputs, max_new_tokens=3, do_sample=False)[0, inputs.input_ids.shape[1]:].tolist()
+    model.generation_config.eos_token_id = tokens[2]
+    content, logprob = greedy_reference(model, processor, request)
+    engine = LocalInferenceEngine("tiny", model=model, processor=processor, min_prefix_len=4)
+    samples = engine.generate_batch([dict(request, n=2)])[0]
+    assert [sample[0] for sample in samples] == [content, content]
+    assert all(sample[1] == pytest.approx(logprob, abs=1e-4) for sample in samples)
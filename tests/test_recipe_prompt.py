@@ -0,0 +1,82 @@
+import json
+from collections import Counter
+
+import pytest
+
+from mcabench.agents.vla import recipe_prompt
+from mcabench.utils.recipe_index import RECIPES_DIR
+
+
+def old_recipe_prompt(env_prompt, prompt_library):
+    """RT2AGENT.create_recipe_prompt before the prompt table, reading the recipe json directly."""
+    recipe = prompt_library.get(env_prompt, {}).get("recipe")
+    if recipe:
+        return "\nArrange the materials in the crafting grid according to the following pattern: \n" + recipe[0]
+    item_name = env_prompt.replace(" ", "_").split(":")[-1]
+    recipe_path = RECIPES_DIR / f"{item_name}.json"
+    if not recipe_path.exists():
+        return ""
+    with open(recipe_path) as file:
+        recipe_file = json.load(file)
+    recipe_type = recipe_file.get("type", None)
+    get_name = lambda ingredient: ingredient.get("item") or ingredient.get("tag")
+    prompt = ""
+    if not recipe_type:
+        return ""
+    elif recipe_type == "minecraft:crafting_shapeless":
+        prompt += f"\nYou will need the following ingredients: \n"
+        ingredients_list = []
+        for ingredient in recipe_file.get("ingredients", None):
+            ingredient_name = get_name(ingredient)
+            if not ingredient_name:
+                break
+            ingredients_list.append(ingredient_name[10:].replace("_", " "))
+        for item, number in Counter(ingredients_list).items():
+            prompt += f"{number} {item}, "
+        prompt += "\n"
+    elif recipe_type == "minecraft:crafting_shaped":
+        prompt += "\nArrange the materials in the crafting grid according to the following pattern: \n"
+        patterns = recipe_file.get("pattern", None)
+        if not patterns:
+            return ""
+        ingredients_dict = {mark: get_name(value)[10:] for mark, value in recipe_file.get("key", {}).items()}
+        prompt += "\n"
+        for pattern_line in patterns:
+            for pattern_mark in pattern_line:
+                prompt += f" {'air' if pattern_mark == ' ' else ingredients_dict.get(pattern_mark, 'air')} |"
+            if prompt[-1] == '|':
+                prompt = prompt[:-1]
+                prompt += "\n"
+        prompt += "\n"
+    else:
+        return ""
+    result_num = recipe_file.get("result", {}).get("count", 1)
+    prompt += f"and get {result_num} {item_name.replace('_', ' ')}. \n"
+    return prompt
+
+
+@pytest.fixture(scope="module")
+def prompt_library():
+    with open(recipe_prompt.INSTRUCTIONS_PATH) as file:
+        return json.load(file)
+
+
+def env_prompts(prompt_library):
+    prompts = list(prompt_library)
+    for recipe_path in sorted(RECIPES_DIR.glob("*.json")):
+        prompts += [f"craft_item:{recipe_path.stem}", recipe_path.stem.replace("_", " ")]
+    return prompts + ["craft_item:no_such_item", "mine_block:dirt"]
+
+
+def test_lookup_matches_old_builder(prompt_library):
+    table = recipe_prompt.build_prompt_table(prompt_library=prompt_library)
+    for env_prompt in env_prompts(prompt_library):
+        assert recipe_prompt.lookup_recipe_prompt(env_prompt, table) == old_recipe_prompt(env_prompt, prompt_library), env_prompt
+
+
+def test_shipped_table_is_current():
+    if not recipe_prompt.PROMPT_TABLE_PATH.exists():
+        pytest.skip("recipe_prompts.json not generated")
+    with open(recipe_prompt.PROMPT_TABLE_PATH) as file:
+        shipped = json.load(file)
+    assert shipped == recipe_prompt.build_prompt_table(), "rerun python -m mcabench.agents.vla.recipe_prompt"
@@ -0,0 +1,54 @@
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip("av")
+pytest.importorskip("cv2")
+pytest.importorskip("minestudio")
+pytest.importorskip("gymnasium")
+pytest.importorskip("omegaconf")
+
+from mcabench.minestudio_plus.simulator.callbacks.record import RecordCallback
+
+
+def boom(*args):
+    raise RuntimeError("boom")
+
+
+def make_callback(tmp_path):
+    return RecordCallback(record_path=tmp_path, fps=20, stream_encode=True, show_actions=True,
+                          record_npy_observation=True, max_frames=8)
+
+
+def step(callback, sim, frame):
+    callback.before_step(sim, {"attack": 0})
+    callback.after_step(sim, None, 0.0, False, False, {"pov": frame})
+
+
+@pytest.mark.parametrize("failing", [0, 1])
+def test_failed_writer_releases_every_writer(tmp_path, failing):
+    callback = make_callback(tmp_path)
+    sim = types.SimpleNamespace(callback_messages=set())
+    frame = np.zeros((64, 96, 3), dtype=np.uint8)
+    callback.after_reset(sim, None, {"pov": frame})
+    step(callback, sim, frame)
+    writers = list(callback.writers)
+    assert len(writers) == 2  # raw + demo
+    # the raw writer (0) or the demo writer (1) fails while encoding
+    writers[failing].render = boom
+    with pytest.raises(RuntimeError, match="boom"):
+        for _ in range(100):
+            step(callback, sim, frame)
+        callback.before_close(sim)
+    if callback.writers:
+        # the error surfaced in write(); saving the episode still closes everything
+        with pytest.raises(RuntimeError, match="boom"):
+            callback.before_close(sim)
+    for writer in writers:
+        writer.thread.join(timeout=10)
+        assert not writer.thread.is_alive()
+    assert callback.writers == [] and callback.frame_store is None
+    assert callback.frames == [] and callback.stream_idx == 0
+    # the frames written before the failure are kept
+    assert np.load(tmp_path / "episode_0.npy").shape[1:] == frame.shape
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("transformers")
+pytest.importorskip("minestudio")
+
+from mcabench.agents.vla.vla_agent import select_sample
+
+
+def chunk(*actions):
+    return [{"buttons": np.array(buttons), "camera": np.array(camera)} for buttons, camera in actions]
+
+
+A, B, C = (0, 60), (1, 60), (2, 55)
+
+
+def test_vote_picks_most_frequent_chunk():
+    chunks = [chunk(A), chunk(B), chunk(B), chunk(C)]
+    assert select_sample(chunks) == 1
+    # ties are broken by logprob, then by order
+    chunks = [chunk(A), chunk(B), chunk(B), chunk(A)]
+    assert select_sample(chunks) == 0
+    assert select_sample(chunks, logprobs=[-3.0, -2.0, -1.0, -4.0]) == 2
+    # a more frequent chunk wins over a higher logprob
+    assert select_sample([chunk(A), chunk(B), chunk(B)], logprobs=[-0.1, -5.0, -6.0]) == 1
+
+
+def test_vote_compares_the_first_chunk_len_actions():
+    chunks = [chunk(A, B), chunk(A, C), chunk(B, C)]
+    assert select_sample(chunks, chunk_len=1) == 0
+    assert select_sample(chunks, logprobs=[-2.0, -1.0, -0.5], chunk_len=1) == 1
+    # with the whole chunk compared every candidate is unique, so the logprob decides
+    assert select_sample(chunks, logprobs=[-2.0, -1.0, -0.5], chunk_len=2) == 2
+
+
+def test_logprob_selection():
+    chunks = [chunk(A), chunk(B), chunk(B)]
+    assert select_sample(chunks, logprobs=[-0.5, -2.0, -3.0], selection="logprob") == 0
+    # without logprobs (or with a missing one) it falls back to voting
+    assert select_sample(chunks, selection="logprob") == 1
+    assert select_sample(chunks, logprobs=[-0.5, None, -3.0], selection="logprob") == 1
@@ -0,0 +1,42 @@
+import gc
+
+import numpy as np
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("transformers")
+pytest.importorskip("torch")
+
+from mcabench.agents.vlm_client import ProcessorWrapper
+
+
+def frame(value):
+    return np.full((8, 8, 3), value, dtype=np.uint8)
+
+
+def test_file_transport_keeps_history_and_cleans_up(tmp_path):
+    wrapper = ProcessorWrapper(image_transport="file", transport_dir=str(tmp_path), history_num=3)
+    assert wrapper.transport_keep == 5
+    messages = [wrapper.encode_image_message(frame(i)) for i in range(10)]
+    directory = wrapper.transport_dir
+    assert directory.parent == tmp_path
+    assert len(list(directory.iterdir())) == 5
+    for message in messages[-5:]:
+        assert (directory / message["image_url"]["url"].split("/")[-1]).exists()
+
+    wrapper.release_files()
+    assert list(directory.iterdir()) == []
+    wrapper.close()
+    assert not directory.exists()
+
+    # close之后仍可继续使用
+    wrapper.encode_image_message(frame(0))
+    assert directory.exists()
+    del wrapper
+    gc.collect()
+    assert not directory.exists()
+
+
+def test_transport_keep_smaller_than_history_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ProcessorWrapper(image_transport="file", transport_dir=str(tmp_path), history_num=4, transport_keep=4)